@@ -0,0 +1,280 @@
+import argparse
+import inspect
+import logging
+from functools import wraps
+import numpy as np
+import pandas as pd
+from cube import MEASURES, SHARE_ATTRIBUTES, YEAR_COLUMN, listing_measures
+from datahandler import COLS_BOOLEAN, DataHandler
+from history import ListingsHistory
+
+# The dispositions the notebook's charts are limited to
+DISPOSITIONS = ('1+1', '1+kk', '2+1', '2+kk', '3+1', '3+kk', '4+1', '4+kk')
+
+# Prague is charted apart from the rest of the country
+AREA_COLUMN = 'OBLAST'
+PRAGUE = 'Praha'
+OUTSIDE_PRAGUE = 'Mimo Prahu'
+
+# The dimensions of the shared aggregate, every report is summed from its cells
+ANALYTICS_KEYS = ['TYP NABÍDKY', 'LOKACE', 'DISPOZICE', YEAR_COLUMN, 'STAV']
+
+# Shares can be computed of the dimensions and of the attributes counted per value
+SHARE_CATEGORIES = ['LOKACE', 'DISPOZICE', 'STAV', AREA_COLUMN, *SHARE_ATTRIBUTES]
+
+
+def _memoized(method):
+    # Reports are cached per instance and arguments, defaults included and lists keyed as tuples, copies are returned
+    signature = inspect.signature(method)
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        arguments = signature.bind(self, *args, **kwargs)
+        arguments.apply_defaults()
+        key = (method.__name__, *(_hashable(value) for name, value in arguments.arguments.items() if name != 'self'))
+        if key not in self._reports:
+            self._reports[key] = method(self, *args, **kwargs)
+        return self._reports[key].copy()
+    return wrapper
+
+
+def _hashable(value):
+    return tuple(value) if isinstance(value, list) else value
+
+
+class ListingsAnalytics:
+    """
+    The notebook's yearly charts as functions of one shared aggregate. The cleaned listings are summed once over
+    ANALYTICS_KEYS, with the cube's measures, the counts of the boolean features and the counts of every value of the
+    share attributes, and each report only slices and re-sums those cells instead of copying, re-parsing and grouping
+    all listings again. Reports are cached, so charting one again costs nothing.
+    """
+
+    def __init__(self, listings, year=None):
+        """
+        Args:
+            listings (pd.DataFrame): Cleaned listings, see CLEANED_SCHEMA.
+            year (int or array-like): The year the listings were scraped in, one for all or one per listing. None
+                takes it from the listings' 'ROK' column, as loaded from the history.
+        """
+        if year is None:
+            year = listings[YEAR_COLUMN].to_numpy()
+        self.cells, self.share_columns = self._aggregate(listings, year)
+        self._reports = {}
+
+    @classmethod
+    def from_raw(cls, df, year):
+        """
+        Args:
+            df (pd.DataFrame): Raw listings as scraped.
+            year (int or array-like): The year the listings were scraped in.
+
+        Returns:
+            ListingsAnalytics: The analytics of the cleaned listings.
+        """
+        cleaned = DataHandler(df).clean_data(verbose=False)
+        if not np.isscalar(year):
+            year = pd.Series(year, index=df.index).loc[cleaned.index].to_numpy()
+        return cls(cleaned, year)
+
+    @staticmethod
+    def _aggregate(listings, year):
+        frame = {
+            'TYP NABÍDKY': listings['TYP NABÍDKY'].array,
+            'LOKACE': listings['LOKACE'].array,
+            'DISPOZICE': listings['DISPOZICE'].array,
+            YEAR_COLUMN: np.broadcast_to(np.asarray(year, dtype=np.int64), len(listings)),
+            'STAV': listings['STAV'].array,
+            **listing_measures(listings),
+            **{col: listings[col].to_numpy(dtype=np.int64) for col in COLS_BOOLEAN},
+        }
+
+        # Every value of a share attribute becomes a count column, so its shares are sums of the same cells
+        share_columns = {}
+        for attribute in SHARE_ATTRIBUTES:
+            codes = pd.Categorical(listings[attribute])
+            share_columns[attribute] = {}
+            for code, value in enumerate(codes.categories):
+                column = f'{attribute}: {value}'
+                frame[column] = (codes.codes == code).astype(np.int64)
+                share_columns[attribute][column] = value
+
+        cells = pd.DataFrame(frame).groupby(ANALYTICS_KEYS, sort=False, observed=True, as_index=False).sum()
+        cells = cells.astype({key: str for key in ANALYTICS_KEYS if key != YEAR_COLUMN})
+        cells[AREA_COLUMN] = np.where(cells['LOKACE'] == PRAGUE, PRAGUE, OUTSIDE_PRAGUE)
+        logging.info(f"Aggregated {len(listings)} listings into {len(cells)} cells.")
+        return cells, share_columns
+
+    def years(self):
+        """
+        Returns:
+            list: The years of the listings, ascending.
+        """
+        return sorted(self.cells[YEAR_COLUMN].unique())
+
+    def _select(self, offer_type, dispositions=None, area=None, new_buildings=False):
+        cells = self.cells[self.cells['TYP NABÍDKY'] == offer_type]
+        if dispositions:
+            cells = cells[cells['DISPOZICE'].isin(dispositions)]
+        if area is not None:
+            cells = cells[cells[AREA_COLUMN] == area]
+        if new_buildings:
+            cells = cells[cells['STAV'] == 'Novostavba']
+        return cells
+
+    @_memoized
+    def mean(self, offer_type, measure='Cena', by='DISPOZICE', dispositions=DISPOSITIONS, area=None):
+        """
+        The mean of a measure per group and year, like the notebook's Dispozice × Data z roku charts.
+
+        Args:
+            offer_type (str): 'PRODEJ' or 'PRONÁJEM'.
+            measure (str): One of MEASURES.
+            by (str or list): The dimensions to group by besides the year, such as 'DISPOZICE', 'LOKACE' or 'OBLAST'.
+            dispositions (list): The dispositions to include, all if empty.
+            area (str): PRAGUE or OUTSIDE_PRAGUE to include only that area, None for the whole country.
+
+        Returns:
+            pd.DataFrame: The groups, 'ROK', the mean as the measure name and the number of listings as 'count'.
+        """
+        keys = [*([by] if isinstance(by, str) else by), YEAR_COLUMN]
+        total, count = MEASURES[measure]
+        sums = self._select(offer_type, dispositions, area).groupby(keys, as_index=False)[[total, count]].sum()
+        sums = sums[sums[count] > 0]
+        return pd.DataFrame({**{key: sums[key] for key in keys},
+                             measure: sums[total] / sums[count],
+                             'count': sums[count]}).reset_index(drop=True)
+
+    def price_per_m2(self, offer_type, by='DISPOZICE', dispositions=DISPOSITIONS, area=None):
+        """
+        The mean price per m² per group and year, see mean().
+
+        Returns:
+            pd.DataFrame: The groups, 'ROK', 'Cena za m²' and the number of listings with an area as 'count'.
+        """
+        return self.mean(offer_type, 'Cena za m²', by, dispositions, area)
+
+    @_memoized
+    def year_over_year(self, offer_type, measure='Cena', by='DISPOZICE', dispositions=DISPOSITIONS, area=None):
+        """
+        The change of a group's mean from its previous year, see mean().
+
+        Returns:
+            pd.DataFrame: The means with the relative change as 'change', NaN in a group's first year.
+        """
+        means = self.mean(offer_type, measure, by, dispositions, area)
+        groups = [key for key in means.columns if key not in (YEAR_COLUMN, measure, 'count')]
+        means = means.sort_values([*groups, YEAR_COLUMN], ignore_index=True)
+        means['change'] = means.groupby(groups)[measure].pct_change()
+        return means
+
+    @_memoized
+    def category_share(self, offer_type, category, new_buildings=False, dispositions=None, area=None):
+        """
+        The shares of a category's values among the listings of each year, like the notebook's Novostavba charts.
+
+        Args:
+            offer_type (str): 'PRODEJ' or 'PRONÁJEM'.
+            category (str): One of SHARE_CATEGORIES.
+            new_buildings (bool): Whether to include only new buildings ('Novostavba').
+            dispositions (list): The dispositions to include, all if empty.
+            area (str): PRAGUE or OUTSIDE_PRAGUE to include only that area, None for the whole country.
+
+        Returns:
+            pd.DataFrame: The value as 'HODNOTA', 'ROK', the number of listings as 'count' and its share of the year
+            as 'share'.
+        """
+        cells = self._select(offer_type, dispositions, area, new_buildings)
+        if category in self.share_columns:
+            # The attribute's values are count columns, summed per year and turned into rows
+            columns = self.share_columns[category]
+            counts = cells.groupby(YEAR_COLUMN)[list(columns)].sum().rename(columns=columns)
+            counts = counts.melt(ignore_index=False, var_name='HODNOTA', value_name='count').reset_index()
+            counts = counts[counts['count'] > 0]
+        else:
+            counts = cells.groupby([category, YEAR_COLUMN], as_index=False)['count'].sum()
+            counts = counts.rename(columns={category: 'HODNOTA'})
+
+        counts = counts[['HODNOTA', YEAR_COLUMN, 'count']].reset_index(drop=True)
+        counts['share'] = counts['count'] / counts.groupby(YEAR_COLUMN)['count'].transform('sum')
+        return counts
+
+    @_memoized
+    def feature_shares(self, offer_type, dispositions=None, area=None):
+        """
+        The shares of listings with each boolean feature, such as a balcony or a lift, per year.
+
+        Args:
+            offer_type (str): 'PRODEJ' or 'PRONÁJEM'.
+            dispositions (list): The dispositions to include, all if empty.
+            area (str): PRAGUE or OUTSIDE_PRAGUE to include only that area, None for the whole country.
+
+        Returns:
+            pd.DataFrame: The feature as 'VLASTNOST', 'ROK', the number of listings with it as 'count' and their
+            share of the year as 'share'.
+        """
+        sums = self._select(offer_type, dispositions, area).groupby(YEAR_COLUMN)[[*COLS_BOOLEAN, 'count']].sum()
+        shares = sums[COLS_BOOLEAN].div(sums['count'], axis=0)
+        counts = sums[COLS_BOOLEAN].melt(ignore_index=False, var_name='VLASTNOST', value_name='count')
+        counts['share'] = shares.melt(ignore_index=False)['value']
+        return counts.reset_index()[['VLASTNOST', YEAR_COLUMN, 'count', 'share']]
+
+    def report(self, offer_types=('PRONÁJEM', 'PRODEJ')):
+        """
+        All of the notebook's yearly charts, for every offer type.
+
+        Args:
+            offer_types (list): The offer types to report.
+
+        Returns:
+            dict: The report frames by name, such as 'PRONÁJEM cena podle dispozice, Praha'.
+        """
+        reports = {}
+        for offer_type in offer_types:
+            for measure in MEASURES:
+                reports[f'{offer_type} {measure.lower()} podle dispozice'] = self.mean(offer_type, measure)
+            for area in (PRAGUE, OUTSIDE_PRAGUE):
+                reports[f'{offer_type} cena podle dispozice, {area}'] = self.mean(offer_type, area=area)
+                reports[f'{offer_type} cena za m² podle dispozice, {area}'] = self.price_per_m2(offer_type, area=area)
+            reports[f'{offer_type} cena podle kraje'] = self.mean(offer_type, by='LOKACE')
+            reports[f'{offer_type} meziroční změna ceny'] = self.year_over_year(offer_type)
+            reports[f'{offer_type} meziroční změna ceny za m², Praha a zbytek'] = self.year_over_year(
+                offer_type, 'Cena za m²', [AREA_COLUMN, 'DISPOZICE'])
+            for category in ['LOKACE', *SHARE_ATTRIBUTES]:
+                reports[f'{offer_type} novostavby podle {category}'] = self.category_share(offer_type, category, True)
+            reports[f'{offer_type} vlastnosti'] = self.feature_shares(offer_type)
+        return reports
+
+
+def write_report(reports, output_file):
+    """
+    Writes every report to its own sheet of an Excel file, pivoted with the years as columns like the charts.
+
+    Args:
+        reports (dict): The report frames by name, see ListingsAnalytics.report.
+        output_file (str): The Excel file to write.
+    """
+    with pd.ExcelWriter(output_file) as writer:
+        for number, (name, report) in enumerate(reports.items()):
+            # The charted value is the change or the share if the report has one, otherwise the mean before 'count'
+            value = next((col for col in ('change', 'share') if col in report.columns),
+                         report.columns[report.columns.get_loc('count') - 1])
+            # The rows are the keys of the report, the columns before the year
+            groups = list(report.columns[:report.columns.get_loc(YEAR_COLUMN)])
+            pivot = report.pivot_table(index=groups, columns=YEAR_COLUMN, values=value)
+
+            # Excel limits sheet names to 31 characters, so sheets are numbered and the full name heads the sheet
+            pd.DataFrame({name: []}).to_excel(writer, sheet_name=f'{number + 1}', index=False)
+            pivot.to_excel(writer, sheet_name=f'{number + 1}', startrow=2)
+    logging.info(f"Wrote {len(reports)} reports to {output_file}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Report the notebook's yearly charts of the listings history.")
+    parser.add_argument('history_dir', help="a listings history written by history.py")
+    parser.add_argument('output_file', help="the Excel file to write the reports to")
+    parser.add_argument('--years', nargs='+', type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    write_report(ListingsAnalytics(ListingsHistory(args.history_dir).load(args.years)).report(), args.output_file)
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import os
+import pandas as pd
+from datahandler import CLEANING_VERSION, CLEANED_SCHEMA
+from ingest import DEFAULT_BLOCK_SIZE, read_listings_chunks, clean_chunks, concat_cleaned
+
+HASH_BLOCK_SIZE = 2**20
+
+
+def file_hash(file_name, size):
+    """
+    Hashes the first bytes of a file.
+
+    Args:
+        file_name (str): The name of the file.
+        size (int): The number of bytes to hash.
+
+    Returns:
+        hashlib._Hash: The SHA-256 hash object, so hashing can continue with the rest of the file.
+    """
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as source_file:
+        remaining = size
+        while remaining:
+            block = source_file.read(min(HASH_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest
+
+
+class CleanedListingsCache:
+    """
+    The cleaned listings stored as Parquet, keyed by a fingerprint of the raw CSV and the cleaning version.
+    Rows appended to the CSV are cleaned on their own and merged into the cached listings.
+    """
+
+    def __init__(self, path, block_size=DEFAULT_BLOCK_SIZE):
+        """
+        Args:
+            path (str): The path to the Parquet file, its fingerprint is stored next to it as JSON.
+            block_size (int): The number of bytes parsed per chunk when cleaning.
+        """
+        self.path = path
+        self.meta_path = path + '.json'
+        self.block_size = block_size
+
+    def load(self, file_name):
+        """
+        Returns the cleaned listings of a CSV file, cleaning only what the cache does not cover yet.
+
+        Args:
+            file_name (str): The name of the raw listings CSV file.
+
+        Returns:
+            pd.DataFrame: The cleaned listings, only the most recently scraped version of each URL is kept.
+        """
+        cleaned, _, _ = self.load_changes(file_name)
+        return cleaned
+
+    def load_changes(self, file_name):
+        """
+        Like load, but also returns how the cleaned listings changed since the cache was last written, so aggregates
+        built from the cached listings can be updated instead of rebuilt.
+
+        Args:
+            file_name (str): The name of the raw listings CSV file.
+
+        Returns:
+            tuple: The cleaned listings, the listings added and the previously cached listings removed. Added and
+            removed are empty when nothing changed and both None when the cache was rebuilt from scratch.
+        """
+        stat = os.stat(file_name)
+        meta = self._load_meta()
+
+        if meta is None:
+            cleaned = self._rebuild(file_name, stat)
+            appended = removed = None
+        elif meta['size'] == stat.st_size and meta['mtime_ns'] == stat.st_mtime_ns:
+            # Nothing has changed since the cache was written, the URLs are only needed for merging appended rows
+            logging.info(f"Loaded cleaned listings from {self.path}.")
+            cleaned = pd.read_parquet(self.path, columns=list(CLEANED_SCHEMA))
+            return cleaned, cleaned.iloc[:0], cleaned.iloc[:0]
+        else:
+            digest = file_hash(file_name, meta['size'])
+            if stat.st_size > meta['size'] and digest.hexdigest() == meta['hash'] and self._ends_row(file_name, meta):
+                cleaned, appended, removed = self._append(file_name, stat, meta, digest)
+                appended, removed = appended.drop(columns='URL'), removed.drop(columns='URL')
+            else:
+                cleaned = self._rebuild(file_name, stat)
+                appended = removed = None
+
+        return cleaned.drop(columns='URL'), appended, removed
+
+    def _load_meta(self):
+        # A cache written by other cleaning code or left incomplete is not used
+        if not os.path.isfile(self.meta_path) or not os.path.isfile(self.path):
+            return None
+
+        with open(self.meta_path, encoding='utf-8') as meta_file:
+            meta = json.load(meta_file)
+        if meta.get('cleaning_version') != CLEANING_VERSION:
+            return None
+        return meta
+
+    @staticmethod
+    def _ends_row(file_name, meta):
+        # Appending is only possible when the cached part ended with a complete row
+        with open(file_name, 'rb') as source_file:
+            source_file.seek(meta['size'] - 1)
+            return source_file.read(1) == b'\n'
+
+    def _rebuild(self, file_name, stat):
+        logging.info(f"Cleaning {file_name} into {self.path}.")
+        cleaned, _, rows = clean_chunks(read_listings_chunks(file_name, self.block_size))
+        self._save(cleaned, stat, file_hash(file_name, stat.st_size), rows)
+        return cleaned
+
+    def _append(self, file_name, stat, meta, digest):
+        logging.info(f"Cleaning {stat.st_size - meta['size']} appended bytes of {file_name}.")
+        chunks = read_listings_chunks(file_name, self.block_size, start_byte=meta['size'], first_row=meta['rows'])
+        appended, appended_urls, rows = clean_chunks(chunks, first_row=meta['rows'])
+
+        # Listings scraped again replace their cached versions, even when the new version is dropped by the cleaning
+        cached = pd.read_parquet(self.path)
+        replaced = cached['URL'].isin(appended_urls)
+        cleaned = concat_cleaned([cached[~replaced], appended])
+
+        # Continue the hash of the cached part with the appended bytes
+        with open(file_name, 'rb') as source_file:
+            source_file.seek(meta['size'])
+            for block in iter(lambda: source_file.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+
+        self._save(cleaned, stat, digest, rows)
+        return cleaned, appended, cached[replaced]
+
+    def _save(self, cleaned, stat, digest, rows):
+        # Write the data before its fingerprint, after a crash in between the old fingerprint only makes the next load
+        # clean the appended rows again
+        temp_path = self.path + '.tmp'
+        cleaned.to_parquet(temp_path, engine='pyarrow', index=True)
+        os.replace(temp_path, self.path)
+
+        meta = {'cleaning_version': CLEANING_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                'hash': digest.hexdigest(), 'rows': rows}
+        temp_path = self.meta_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(temp_path, self.meta_path)
@@ -0,0 +1,79 @@
+import json
+import logging
+import os
+
+
+class CrawlCheckpoint:
+    """
+    The pagination cursor of a crawl, persisted so that an interrupted crawl can be resumed.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): The path to the JSON checkpoint file.
+        """
+        self.path = path
+        self.page_url = None
+        self.page_counter = 1
+        self.processed = set()
+
+    def load(self):
+        """
+        Loads the checkpoint file if a previous crawl left one behind.
+
+        Returns:
+            bool: True if a checkpoint was loaded and the crawl should be resumed.
+        """
+        if not os.path.isfile(self.path):
+            return False
+
+        with open(self.path, encoding='utf-8') as checkpoint_file:
+            state = json.load(checkpoint_file)
+
+        self.page_url = state['page_url']
+        self.page_counter = state['page_counter']
+        self.processed = set(state['processed'])
+        logging.info(f"Resuming crawl from page {self.page_counter} ({self.page_url}), "
+                     f"{len(self.processed)} listings on it already processed.")
+        return True
+
+    def start_page(self, page_url, page_counter):
+        """
+        Moves the cursor to a new results page.
+
+        Args:
+            page_url (str): The URL of the results page.
+            page_counter (int): The number of the results page.
+        """
+        self.page_url = page_url
+        self.page_counter = page_counter
+        self.processed = set()
+        self.save()
+
+    def mark_processed(self, urls):
+        """
+        Records that listings on the current page have been written out.
+
+        Args:
+            urls (list): The URLs of the listings.
+        """
+        self.processed.update(urls)
+        self.save()
+
+    def save(self):
+        """
+        Writes the checkpoint atomically, so a crash never leaves a half-written file.
+        """
+        state = {'page_url': self.page_url, 'page_counter': self.page_counter, 'processed': sorted(self.processed)}
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as checkpoint_file:
+            json.dump(state, checkpoint_file, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+    def clear(self):
+        """
+        Removes the checkpoint after the crawl has finished.
+        """
+        if os.path.isfile(self.path):
+            os.remove(self.path)
@@ -0,0 +1,404 @@
+import argparse
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import KDTree
+from datahandler import COLS_DISTANCE
+
+# Listings are only compared with listings of the same offer type, region and disposition
+PARTITION_KEYS = ['TYP NABÍDKY', 'LOKACE', 'DISPOZICE']
+
+# The compared features and their weights, the area counts double so flats of a similar size rank first
+FEATURE_WEIGHTS = {'PLOCHA': 2.0, **{col: 1.0 for col in COLS_DISTANCE}}
+FEATURES = list(FEATURE_WEIGHTS)
+
+# Columns of the comparables returned with every match
+RESULT_COLUMNS = ['CENA', 'PLOCHA']
+
+# A partition's tree is rebuilt once the listings added or removed since the last build pass this share of it
+REBUILD_FRACTION = 0.25
+MIN_REBUILD_SIZE = 32
+
+LEAF_SIZE = 16
+DEFAULT_PORT = 8070
+
+
+class FeatureScaler:
+    """
+    Puts the FEATURES on one scale: log-transformed, since areas and distances are skewed and a difference of 100 m
+    matters more between close amenities than between far ones, standardized and weighted by FEATURE_WEIGHTS.
+    Missing values are replaced with the median, so they neither attract nor repel matches.
+    """
+
+    def __init__(self, listings):
+        """
+        Args:
+            listings (pd.DataFrame): The listings to take the medians and spreads from.
+        """
+        logs = self._logs(listings)
+        self.fill = np.nan_to_num(np.nanmedian(logs, axis=0)) if len(logs) else np.zeros(len(FEATURES))
+        spread = np.nanstd(logs, axis=0) if len(logs) else np.ones(len(FEATURES))
+        self.scale = np.where(np.nan_to_num(spread) > 0, spread, 1.0)
+        self.weights = np.array([FEATURE_WEIGHTS[col] for col in FEATURES])
+
+    def transform(self, listings):
+        """
+        Args:
+            listings (pd.DataFrame): Listings with the FEATURES, missing columns count as missing values.
+
+        Returns:
+            np.ndarray: The points of the listings, one row per listing.
+        """
+        logs = self._logs(listings)
+        logs = np.where(np.isnan(logs), self.fill, logs)
+        return (logs - self.fill) / self.scale * self.weights
+
+    @staticmethod
+    def _logs(listings):
+        values = np.column_stack([listings[col].to_numpy(dtype=float, na_value=np.nan) if col in listings
+                                  else np.full(len(listings), np.nan) for col in FEATURES])
+        return np.log1p(np.clip(values, 0, None))
+
+
+class Partition:
+    """
+    The listings of one offer type, region and disposition: a KD-tree over the listings it was built with, the
+    listings added since, which are searched by brute force, and the built listings removed since, which are skipped.
+    """
+
+    def __init__(self, labels, points, values):
+        """
+        Args:
+            labels (np.ndarray): The index labels of the listings.
+            points (np.ndarray): Their scaled features.
+            values (np.ndarray): Their RESULT_COLUMNS.
+        """
+        self.labels, self.points, self.values = labels, points, values
+        self.tree = KDTree(points, leaf_size=LEAF_SIZE)
+        self.added_labels = labels[:0]
+        self.added_points = points[:0]
+        self.added_values = values[:0]
+        self.removed = set()
+
+    def __len__(self):
+        return len(self.labels) - len(self.removed) + len(self.added_labels)
+
+    def add(self, labels, points, values):
+        self.added_labels = np.concatenate([self.added_labels, labels])
+        self.added_points = np.concatenate([self.added_points, points])
+        self.added_values = np.concatenate([self.added_values, values])
+
+    def remove(self, labels):
+        added = np.isin(self.added_labels, labels)
+        self.added_labels = self.added_labels[~added]
+        self.added_points = self.added_points[~added]
+        self.added_values = self.added_values[~added]
+
+        # Only listings in the tree need to be skipped
+        self.removed.update(np.asarray(labels)[np.isin(labels, self.labels)].tolist())
+
+    def needs_rebuild(self):
+        changed = len(self.added_labels) + len(self.removed)
+        return changed > max(MIN_REBUILD_SIZE, REBUILD_FRACTION * len(self.labels))
+
+    def rebuilt(self):
+        """
+        Returns:
+            Partition: A partition with all current listings in its tree.
+        """
+        kept = ~np.isin(self.labels, list(self.removed))
+        return Partition(np.concatenate([self.labels[kept], self.added_labels]),
+                         np.concatenate([self.points[kept], self.added_points]),
+                         np.concatenate([self.values[kept], self.added_values]))
+
+    def query(self, points, k, exclude=None):
+        """
+        Args:
+            points (np.ndarray): The scaled features of the queries.
+            k (int): The number of comparables per query.
+            exclude (np.ndarray): A label per query that must not be returned for it, such as the query's own.
+
+        Returns:
+            tuple: The distances and the candidate positions, one row per query sorted by distance, where positions
+            past the built listings point into the added ones and missing matches have an infinite distance.
+        """
+        # Ask the tree for enough extra neighbours to make up for removed and excluded listings
+        extra = len(self.removed) + (exclude is not None)
+        distances, positions = self.tree.query(points, k=min(k + extra, len(self.labels)))
+
+        if len(self.added_labels):
+            added_distances = np.linalg.norm(points[:, None, :] - self.added_points[None, :, :], axis=2)
+            distances = np.hstack([distances, added_distances])
+            positions = np.hstack([positions, len(self.labels) + np.arange(len(self.added_labels))[None, :]
+                                   .repeat(len(points), axis=0)])
+
+        labels = np.concatenate([self.labels, self.added_labels])[positions]
+        skipped = np.zeros(labels.shape, dtype=bool)
+        if self.removed:
+            skipped |= np.isin(positions, np.flatnonzero(np.isin(self.labels, list(self.removed))))
+        if exclude is not None:
+            skipped |= labels == exclude[:, None]
+        distances = np.where(skipped, np.inf, distances)
+
+        order = np.argsort(distances, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(positions, order, axis=1)
+
+    def result_rows(self, positions):
+        return (np.concatenate([self.labels, self.added_labels])[positions],
+                np.concatenate([self.values, self.added_values])[positions])
+
+
+class ComparablesIndex:
+    """
+    Finds the most similar listings of a flat: same offer type, region and disposition, then the closest area and
+    distances to amenities. There is one KD-tree per partition, built when the listings load. Appended and removed
+    listings are applied in place and a partition's tree is rebuilt only once enough of it has changed.
+    """
+
+    def __init__(self, listings):
+        """
+        Args:
+            listings (pd.DataFrame): Cleaned listings, see CLEANED_SCHEMA, identified by their index labels.
+        """
+        self._lock = threading.Lock()
+        self._build(listings)
+
+    def __len__(self):
+        return len(self._partition_of)
+
+    def _build(self, listings):
+        listings = self._indexable(listings)
+        self.scaler = FeatureScaler(listings)
+        self.partitions = {}
+        self._partition_of = {}
+        for key, (labels, points, values) in self._split(listings):
+            self.partitions[key] = Partition(labels, points, values)
+            self._partition_of.update(dict.fromkeys(labels.tolist(), key))
+        logging.info(f"Indexed {len(self._partition_of)} listings in {len(self.partitions)} comparable partitions.")
+
+    def add(self, listings):
+        """
+        Args:
+            listings (pd.DataFrame): Cleaned listings to add, a listing already in the index is replaced.
+        """
+        with self._lock:
+            listings = self._indexable(listings)
+            self._remove(listings.index)
+            for key, (labels, points, values) in self._split(listings):
+                if key in self.partitions:
+                    self.partitions[key].add(labels, points, values)
+                else:
+                    self.partitions[key] = Partition(labels, points, values)
+                self._partition_of.update(dict.fromkeys(labels.tolist(), key))
+                self._maybe_rebuild(key)
+
+    def remove(self, listings):
+        """
+        Args:
+            listings (pd.DataFrame or pd.Index): Previously added listings, or their index labels, to remove.
+        """
+        with self._lock:
+            self._remove(listings.index if isinstance(listings, pd.DataFrame) else listings)
+
+    def apply_changes(self, changes):
+        """
+        Updates the index with the result of CleanedListingsCache.load_changes.
+
+        Args:
+            changes (tuple): The cleaned listings, the added and the removed listings.
+        """
+        cleaned, appended, removed = changes
+        if appended is None:
+            # The cache was rebuilt, so the previously added listings are unknown
+            with self._lock:
+                self._build(cleaned)
+            return
+
+        if len(removed):
+            self.remove(removed)
+        if len(appended):
+            self.add(appended)
+
+    def query(self, listings, k=5, exclude_self=False):
+        """
+        Finds the k most similar listings of each query listing in one vectorized pass per partition.
+
+        Args:
+            listings (pd.DataFrame or list): The query listings as a DataFrame or a list of dictionaries, with the
+                PARTITION_KEYS and any of the FEATURES.
+            k (int): The number of comparables per listing.
+            exclude_self (bool): Whether a query listing that is in the index is left out of its own comparables,
+                matched by its index label.
+
+        Returns:
+            pd.DataFrame: One row per comparable with the 'query' position, its 'rank', the 'listing' index label, the
+            'distance' and the RESULT_COLUMNS, ordered by query and rank. Queries without a partition get no rows.
+        """
+        if not isinstance(listings, pd.DataFrame):
+            listings = pd.DataFrame.from_records(listings)
+
+        # Group the queries by partition with plain tuples, a groupby costs more than the search for a few queries
+        groups = {}
+        keys = zip(*[listings[col].to_numpy(dtype=object) if col in listings else np.full(len(listings), None)
+                     for col in PARTITION_KEYS])
+        for row, key in enumerate(keys):
+            groups.setdefault(key, []).append(row)
+
+        results = []
+        with self._lock:
+            points = self.scaler.transform(listings)
+            for key, rows in groups.items():
+                # Queries with a missing or unknown key have no partition
+                partition = self.partitions.get(key)
+                if partition is None:
+                    continue
+
+                rows = np.asarray(rows)
+                exclude = listings.index.to_numpy()[rows] if exclude_self else None
+                distances, positions = partition.query(points[rows], k, exclude)
+                found = np.isfinite(distances)
+                labels, values = partition.result_rows(positions[found])
+                results.append((np.repeat(rows, found.sum(axis=1)), np.nonzero(found)[1] + 1, labels,
+                                distances[found], values))
+
+        if not results:
+            return pd.DataFrame(columns=['query', 'rank', 'listing', 'distance'] + RESULT_COLUMNS)
+
+        queries, ranks, labels, distances, values = (np.concatenate(arrays) for arrays in zip(*results))
+        order = np.lexsort((ranks, queries))
+        return pd.DataFrame({
+            'query': queries[order],
+            'rank': ranks[order],
+            'listing': labels[order],
+            'distance': distances[order],
+            **{col: values[order, position] for position, col in enumerate(RESULT_COLUMNS)},
+        })
+
+    def _indexable(self, listings):
+        # Listings without a partition key cannot be compared
+        return listings[listings[PARTITION_KEYS].notna().all(axis=1)]
+
+    def _split(self, listings):
+        points = self.scaler.transform(listings)
+        values = np.column_stack([listings[col].to_numpy(dtype=float, na_value=np.nan) for col in RESULT_COLUMNS])
+        labels = listings.index.to_numpy()
+        for key, rows in listings.groupby(PARTITION_KEYS, sort=False, observed=True).indices.items():
+            yield key, (labels[rows], points[rows], values[rows])
+
+    def _remove(self, labels):
+        by_partition = {}
+        for label in labels.tolist():
+            key = self._partition_of.pop(label, None)
+            if key is not None:
+                by_partition.setdefault(key, []).append(label)
+
+        for key, partition_labels in by_partition.items():
+            self.partitions[key].remove(partition_labels)
+            self._maybe_rebuild(key)
+
+    def _maybe_rebuild(self, key):
+        partition = self.partitions[key]
+        if not len(partition):
+            del self.partitions[key]
+        elif partition.needs_rebuild():
+            self.partitions[key] = partition.rebuilt()
+
+
+class ComparablesHandler(BaseHTTPRequestHandler):
+    """
+    Serves POST /comparables with a JSON list of listings, or an object with a 'listings' list and optionally 'k',
+    and answers with {"comparables": [[...], ...]}, the comparables of each listing as objects.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    # Headers and body are written separately, with Nagle's algorithm every response would wait for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        if self.path != '/comparables':
+            self._send(404, {'error': 'Not found'})
+            return
+
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            listings = body['listings'] if isinstance(body, dict) else body
+            k = int(body.get('k', 5)) if isinstance(body, dict) else 5
+            matches = self.server.index.query(listings, k=k)
+        except KeyError as e:
+            self._send(400, {'error': f"Missing field {e}"})
+            return
+        except (ValueError, TypeError) as e:
+            self._send(400, {'error': str(e)})
+            return
+
+        comparables = [[] for _ in listings]
+        for match in matches.itertuples(index=False):
+            # Missing areas are sent as nulls
+            comparables[match.query].append({'listing': int(match.listing), 'distance': float(match.distance),
+                                             **{col: None if np.isnan(getattr(match, col)) else getattr(match, col)
+                                                for col in RESULT_COLUMNS}})
+        self._send(200, {'comparables': comparables})
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+
+def create_comparables_server(index, host='127.0.0.1', port=DEFAULT_PORT):
+    """
+    Creates the comparables HTTP server around an index.
+
+    Args:
+        index (ComparablesIndex): The index, shared by all requests and updated in place.
+        host (str): The interface to listen on.
+        port (int): The port to listen on, 0 picks a free one.
+
+    Returns:
+        ThreadingHTTPServer: The server, not yet serving.
+    """
+    server = ThreadingHTTPServer((host, port), ComparablesHandler)
+    server.daemon_threads = True
+    server.index = index
+    return server
+
+
+def start_comparables_server(index, host='127.0.0.1', port=DEFAULT_PORT):
+    """
+    Serves comparables from a background thread.
+
+    Args:
+        index (ComparablesIndex): The index.
+        host (str): The interface to listen on.
+        port (int): The port to listen on, 0 picks a free one.
+
+    Returns:
+        ThreadingHTTPServer: The running server, stop it with shutdown().
+    """
+    server = create_comparables_server(index, host, port)
+    threading.Thread(target=server.serve_forever, name='comparables-server', daemon=True).start()
+    logging.info(f"Serving comparables on http://{host}:{server.server_address[1]}/comparables")
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the comparables of listings from a scraped listings CSV.")
+    parser.add_argument('csv_file')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from ingest import load_listings
+
+    create_comparables_server(ComparablesIndex(load_listings(args.csv_file)), args.host, args.port).serve_forever()
@@ -0,0 +1,481 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import product
+from urllib.parse import urljoin
+from lxml import html as lxml_html
+from httpengine import HttpEngine
+from metrics import CrawlMetrics
+from webscraper import WebScraper, LISTING_CARD_XPATH
+
+BASE_URL = 'https://www.bezrealitky.cz'
+
+# The path segments of the results pages, e.g. /vypis/nabidka-pronajem/byt/praha
+OFFER_TYPE_SLUGS = {'PRONÁJEM': 'nabidka-pronajem', 'PRODEJ': 'nabidka-prodej'}
+PROPERTY_TYPE_SLUGS = {
+    'BYT': 'byt',
+    'DŮM': 'dum',
+    'POZEMEK': 'pozemek',
+    'GARÁŽ': 'garaz',
+    'KANCELÁŘ': 'kancelar',
+    'NEBYTOVÝ PROSTOR': 'nebytovy-prostor',
+    'REKREAČNÍ OBJEKT': 'rekreacni-objekt',
+}
+REGION_SLUGS = {
+    'Praha': 'praha',
+    'Středočeský kraj': 'stredocesky-kraj',
+    'Jihočeský kraj': 'jihocesky-kraj',
+    'Plzeňský kraj': 'plzensky-kraj',
+    'Karlovarský kraj': 'karlovarsky-kraj',
+    'Ústecký kraj': 'ustecky-kraj',
+    'Liberecký kraj': 'liberecky-kraj',
+    'Královéhradecký kraj': 'kralovehradecky-kraj',
+    'Pardubický kraj': 'pardubicky-kraj',
+    'kraj Vysočina': 'kraj-vysocina',
+    'Jihomoravský kraj': 'jihomoravsky-kraj',
+    'Olomoucký kraj': 'olomoucky-kraj',
+    'Zlínský kraj': 'zlinsky-kraj',
+    'Moravskoslezský kraj': 'moravskoslezsky-kraj',
+}
+
+# Results pages are numbered with a query parameter, the numbered pagination links give the number of pages
+PAGE_PARAMETER = 'page'
+PAGE_LINK_XPATH = "//li[@class='page-item']/a[@class='page-link']"
+
+# The listings of a results page are extracted in batches of this size, so one page is spread over the workers
+LISTING_BATCH_SIZE = 5
+
+# Workers are started fresh instead of forked, crawls run next to the servers' threads and a forked child could
+# inherit a lock one of them held, such as logging's
+WORKER_START_METHOD = 'spawn'
+
+
+class Segment:
+    """
+    One slice of the listings: an offer type, optionally narrowed to a property type and a region, whose results
+    pages are addressed directly by their page number.
+    """
+
+    def __init__(self, offer_type, property_type=None, region=None):
+        """
+        Args:
+            offer_type (str): One of OFFER_TYPE_SLUGS.
+            property_type (str): One of PROPERTY_TYPE_SLUGS, None for all property types.
+            region (str): One of REGION_SLUGS, None for the whole country.
+        """
+        if offer_type not in OFFER_TYPE_SLUGS:
+            raise ValueError(f"Unknown offer type '{offer_type}'.")
+        if property_type is not None and property_type not in PROPERTY_TYPE_SLUGS:
+            raise ValueError(f"Unknown property type '{property_type}'.")
+        if region is not None and region not in REGION_SLUGS:
+            raise ValueError(f"Unknown region '{region}'.")
+        self.offer_type = offer_type
+        self.property_type = property_type
+        self.region = region
+
+    @property
+    def name(self):
+        return '/'.join(part for part in (self.offer_type, self.property_type, self.region) if part is not None)
+
+    def page_url(self, page, base_url=BASE_URL):
+        """
+        Args:
+            page (int): The number of the results page, from 1.
+            base_url (str): The origin of the site.
+
+        Returns:
+            str: The URL of the results page.
+        """
+        slugs = [OFFER_TYPE_SLUGS[self.offer_type]]
+        if self.property_type is not None:
+            slugs.append(PROPERTY_TYPE_SLUGS[self.property_type])
+        if self.region is not None:
+            slugs.append(REGION_SLUGS[self.region])
+
+        url = f"{base_url.rstrip('/')}/vypis/{'/'.join(slugs)}"
+        return url if page == 1 else f'{url}?{PAGE_PARAMETER}={page}'
+
+    def __repr__(self):
+        return f'Segment({self.name})'
+
+
+def plan_segments(offer_types=None, property_types=('BYT',), regions=None):
+    """
+    Args:
+        offer_types (list): The offer types, all by default.
+        property_types (list): The property types, flats by default, None for one segment over all property types.
+        regions (list): The regions, all by default.
+
+    Returns:
+        list: A Segment for every combination.
+    """
+    return [Segment(offer_type, property_type, region)
+            for offer_type, property_type, region in product(offer_types or list(OFFER_TYPE_SLUGS),
+                                                             property_types or [None],
+                                                             regions or list(REGION_SLUGS))]
+
+
+def parse_results_page(page_source, url):
+    """
+    Args:
+        page_source (str): The server-rendered HTML of a results page.
+        url (str): The URL of the page, relative links are resolved against it.
+
+    Returns:
+        tuple: The (URL, card text) of every listing card and the number of results pages, 1 without pagination.
+    """
+    tree = lxml_html.fromstring(page_source)
+    cards = []
+    for card in tree.xpath(LISTING_CARD_XPATH):
+        links = card.xpath('.//div[2]/h2//a/@href')
+        if links:
+            # The card text is normalized, its whitespace differs from the text the browser renders
+            cards.append((urljoin(url, links[0]), ' '.join(card.text_content().split())))
+
+    numbers = [int(text) for text in tree.xpath(f'{PAGE_LINK_XPATH}//text()') if text.strip().isdigit()]
+    return cards, max(numbers, default=1)
+
+
+# The HTTP engine of a worker process and the request pacing shared by all workers, set up by _init_worker
+_engine = None
+_min_request_interval = 0.0
+_request_lock = None
+_last_request = None
+
+
+def _init_worker(min_request_interval, fixture_dir, request_lock, last_request):
+    global _engine, _min_request_interval, _request_lock, _last_request
+    _engine = HttpEngine(fixture_dir=fixture_dir, metrics=CrawlMetrics())
+    _min_request_interval = min_request_interval
+    _request_lock = request_lock
+    _last_request = last_request
+
+
+def _pace():
+    # Space out the requests of all workers, so the site gets at most one request per interval like from the serial
+    # scraper's HostRateLimiter. The monotonic clock is system-wide, so the processes can share its timestamps.
+    if not _min_request_interval:
+        return
+    with _request_lock:
+        delay = _last_request.value + _min_request_interval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        _last_request.value = time.monotonic()
+
+
+def _metrics_delta():
+    # The metrics of one task, merged into the planner's metrics by the parent process
+    delta = (_engine.metrics.stages, dict(_engine.metrics.counters))
+    _engine.metrics.reset()
+    return delta
+
+
+def fetch_results_page(url):
+    """
+    Fetches and parses one results page in a worker process.
+
+    Args:
+        url (str): The URL of the results page.
+
+    Returns:
+        tuple: The listing cards, the number of results pages and the metrics of the task.
+    """
+    _pace()
+    page_source = _engine.fetch(url)
+    with _engine.metrics.stage('results_parse'):
+        cards, pages = parse_results_page(page_source, url)
+    _engine.metrics.count('pages')
+    return cards, pages, _metrics_delta()
+
+
+def extract_listing_batch(urls):
+    """
+    Extracts listing pages over HTTP in a worker process.
+
+    Args:
+        urls (list): The URLs of the listings.
+
+    Returns:
+        tuple: The extracted data of every URL, None where the HTTP engine failed, and the metrics of the task.
+    """
+    results = []
+    for url in urls:
+        _pace()
+        with _engine.metrics.stage('listing'):
+            data = _engine.extract_info(url)
+        if data is not None:
+            _engine.metrics.count('listings')
+        results.append(data)
+    return results, _metrics_delta()
+
+
+class CrawlPlanner:
+    """
+    Crawls many segments at once. The results pages of every segment are addressed by their page number instead of
+    following the 'next' link, and the results pages and listing batches are fanned out over worker processes that
+    extract over HTTP. The parent process merges what the workers return into one output, seen-listings index and
+    set of metrics, and keeps the progress of every segment so an interrupted crawl resumes with the missing pages.
+    """
+
+    def __init__(self, segments, workers=4, base_url=BASE_URL, max_pages=None, min_request_interval=0.5,
+                 index=None, stop_on_known_page=True, output_file=None, progress_file=None, write_batch_size=20,
+                 on_flush=None, output_lock=None, metrics=None, fallback_driver=None, driver_manager=None,
+                 fixture_dir=None):
+        """
+        Args:
+            segments (list): The segments to crawl, see plan_segments.
+            workers (int): The number of worker processes.
+            base_url (str): The origin of the site.
+            max_pages (int): The maximum number of results pages per segment, None for all.
+            min_request_interval (float): The minimum number of seconds between two requests, across all workers.
+            index (ListingIndex): The seen-listings index, unchanged listings are skipped.
+            stop_on_known_page (bool): Whether a segment stops at its first results page with only known listings.
+            output_file (str): The CSV file the listings are appended to, None to keep them in listings_data.
+            progress_file (str): The JSON file the progress of the segments is kept in, None to not resume.
+            write_batch_size (int): The number of listings written at once.
+            on_flush (callable): Called with the number of listings after each batch written to the output file.
+            output_lock (threading.Lock): Held while a batch is written to the output file.
+            metrics (CrawlMetrics): Where the timers and counters of the parent and the workers are merged.
+            fallback_driver (webdriver.Chrome): Extracts the listings the HTTP engine failed on, None to skip them.
+            driver_manager (DriverManager): Lends the fallback driver the first time the HTTP engine fails on a
+                listing, if no fallback_driver is given.
+            fixture_dir (str): If set, the workers read pages from saved fixtures instead of the network.
+        """
+        self.segments = {segment.name: segment for segment in segments}
+        self.workers = workers
+        self.base_url = base_url
+        self.max_pages = max_pages
+        self.min_request_interval = min_request_interval
+        self.progress_file = progress_file
+        self.fallback_driver = fallback_driver
+        self.driver_manager = driver_manager
+        self.fixture_dir = fixture_dir
+        self.progress = {}
+
+        # Writing, the index and the fallback extraction are the serial scraper's, only the fetching is planned here
+        self.scraper = WebScraper(fallback_driver, engine='selenium', index=index,
+                                  stop_on_known_page=stop_on_known_page, output_file=output_file,
+                                  write_batch_size=write_batch_size, on_flush=on_flush, output_lock=output_lock,
+                                  metrics=metrics)
+        self.metrics = self.scraper.metrics
+
+    @property
+    def listings_count(self):
+        return self.scraper.listings_count
+
+    @property
+    def listings_data(self):
+        return self.scraper.listings_data
+
+    def crawl(self):
+        """
+        Crawls all segments, resuming an interrupted crawl from the progress file.
+
+        Returns:
+            dict: The progress of every segment: its number of results pages (None if unknown), the pages done, the
+            listings written and whether it stopped early or failed.
+        """
+        self.metrics.reset()
+        self.metrics.emit('run_start', segments=list(self.segments), workers=self.workers)
+        resumed = self._load_progress()
+        if self.scraper.index is not None:
+            self.scraper.index.start_run()
+
+        # Start with the first page of every segment, the other pages are planned once it tells their number
+        self.queue = deque()
+        for name, state in self.progress.items():
+            if state['stopped'] or state['failed']:
+                continue
+            pages = range(1, state['pages'] + 1) if state['pages'] else [1]
+            self.queue.extend((name, page) for page in pages if page not in state['done'])
+
+        self.open_pages = {}
+        self.seen = set()
+        self.running = {}
+        try:
+            context = multiprocessing.get_context(WORKER_START_METHOD)
+            pacing = (context.Lock(), context.Value('d', 0.0, lock=False))
+            with ProcessPoolExecutor(self.workers, mp_context=context, initializer=_init_worker,
+                                     initargs=(self.min_request_interval, self.fixture_dir, *pacing)) as executor:
+                self.executor = executor
+                while self.queue or self.running:
+                    # Keep a results page per worker in flight, listing batches are submitted as their pages arrive
+                    while self.queue and self._pages_in_flight() < self.workers:
+                        name, page = self.queue.popleft()
+                        self._submit(fetch_results_page, ('page', name, page),
+                                     self.segments[name].page_url(page, self.base_url))
+
+                    done, _ = wait(list(self.running), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        task = self.running.pop(future)
+                        if future.cancelled():
+                            continue
+                        if task[0] == 'page':
+                            self._page_fetched(task[1], task[2], future)
+                        else:
+                            self._batch_extracted(task[1], task[2], task[3], future)
+        finally:
+            self.scraper.flush_pending()
+            self.metrics.report()
+            if self.fallback_driver is not None:
+                self.fallback_driver.quit()
+
+        # Only a crawl that saw every page of every segment can tell which listings have disappeared
+        complete = all(state['pages'] and len(state['done']) == state['pages'] and not state['stopped']
+                       and not state['failed'] and not state['truncated'] for state in self.progress.values())
+        if self.scraper.index is not None and complete and not resumed:
+            self.scraper.index.mark_removed()
+
+        for name, state in self.progress.items():
+            logging.info(f"{name}: {len(state['done'])} of {state['pages'] or '?'} pages, "
+                         f"{state['listings']} listings{', stopped early' if state['stopped'] else ''}"
+                         f"{', failed' if state['failed'] else ''}")
+        progress = self.progress
+        if self.progress_file is not None and os.path.isfile(self.progress_file):
+            os.remove(self.progress_file)
+        logging.info(f"Planned crawl completed. Collected {self.listings_count} listings "
+                     f"from {len(self.segments)} segments.")
+        return progress
+
+    def _submit(self, function, task, *args):
+        self.running[self.executor.submit(function, *args)] = task
+
+    def _pages_in_flight(self):
+        return sum(task[0] == 'page' for task in self.running.values())
+
+    def _page_fetched(self, name, page, future):
+        state = self.progress[name]
+        try:
+            cards, pages, (stages, counters) = future.result()
+        except Exception as e:
+            logging.error(f"Could not fetch page {page} of {name}: {e}")
+            self.metrics.count('pages_failed')
+            state['failed'] = True
+            return
+        self.metrics.merge(stages, counters)
+
+        # The first page tells how many pages the segment has, the rest are planned right away
+        if state['pages'] is None:
+            state['truncated'] = self.max_pages is not None and pages > self.max_pages
+            state['pages'] = min(pages, self.max_pages or pages)
+            self.queue.extend((name, other_page) for other_page in range(2, state['pages'] + 1))
+
+        with self.metrics.stage('index_lookup'):
+            changed_urls, card_hashes = self.scraper.select_changed_listings(cards)
+
+        # Listings are ordered from the newest, so a fully known page means the rest of the segment is known too
+        if self.scraper.index is not None and self.scraper.stop_on_known_page and cards and not changed_urls:
+            logging.info(f"Page {page} of {name} contains only known listings, stopping the segment.")
+            state['stopped'] = True
+            self._cancel_pages(name, page)
+
+        # A listing that moved to another page while the crawl ran is extracted only once
+        urls = [listing_url for listing_url in changed_urls if listing_url not in self.seen]
+        self.seen.update(urls)
+        self.metrics.emit('page', segment=name, page=page, cards=len(cards), changed=len(changed_urls),
+                          extracted=len(urls))
+
+        batches = [urls[start:start + LISTING_BATCH_SIZE] for start in range(0, len(urls), LISTING_BATCH_SIZE)]
+        self.open_pages[(name, page)] = [len(batches), card_hashes]
+        for batch in batches:
+            self._submit(extract_listing_batch, ('batch', name, page, batch), batch)
+        if not batches:
+            self._page_done(name, page)
+
+    def _cancel_pages(self, name, page):
+        self.queue = deque(task for task in self.queue if task[0] != name)
+        for future, task in list(self.running.items()):
+            if task[0] == 'page' and task[1] == name and task[2] > page and future.cancel():
+                del self.running[future]
+
+    def _batch_extracted(self, name, page, urls, future):
+        open_page = self.open_pages[(name, page)]
+        try:
+            results, (stages, counters) = future.result()
+            self.metrics.merge(stages, counters)
+        except Exception as e:
+            logging.error(f"Worker failed on listings of page {page} of {name}: {e}")
+            results = [None] * len(urls)
+
+        for listing_url, listing_data in zip(urls, results):
+            if listing_data is None and self._acquire_fallback_driver() is not None:
+                self.metrics.count('http_fallbacks')
+                listing_data = self.scraper.extract_info(listing_url)
+            elif listing_data is None:
+                self.metrics.count('listings_failed')
+            self.scraper.handle_listing(listing_url, listing_data, open_page[1][listing_url])
+            if listing_data is not None:
+                self.progress[name]['listings'] += 1
+
+        open_page[0] -= 1
+        if open_page[0] == 0:
+            self._page_done(name, page)
+
+    def _acquire_fallback_driver(self):
+        # The browser is only started once a listing fails over HTTP, a crawl that never needs it doesn't start one
+        if self.fallback_driver is None and self.driver_manager is not None:
+            try:
+                self.fallback_driver = self.driver_manager.acquire()
+                self.scraper.driver = self.fallback_driver
+            except Exception as e:
+                logging.error(f"Could not start the fallback driver, failed listings are skipped: {e}")
+                self.driver_manager = None
+        return self.fallback_driver
+
+    def _page_done(self, name, page):
+        # A page only counts as done once its listings are on disk
+        del self.open_pages[(name, page)]
+        self.scraper.flush_pending()
+        self.progress[name]['done'].append(page)
+        self.metrics.count('segment_pages')
+        self._save_progress()
+
+    def _load_progress(self):
+        self.progress = {name: {'pages': None, 'done': [], 'listings': 0, 'stopped': False, 'failed': False,
+                                'truncated': False}
+                         for name in self.segments}
+        if self.progress_file is None or not os.path.isfile(self.progress_file):
+            return False
+
+        with open(self.progress_file, encoding='utf-8') as progress_file:
+            saved = json.load(progress_file)
+
+        # Failed segments are tried again, segments that are no longer planned are dropped
+        for name, state in saved.items():
+            if name in self.progress:
+                self.progress[name].update(state, failed=False)
+        logging.info(f"Resuming a planned crawl, {sum(len(state['done']) for state in self.progress.values())} "
+                     f"pages already done.")
+        return True
+
+    def _save_progress(self):
+        if self.progress_file is None:
+            return
+
+        # Written through a temporary file, so a crash never leaves a half-written file
+        temp_path = self.progress_file + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as progress_file:
+            json.dump(self.progress, progress_file, ensure_ascii=False)
+        os.replace(temp_path, self.progress_file)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Crawl offer type, property type and region segments in parallel.")
+    parser.add_argument('output_file')
+    parser.add_argument('--offer-types', nargs='+', choices=list(OFFER_TYPE_SLUGS))
+    parser.add_argument('--property-types', nargs='+', choices=list(PROPERTY_TYPE_SLUGS), default=['BYT'])
+    parser.add_argument('--regions', nargs='+', choices=list(REGION_SLUGS))
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--max-pages', type=int)
+    parser.add_argument('--progress-file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    planner = CrawlPlanner(plan_segments(args.offer_types, args.property_types, args.regions), workers=args.workers,
+                           max_pages=args.max_pages, output_file=args.output_file, progress_file=args.progress_file)
+    planner.crawl()
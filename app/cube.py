@@ -0,0 +1,250 @@
+import threading
+import numpy as np
+import pandas as pd
+
+YEAR_COLUMN = 'ROK'
+
+# The dimensions of the listings cube, the dashboard charts slice and sum it along these
+CUBE_KEYS = ['TYP NABÍDKY', 'LOKACE', 'DISPOZICE', YEAR_COLUMN]
+
+# Attributes whose shares among new buildings ('Novostavba') are charted
+SHARE_ATTRIBUTES = ['VLASTNICTVÍ', 'TYP BUDOVY', 'VYBAVENO', 'PENB']
+SHARE_KEYS = ['TYP NABÍDKY', 'LOKACE', YEAR_COLUMN, 'ATRIBUT', 'HODNOTA']
+
+# The charted means, as the summed measure and the number of listings it was summed over
+MEASURES = {
+    'Cena': ('price_sum', 'count'),
+    'Cena za m²': ('price_per_m2_sum', 'area_count'),
+    'Plocha': ('area_sum', 'area_count'),
+    'Vratná kauce': ('deposit_sum', 'deposit_count'),
+    'Poplatky za služby': ('service_fees_sum', 'service_fees_count'),
+}
+
+
+def _nonzero_sum_and_count(values):
+    # The notebook leaves out zero fees and deposits, which mean the listing has none
+    values = np.asarray(values, dtype=float)
+    nonzero = values > 0
+    return np.where(nonzero, values, 0), nonzero.astype(np.int64)
+
+
+def listing_measures(listings):
+    """
+    The additive measures of every listing, whose sums per cell give the MEASURES means.
+
+    Args:
+        listings (pd.DataFrame): Cleaned listings, see CLEANED_SCHEMA.
+
+    Returns:
+        dict: The measure columns as arrays aligned with the listings.
+    """
+    price = listings['CENA'].to_numpy(dtype=float)
+    area = listings['PLOCHA'].to_numpy(dtype=float, na_value=np.nan)
+    has_area = area > 0
+    deposit_sum, deposit_count = _nonzero_sum_and_count(listings['VRATNÁ KAUCE'])
+    service_fees_sum, service_fees_count = _nonzero_sum_and_count(listings['POPLATKY ZA SLUŽBY'])
+    return {
+        'count': np.ones(len(listings), dtype=np.int64),
+        'price_sum': price,
+        'area_sum': np.where(has_area, area, 0),
+        'area_count': has_area.astype(np.int64),
+        'price_per_m2_sum': np.divide(price, area, out=np.zeros(len(listings)), where=has_area),
+        'deposit_sum': deposit_sum,
+        'deposit_count': deposit_count,
+        'service_fees_sum': service_fees_sum,
+        'service_fees_count': service_fees_count,
+    }
+
+
+def aggregate_listings(listings, year):
+    """
+    Sums the cleaned listings into the cube dimensions.
+
+    Args:
+        listings (pd.DataFrame): Cleaned listings, see CLEANED_SCHEMA.
+        year (int or array-like): The year the listings were scraped in, one for all or one per listing.
+
+    Returns:
+        tuple: The listings cube over CUBE_KEYS and the new building attribute counts over SHARE_KEYS.
+    """
+    # Sum the measures per cell, listings with a missing dimension are left out like in a groupby
+    frame = pd.DataFrame({
+        'TYP NABÍDKY': listings['TYP NABÍDKY'].array,
+        'LOKACE': listings['LOKACE'].array,
+        'DISPOZICE': listings['DISPOZICE'].array,
+        YEAR_COLUMN: np.broadcast_to(np.asarray(year, dtype=np.int64), len(listings)),
+        **listing_measures(listings),
+    })
+    cube = _sum_cells(frame, CUBE_KEYS)
+
+    # Count each attribute value of the new buildings, one row per attribute in long form
+    new_buildings = (listings['STAV'] == 'Novostavba').to_numpy()
+    shares = [pd.DataFrame({
+        'TYP NABÍDKY': frame['TYP NABÍDKY'].array[new_buildings],
+        'LOKACE': frame['LOKACE'].array[new_buildings],
+        YEAR_COLUMN: frame[YEAR_COLUMN].to_numpy()[new_buildings],
+        'ATRIBUT': attribute,
+        'HODNOTA': listings[attribute].to_numpy(dtype=object)[new_buildings],
+        'count': np.ones(new_buildings.sum(), dtype=np.int64),
+    }) for attribute in SHARE_ATTRIBUTES]
+    shares = _sum_cells(pd.concat(shares, ignore_index=True), SHARE_KEYS)
+
+    return cube, shares
+
+
+def _sum_cells(frame, keys):
+    # Categorical keys are grouped by their codes, the few cells then get plain strings that merge across cubes
+    cells = frame.groupby(keys, sort=False, observed=True, as_index=False).sum()
+    return cells.astype({key: str for key in keys if key != YEAR_COLUMN})
+
+
+def _merge(total, delta, keys, sign):
+    # Cells whose listings were all removed are dropped, so the cubes only hold listed combinations
+    measures = delta.columns.difference(keys)
+    delta = delta.assign(**{measure: delta[measure] * sign for measure in measures})
+    merged = _sum_cells(pd.concat([total, delta], ignore_index=True), keys)
+    return merged[merged['count'] != 0].reset_index(drop=True)
+
+
+class ListingsCube:
+    """
+    Additive aggregates of the cleaned listings over region, disposition, year and offer type.
+    The aggregates are built once and then updated with added and removed listings, the dashboard only reads them.
+    """
+
+    def __init__(self, listings, year):
+        """
+        Args:
+            listings (pd.DataFrame): Cleaned listings, see CLEANED_SCHEMA.
+            year (int or array-like): The year the listings were scraped in, one for all or one per listing.
+        """
+        self.cube, self.shares = aggregate_listings(listings, year)
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def add(self, listings, year):
+        """
+        Args:
+            listings (pd.DataFrame): Cleaned listings to add.
+            year (int or array-like): The year the listings were scraped in.
+        """
+        self._update(listings, year, 1)
+
+    def remove(self, listings, year):
+        """
+        Args:
+            listings (pd.DataFrame): Previously added listings to remove, such as listings scraped again.
+            year (int or array-like): The year the listings were added with.
+        """
+        self._update(listings, year, -1)
+
+    def apply_changes(self, changes, year):
+        """
+        Updates the cube with the result of CleanedListingsCache.load_changes.
+
+        Args:
+            changes (tuple): The cleaned listings, the added and the removed listings.
+            year (int): The year the listings were scraped in.
+        """
+        cleaned, appended, removed = changes
+        if appended is None:
+            # The cache was rebuilt, so the previously added listings are unknown
+            with self._lock:
+                self.cube, self.shares = aggregate_listings(cleaned, year)
+                self.version += 1
+            return
+
+        if len(removed):
+            self.remove(removed, year)
+        if len(appended):
+            self.add(appended, year)
+
+    def _update(self, listings, year, sign):
+        cube, shares = aggregate_listings(listings, year)
+        with self._lock:
+            # Each frame is replaced whole, so readers never see a half-merged cube
+            self.cube = _merge(self.cube, cube, CUBE_KEYS, sign)
+            self.shares = _merge(self.shares, shares, SHARE_KEYS, sign)
+            self.version += 1
+
+    def years(self):
+        """
+        Returns:
+            list: The years in the cube, ascending.
+        """
+        return sorted(self.cube[YEAR_COLUMN].unique())
+
+    def values(self, dimension):
+        """
+        Args:
+            dimension (str): One of CUBE_KEYS.
+
+        Returns:
+            list: The values of the dimension in the cube, sorted.
+        """
+        return sorted(self.cube[dimension].unique())
+
+    def by_disposition(self, offer_type, measure, regions=None):
+        """
+        The mean of a measure per disposition and year, like the notebook's Dispozice × Data z roku charts.
+
+        Args:
+            offer_type (str): 'PRODEJ' or 'PRONÁJEM'.
+            measure (str): One of MEASURES.
+            regions (list): The regions to include, all if empty.
+
+        Returns:
+            pd.DataFrame: 'DISPOZICE', 'ROK', the mean as the measure name and the number of listings as 'count'.
+        """
+        return self._means(self._slice(self.cube, offer_type, regions), ['DISPOZICE', YEAR_COLUMN], measure)
+
+    def by_region(self, offer_type, measure, dispositions=None):
+        """
+        The mean of a measure per region and year.
+
+        Args:
+            offer_type (str): 'PRODEJ' or 'PRONÁJEM'.
+            measure (str): One of MEASURES.
+            dispositions (list): The dispositions to include, all if empty.
+
+        Returns:
+            pd.DataFrame: 'LOKACE', 'ROK', the mean as the measure name and the number of listings as 'count'.
+        """
+        cube = self._slice(self.cube, offer_type)
+        if dispositions:
+            cube = cube[cube['DISPOZICE'].isin(dispositions)]
+        return self._means(cube, ['LOKACE', YEAR_COLUMN], measure)
+
+    def new_building_shares(self, offer_type, attribute, regions=None):
+        """
+        The shares of an attribute's values among new buildings per year.
+
+        Args:
+            offer_type (str): 'PRODEJ' or 'PRONÁJEM'.
+            attribute (str): One of SHARE_ATTRIBUTES.
+            regions (list): The regions to include, all if empty.
+
+        Returns:
+            pd.DataFrame: 'HODNOTA', 'ROK', the number of listings as 'count' and its share of the year as 'share'.
+        """
+        shares = self._slice(self.shares, offer_type, regions)
+        shares = shares[shares['ATRIBUT'] == attribute]
+        counts = shares.groupby(['HODNOTA', YEAR_COLUMN], as_index=False)['count'].sum()
+        counts['share'] = counts['count'] / counts.groupby(YEAR_COLUMN)['count'].transform('sum')
+        return counts
+
+    @staticmethod
+    def _slice(cube, offer_type, regions=None):
+        cube = cube[cube['TYP NABÍDKY'] == offer_type]
+        if regions:
+            cube = cube[cube['LOKACE'].isin(regions)]
+        return cube
+
+    @staticmethod
+    def _means(cube, keys, measure):
+        total, count = MEASURES[measure]
+        sums = cube.groupby(keys, as_index=False)[[total, count]].sum()
+        sums = sums[sums[count] > 0]
+        return pd.DataFrame({**{key: sums[key] for key in keys},
+                             measure: sums[total] / sums[count],
+                             'count': sums[count]})
@@ -0,0 +1,103 @@
+import dash
+from dash import dcc, html
+from dash.dependencies import Input, Output, State
+import plotly.express as px
+from cube import MEASURES, SHARE_ATTRIBUTES, YEAR_COLUMN
+
+OFFER_TYPES = ['PRONÁJEM', 'PRODEJ']
+
+# Seconds between checks for newly scraped listings
+REFRESH_INTERVAL = 60
+
+# Seconds between updates of the crawl progress
+STATUS_INTERVAL = 2
+
+
+def _grouped_bar(data, x, y, title):
+    # One bar per year, like the notebook's 'Data z roku' charts
+    return px.bar(data, x=x, y=y, color=data[YEAR_COLUMN].astype(str), barmode='group', hover_data=['count'],
+                  labels={'color': 'Rok'}, title=title)
+
+
+def _crawl_status(progress):
+    if progress['runs'] == 0:
+        return "Zatím neproběhl žádný crawl."
+    status = (f"Crawl {progress['runs']}: {progress['state']}, {progress['listings']} inzerátů za "
+              f"{progress['elapsed']:.0f} s ({progress['listings_per_minute']:.1f} inzerátů/min)")
+    if progress['last_error']:
+        status += f", chyba: {progress['last_error']}"
+    if progress['refresh_error']:
+        status += f", nové inzeráty se nepodařilo načíst: {progress['refresh_error']}"
+    return status
+
+
+def create_dashboard(cube, refresh=None, refresh_interval=REFRESH_INTERVAL, scheduler=None):
+    """
+    Creates the Dash app charting the listings cube. The callbacks only slice the cube, they never touch listings.
+
+    Args:
+        cube (ListingsCube): The aggregated listings.
+        refresh (callable): Called periodically to update the cube with newly scraped listings, None if the cube is
+            updated elsewhere, such as by the scheduler.
+        refresh_interval (int): Seconds between checks for an updated cube.
+        scheduler (CrawlScheduler): The background crawls to show and start from the dashboard, None to hide them.
+
+    Returns:
+        dash.Dash: The app, not yet running.
+    """
+    app = dash.Dash(__name__)
+    app.layout = html.Div([
+        html.H1("Bezrealitky"),
+        dcc.RadioItems(id='offer-type', options=OFFER_TYPES, value=OFFER_TYPES[0], inline=True),
+        dcc.Dropdown(id='measure', options=list(MEASURES), value='Cena', clearable=False),
+        dcc.Dropdown(id='regions', options=cube.values('LOKACE'), multi=True, placeholder="Všechny kraje"),
+        dcc.Graph(id='by-disposition'),
+        dcc.Graph(id='by-region'),
+        dcc.Dropdown(id='attribute', options=SHARE_ATTRIBUTES, value=SHARE_ATTRIBUTES[0], clearable=False),
+        dcc.Graph(id='new-building-shares'),
+        html.Div([
+            html.Button("Spustit crawl", id='crawl-now'),
+            html.Span(id='crawl-status'),
+        ], hidden=scheduler is None),
+        dcc.Interval(id='refresh', interval=refresh_interval * 1000, disabled=refresh is None and scheduler is None),
+        dcc.Interval(id='status', interval=STATUS_INTERVAL * 1000, disabled=scheduler is None),
+        dcc.Store(id='cube-version', data=cube.version),
+    ])
+
+    @app.callback(Output('cube-version', 'data'), Output('regions', 'options'), Input('refresh', 'n_intervals'),
+                  State('cube-version', 'data'), prevent_initial_call=True)
+    def refresh_cube(_, version):
+        # The charts are redrawn only when the cube changed since they were last drawn
+        if refresh is not None:
+            refresh()
+        if cube.version == version:
+            return dash.no_update, dash.no_update
+        return cube.version, cube.values('LOKACE')
+
+    @app.callback(Output('crawl-status', 'children'), Input('status', 'n_intervals'), Input('crawl-now', 'n_clicks'),
+                  prevent_initial_call=True)
+    def update_crawl_status(*_):
+        # The crawl runs on the scheduler's thread, the callback only starts it
+        if dash.ctx.triggered_id == 'crawl-now':
+            scheduler.request_crawl()
+        return _crawl_status(scheduler.progress.snapshot())
+
+    @app.callback(Output('by-disposition', 'figure'), Input('offer-type', 'value'), Input('measure', 'value'),
+                  Input('regions', 'value'), Input('cube-version', 'data'))
+    def update_by_disposition(offer_type, measure, regions, _):
+        data = cube.by_disposition(offer_type, measure, regions)
+        return _grouped_bar(data, 'DISPOZICE', measure, f"{measure} podle dispozice")
+
+    @app.callback(Output('by-region', 'figure'), Input('offer-type', 'value'), Input('measure', 'value'),
+                  Input('cube-version', 'data'))
+    def update_by_region(offer_type, measure, _):
+        data = cube.by_region(offer_type, measure)
+        return _grouped_bar(data, 'LOKACE', measure, f"{measure} podle kraje")
+
+    @app.callback(Output('new-building-shares', 'figure'), Input('offer-type', 'value'), Input('attribute', 'value'),
+                  Input('regions', 'value'), Input('cube-version', 'data'))
+    def update_new_building_shares(offer_type, attribute, regions, _):
+        data = cube.new_building_shares(offer_type, attribute, regions)
+        return _grouped_bar(data, 'HODNOTA', 'share', f"Novostavby podle {attribute}")
+
+    return app
@@ -1,3 +1,4 @@
+import re
 import numpy as np
 import pandas as pd
 from sklearn.linear_model import LinearRegression
@@ -5,148 +6,221 @@ from sklearn.metrics import r2_score, mean_squared_error
 from sklearn.impute import SimpleImputer
 from sklearn.model_selection import train_test_split, cross_val_score
 from sklearn.preprocessing import LabelEncoder
+from geo import REGION_NAMES, resolve_region
+
+# Increase whenever the cleaned output changes, so cached cleaned datasets are rebuilt
+CLEANING_VERSION = 2
+
+NON_DIGIT_PATTERN = re.compile(r'[^\d]')
+
+COLS_BOOLEAN = ['Internet', 'Energie', 'Balkón', 'Terasa', 'Sklep', 'Lodžie',
+                'Bezbariérový přístup', 'Parkování', 'Výtah', 'Garáž']
+
+COLS_DISTANCE = ['MHD', 'Pošta', 'Obchod', 'Banka', 'Restaurace', 'Lékárna',
+                 'Škola', 'Mateřská škola', 'Sportoviště', 'Hřiště']
+
+COLS_PRICE = ['CENA', 'POPLATKY ZA SLUŽBY', 'POPLATKY ZA ENERGIE', 'VRATNÁ KAUCE']
+
+COLS_CATEGORY = ['TYP NABÍDKY', 'LOKACE', 'DISPOZICE', 'STAV', 'VLASTNICTVÍ', 'TYP BUDOVY', 'VYBAVENO', 'PENB']
+
+# Categorical columns where a missing value is kept as its own 'unknown' category
+COLS_FILL_UNKNOWN = ['VLASTNICTVÍ', 'TYP BUDOVY', 'VYBAVENO', 'PENB']
+
+# The columns and dtypes of the cleaned DataFrame, in output order
+CLEANED_SCHEMA = {
+    'CENA': 'int32',
+    'POPLATKY ZA SLUŽBY': 'int32',
+    'POPLATKY ZA ENERGIE': 'int32',
+    'VRATNÁ KAUCE': 'int32',
+    'TYP NABÍDKY': 'category',
+    'LOKACE': pd.CategoricalDtype(REGION_NAMES),
+    'DISPOZICE': 'category',
+    'STAV': 'category',
+    'VLASTNICTVÍ': 'category',
+    'TYP BUDOVY': 'category',
+    'PLOCHA': 'Int32',
+    'VYBAVENO': 'category',
+    'PODLAŽÍ': 'Int16',
+    'PENB': 'category',
+    **{col: 'uint8' for col in COLS_BOOLEAN},
+    **{col: 'Int32' for col in COLS_DISTANCE},
+}
+
+
+def map_unique_values(series, function):
+    """
+    Applies a function to each distinct value of a Series only once.
+
+    Args:
+        series (pd.Series): The input Series.
+        function (callable): Maps a Series of the distinct non-null values to a Series of results.
+
+    Returns:
+        np.ndarray: The results aligned with the input, NaN where the input was null.
+    """
+    codes, uniques = pd.factorize(series)
+    results = np.asarray(function(pd.Series(uniques, dtype=object)), dtype=object)
+
+    # Code -1 marks nulls and picks the appended NaN
+    return np.append(results, np.nan)[codes]
+
+
+def parse_number(series):
+    """
+    Parses numbers written with units and thousands separators, such as "2 750 000 Kč" or "1 324 m".
+
+    Args:
+        series (pd.Series): The input Series.
+
+    Returns:
+        pd.Series: The parsed numbers as floats, NaN where the input was null or had no digits.
+    """
+    if pd.api.types.is_numeric_dtype(series):
+        return series
+
+    parsed = map_unique_values(series, lambda uniques: pd.to_numeric(
+        uniques.astype(str).str.replace(NON_DIGIT_PATTERN, '', regex=True), errors='coerce'))
+    return pd.Series(parsed, index=series.index, dtype=float)
+
 
 class DataHandler:
     def __init__(self, df):
         self.df = df
 
-    def clean_data(self):
+    def clean_data(self, verbose=True):
         """
+        Cleans the listings into a new compact DataFrame with the CLEANED_SCHEMA. The input DataFrame is not modified.
+
         Args:
-            df (pd.DataFrame): The input DataFrame to clean.
+            verbose (bool): Whether to print the head of the cleaned DataFrame.
 
         Returns:
             pd.DataFrame: The cleaned DataFrame.
         """
         df = self.df
 
+        # Standardize location names and parse prices once per distinct value
+        locations = self._standardize_location_names(df)
+        prices = parse_number(df['CENA'])
+
+        # Select the rows to keep with one mask, so the source rows are copied only once
+        rows = (self._keep_mask(df)
+                & locations.isin(REGION_NAMES)
+                & prices.notna()
+                & df['STAV'].notna())
 
-        # Remove duplicate rows
-        self._remove_duplicates(df)
+        positions = np.flatnonzero(rows.to_numpy())
+        index = df.index[positions]
 
-        # Drop unnecessary columns
-        self._drop_unneeded_columns(df)
+        # Build the output one column at a time, so no wide intermediate frame of raw strings is ever held
+        columns = {}
+        for col in CLEANED_SCHEMA:
+            # Keep only the schema columns of the selected rows
+            column = self._select_column(df, col, positions, index, {'LOKACE': locations, 'CENA': prices})
 
-        # Standardize location names
-        self._standardize_location_names(df)
+            # Convert columns to appropriate data types
+            column = self._convert_column_to_appropriate_data_type(col, column)
 
-        # Convert columns to appropriate data types
-        self._convert_columns_to_appropriate_data_types(df)
+            # Fill NaN values and clean column values
+            columns[col] = self._fill_na_and_clean_column(col, column)
 
-        # Fill NaN values and clean column values
-        self._fill_na_and_clean_columns(df)
+        cleaned = pd.DataFrame(columns, index=index)
 
-        print("Cleaned DataFrame:")
-        print(df.head())
-        return df
-    
-    def _remove_duplicates(self, df):
+        if verbose:
+            print("Cleaned DataFrame:")
+            print(cleaned.head())
+        return cleaned
+
+    def _keep_mask(self, df):
         """
         Args:
-            df (pd.DataFrame): The input DataFrame to remove duplicates from.
+            df (pd.DataFrame): The input DataFrame to deduplicate.
+
+        Returns:
+            pd.Series: A mask of the rows to keep.
         """
-        # Remove duplicate rows based on the 'URL' column
-        df.drop_duplicates(subset=['URL'], inplace=True)
+        # Keep one row per 'URL', the most recently scraped version
+        return ~df.duplicated(subset=['URL'], keep='last')
 
-    def _drop_unneeded_columns(self, df):
+    def _select_column(self, df, col, positions, index, replacements):
         """
         Args:
-            df (pd.DataFrame): The input DataFrame to drop unneeded columns from.
-        """
-        # Drop columns with all NaN values
-        df.dropna(axis=1, how='all', inplace=True)
+            df (pd.DataFrame): The input DataFrame to take the column from.
+            col (str): A column of the CLEANED_SCHEMA, which leaves out 'Index', 'URL', 'ČÍSLO INZERÁTU' and
+                'DOSTUPNÉ OD'.
+            positions (np.ndarray): The positions of the rows to keep.
+            index (pd.Index): The index labels of the rows to keep.
+            replacements (dict): Already processed columns to use instead of the input ones.
 
-        # Drop the columns
-        df.drop(labels='URL', axis=1, inplace=True)
-        df = df.drop(labels='Index', axis=1)
-        df = df.drop(labels='ČÍSLO INZERÁTU', axis=1)
-        df = df.drop(labels='DOSTUPNÉ OD', axis=1)
+        Returns:
+            pd.Series: The selected rows of the column, all NaN if the input lacks it.
+        """
+        source = replacements.get(col, df[col] if col in df.columns else None)
+        if source is None:
+            return pd.Series(np.nan, index=index, dtype=object, name=col)
+        return pd.Series(source.array[positions], index=index, name=col)
 
     def _standardize_location_names(self, df):
         """
         Args:
             df (pd.DataFrame): The input DataFrame to standardize location names in.
+
+        Returns:
+            pd.Series: The standardized location names, NaN where the location is missing.
         """
-        # Define the list of locations for standardization
-        locations = [
-            ('Praha', 'Praha'),
-            ('Moravskoslezský kraj', 'Moravskoslezský kraj'),
-            ('Ústecký kraj', 'Ústecký kraj'),
-            ('Pardubický kraj', 'Praha'),
-            ('Jihomoravský kraj', 'Jihomoravský kraj'),
-            ('Olomoucký kraj', 'Olomoucký kraj'),
-            ('Liberecký kraj', 'Liberecký kraj'),
-            ('Středočeský kraj', 'Středočeský kraj'),
-            ('Bratislavský kraj', 'Bratislavský kraj'),
-            ('Plzeňský kraj', 'Plzeňský kraj'),
-            ('Královéhradecký kraj', 'Královéhradecký kraj'),
-            ('Karlovarský kraj', 'Karlovarský kraj'),
-            ('kraj Vysočina', 'kraj Vysočina'),
-            ('Zlínský kraj', 'Zlínský kraj'),
-            ('Jihočeský kraj', 'Jihočeský kraj')
-        ]
-
-        # Drop NaN values in the 'LOKACE' column
-        df.dropna(subset=['LOKACE'], inplace=True)
-
-        for old_name, new_name in locations:
-            df.loc[df['LOKACE'].str.contains(old_name, case=False), 'LOKACE'] = new_name
-
-        # Drop rows where 'LOKACE' is not in the location_values list
-        df = df[df['LOKACE'].isin([new_name for _, new_name in locations])]
-
-    def _convert_columns_to_appropriate_data_types(self, df):
+        # Resolve every distinct location once, the resolver also remembers locations seen in earlier calls
+        locations = map_unique_values(df['LOKACE'], lambda uniques: uniques.map(resolve_region))
+        return pd.Series(locations, index=df.index)
+
+    def _convert_column_to_appropriate_data_type(self, col, column):
         """
         Args:
-            df (pd.DataFrame): The input DataFrame to convert columns to appropriate data types in.
+            col (str): The name of the column.
+            column (pd.Series): The selected rows of the column.
+
+        Returns:
+            pd.Series: The column with numeric values converted.
         """
-        df.dropna(subset=['CENA'], inplace=True)
-        df['CENA'] = df['CENA'].replace('[^\d]', '', regex=True).astype(int)
-
-        # Replace and convert other columns if present
-        if 'POPLATKY ZA SLUŽBY' in df.columns:
-            df['POPLATKY ZA SLUŽBY'] = df['POPLATKY ZA SLUŽBY'].replace('[^\d]', '', regex=True).fillna(0).astype(int)
-        if 'POPLATKY ZA ENERGIE' in df.columns:
-            df['POPLATKY ZA ENERGIE'] = df['POPLATKY ZA ENERGIE'].replace('[^\d]', '', regex=True).fillna(0).astype(int)
-        if 'VRATNÁ KAUCE' in df.columns:
-            df['VRATNÁ KAUCE'] = df['VRATNÁ KAUCE'].replace('[^\d]', '', regex=True).fillna(0).astype(int)
-
-        cols_boolean = ['Internet', 'Energie', 'Balkón', 'Terasa', 'Sklep', 'Lodžie',
-                        'Bezbariérový přístup', 'Parkování', 'Výtah', 'Garáž']
-        existing_cols_boolean = [col for col in cols_boolean if col in df.columns]
-        df[existing_cols_boolean] = df[existing_cols_boolean].fillna(value=0).astype(int)
-
-        # df['DOSTUPNÉ OD'] = pd.to_datetime(df['DOSTUPNÉ OD'], format='%d. %m. %Y', errors='coerce')
-
-        cols_distance = ['MHD', 'Pošta', 'Obchod', 'Banka', 'Restaurace', 'Lékárna',
-                        'Škola', 'Mateřská škola', 'Sportoviště', 'Hřiště']
-        df[cols_distance] = df[cols_distance].applymap(lambda x: int(x.replace('m', '').replace(' ', '')) if pd.notna(x) else x)
-        
-    def _fill_na_and_clean_columns(self, df):
+        # Missing fees and deposits mean there are none
+        if col in COLS_PRICE:
+            return parse_number(column).fillna(0).astype(CLEANED_SCHEMA[col])
+
+        if col in COLS_BOOLEAN:
+            return pd.to_numeric(column, errors='coerce').fillna(0).astype(CLEANED_SCHEMA[col])
+
+        # Distances and area keep missing values as nulls
+        if col in COLS_DISTANCE or col == 'PLOCHA':
+            return parse_number(column).astype(CLEANED_SCHEMA[col])
+
+        # Floors can be negative, so they are not stripped to digits
+        if col == 'PODLAŽÍ':
+            return pd.to_numeric(column, errors='coerce').astype(CLEANED_SCHEMA[col])
+
+        return column
+
+    def _fill_na_and_clean_column(self, col, column):
         """
         Args:
-            df (pd.DataFrame): The input DataFrame fill na values and clean columns in.
+            col (str): The name of the column.
+            column (pd.Series): The converted column.
+
+        Returns:
+            pd.Series: The column with categorical values filled and converted.
         """
-        df.dropna(subset=['STAV'], inplace=True)
+        # Columns read as categoricals need 'unknown' among their categories before filling
+        if col in COLS_FILL_UNKNOWN and isinstance(column.dtype, pd.CategoricalDtype):
+            column = column.cat.add_categories([name for name in ['unknown'] if name not in column.cat.categories])
 
         # Replace NaN values with 'unknown' in specific columns
-        columns_to_replace = ['VLASTNICTVÍ', 'TYP BUDOVY', 'PLOCHA',
-                            'VYBAVENO', 'PODLAŽÍ', 'PENB']
-
-        for col in columns_to_replace:
-            df[col].fillna(value='unknown', inplace=True)
-
-        cols_distance = ['MHD', 'Pošta', 'Obchod', 'Banka', 'Restaurace', 'Lékárna',
-                        'Škola', 'Mateřská škola', 'Sportoviště', 'Hřiště']
-
-        for col in cols_distance:
-            df[col].fillna(value='unknown', inplace=True)
+        if col in COLS_FILL_UNKNOWN:
+            column = column.fillna('unknown')
 
-        # Remove non-digit characters and extra spaces, then convert the 'PLOCHA' column to int data type
-        df['PLOCHA'] = df['PLOCHA'].replace('[^\d]', '', regex=True).astype(int)
+        if col in COLS_CATEGORY:
+            column = column.astype(CLEANED_SCHEMA[col])
 
-        # Replace 'unknown' values with np.nan
-        df = df.replace('unknown', np.nan)
+        # Keep only the categories in use, sorted, whatever categories the input column had
+        if col in COLS_CATEGORY and not isinstance(CLEANED_SCHEMA[col], pd.CategoricalDtype):
+            column = column.cat.remove_unused_categories()
+            column = column.cat.reorder_categories(sorted(column.cat.categories))
 
-        # Fill missing values with the mean value of the corresponding column
-        df = df.fillna('0') 
+        return column
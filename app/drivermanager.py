@@ -0,0 +1,191 @@
+import logging
+import threading
+import psutil
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from webscraper import WebScraper
+
+# Requests the scraper never needs: images, fonts, stylesheets, media and analytics, blocked in the browser
+BLOCKED_URL_PATTERNS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.avif', '*.svg', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*.css', '*.mp4', '*.webm',
+    '*/_next/image*',
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*', '*facebook.net*', '*hotjar.com*',
+    '*seznam.cz/js/rc.js*', '*clarity.ms*',
+]
+
+# Headless Chrome defaults to a small window, which would switch the site to its mobile layout
+WINDOW_SIZE = '1920,1080'
+
+
+def browser_rss(driver):
+    """
+    Returns the resident memory of the browser behind a driver, chromedriver and all Chrome processes included.
+
+    Args:
+        driver (webdriver.Chrome): A running driver.
+
+    Returns:
+        int: The resident set size in bytes.
+    """
+    service = psutil.Process(driver.service.process.pid)
+    rss = 0
+    for process in [service] + service.children(recursive=True):
+        try:
+            rss += process.memory_info().rss
+        except psutil.NoSuchProcess:
+            continue
+    return rss
+
+
+class ManagedDriver:
+    """
+    A driver lent by a DriverManager, used like the webdriver.Chrome it wraps. It restarts its browser once it has
+    loaded max_pages pages, and quit() gives it back to the manager instead of closing the browser.
+    """
+
+    def __init__(self, manager, driver):
+        self._manager = manager
+        self._driver = driver
+        self.pages = 0
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+    def get(self, url):
+        # A long-lived browser keeps growing, a fresh one is cheaper than its memory
+        if self.pages >= self._manager.max_pages:
+            self._driver = self._manager.restart(self._driver)
+            self.pages = 0
+        self.pages += 1
+        self._driver.get(url)
+
+    def quit(self):
+        self._manager.release(self)
+
+
+class DriverManager:
+    """
+    Starts headless Chrome drivers that block the resources the scraper never reads, and keeps released drivers warm
+    so that the next crawl or worker reuses them instead of starting a browser.
+    """
+
+    def __init__(self, driver_path, headless=True, block_resources=True, max_pages=200, max_idle=4):
+        """
+        Args:
+            driver_path (str): The path to the chromedriver executable.
+            headless (bool): Whether to run Chrome without a window.
+            block_resources (bool): Whether to block images, fonts, stylesheets and analytics.
+            max_pages (int): The number of pages after which a driver's browser is restarted.
+            max_idle (int): The maximum number of released drivers kept running for reuse.
+        """
+        self.driver_path = driver_path
+        self.headless = headless
+        self.block_resources = block_resources
+        self.max_pages = max_pages
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def chrome_options(self):
+        """
+        Returns:
+            Options: The scraper's Chrome options, tuned by the manager's settings.
+        """
+        options = WebScraper.configure_chrome_options()
+        if self.headless:
+            options.add_argument("--headless=new")
+            options.add_argument(f"--window-size={WINDOW_SIZE}")
+        return options
+
+    def start_driver(self):
+        """
+        Starts a new browser with the manager's settings.
+
+        Returns:
+            webdriver.Chrome: The new driver.
+        """
+        driver = webdriver.Chrome(executable_path=self.driver_path, options=self.chrome_options())
+        if self.block_resources:
+            # Blocked requests fail in the browser before they reach the network
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+        return driver
+
+    def acquire(self):
+        """
+        Lends a driver, a warm one if there is one.
+
+        Returns:
+            ManagedDriver: The driver, give it back with its quit().
+        """
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("The driver manager is closed.")
+                if not self._idle:
+                    break
+                managed = self._idle.pop()
+
+            # A browser that crashed while idle is replaced
+            try:
+                managed.current_url
+                return managed
+            except WebDriverException:
+                logging.warning("Discarding a warm driver that stopped responding.")
+                self._quit(managed._driver)
+
+        return ManagedDriver(self, self.start_driver())
+
+    def release(self, managed):
+        """
+        Takes a lent driver back, keeping it warm unless enough drivers are idle already.
+
+        Args:
+            managed (ManagedDriver): The driver to take back.
+        """
+        try:
+            # Leave the last page, so that the idle browser doesn't keep running its scripts
+            managed._driver.get('about:blank')
+        except WebDriverException:
+            self._quit(managed._driver)
+            return
+
+        with self._lock:
+            if not self._closed and len(self._idle) < self.max_idle:
+                self._idle.append(managed)
+                return
+        self._quit(managed._driver)
+
+    def restart(self, driver):
+        """
+        Replaces a driver's browser with a fresh one.
+
+        Args:
+            driver (webdriver.Chrome): The driver to quit.
+
+        Returns:
+            webdriver.Chrome: The new driver.
+        """
+        logging.info(f"Restarting a browser after {self.max_pages} pages.")
+        self._quit(driver)
+        return self.start_driver()
+
+    def close(self):
+        """
+        Quits the idle drivers, drivers released later are quit too.
+        """
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for managed in idle:
+            self._quit(managed._driver)
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except WebDriverException as e:
+            logging.warning(f"Could not quit a driver: {e}")
@@ -0,0 +1,152 @@
+import argparse
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+MANIFEST_FILE = 'manifest.json'
+
+# The arrays of a train/test split, as the notebook wrote them to modeling_data
+SPLIT_ARRAYS = ('X_train', 'X_test', 'y_train', 'y_test')
+
+
+class FeatureSet:
+    """
+    One version of the feature store: its arrays, the column names of the feature matrices and how the split was
+    made. Arrays are accessed by name, e.g. features['X_train'].
+    """
+
+    def __init__(self, version, arrays, columns, split):
+        self.version = version
+        self.arrays = arrays
+        self.columns = columns
+        self.split = split
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+
+class FeatureStore:
+    """
+    Feature matrices saved as contiguous float32 .npy files, one directory per version with a manifest of the column
+    names, array shapes and split. Arrays are loaded as read-only memory maps, so loading copies nothing and the
+    training and inference processes that load the same version share its pages in the OS cache.
+    """
+
+    def __init__(self, root):
+        """
+        Args:
+            root (str): The directory of the store, created on the first write.
+        """
+        self.root = root
+
+    def versions(self):
+        """
+        Returns:
+            list: The versions in the store, oldest first.
+        """
+        if not os.path.isdir(self.root):
+            return []
+        versions = [name for name in os.listdir(self.root)
+                    if os.path.isfile(os.path.join(self.root, name, MANIFEST_FILE))]
+        return sorted(versions, key=lambda name: os.path.getmtime(os.path.join(self.root, name, MANIFEST_FILE)))
+
+    def exists(self, version):
+        """
+        Args:
+            version (str): The version to look for.
+
+        Returns:
+            bool: True if the version is in the store.
+        """
+        return os.path.isfile(os.path.join(self.root, version, MANIFEST_FILE))
+
+    def write(self, version, arrays, columns, split=None):
+        """
+        Writes a new version. It is written to a temporary directory first, so readers never see a partial version.
+
+        Args:
+            version (str): The name of the version, versions are never overwritten.
+            arrays (dict): The arrays by name, such as SPLIT_ARRAYS, converted to contiguous float32.
+            columns (list): The column names of the feature matrices.
+            split (dict): How the split was made, such as its test size, seed and the data it was made from.
+
+        Returns:
+            str: The directory of the version.
+        """
+        path = os.path.join(self.root, version)
+        if os.path.exists(path):
+            raise FileExistsError(f"Feature store version '{version}' already exists.")
+
+        temporary_path = f'{path}.tmp-{os.getpid()}'
+        os.makedirs(temporary_path)
+        try:
+            manifest = {'version': version, 'columns': list(columns), 'split': split or {}, 'arrays': {}}
+            for name, array in arrays.items():
+                array = np.ascontiguousarray(array, dtype=np.float32)
+                np.save(os.path.join(temporary_path, f'{name}.npy'), array, allow_pickle=False)
+                manifest['arrays'][name] = {'file': f'{name}.npy', 'shape': list(array.shape)}
+
+            with open(os.path.join(temporary_path, MANIFEST_FILE), 'w', encoding='utf-8') as manifest_file:
+                json.dump(manifest, manifest_file, ensure_ascii=False, indent=1)
+            os.rename(temporary_path, path)
+        except BaseException:
+            shutil.rmtree(temporary_path, ignore_errors=True)
+            raise
+
+        return path
+
+    def load(self, version=None, mmap=True):
+        """
+        Args:
+            version (str): The version to load, the newest one by default.
+            mmap (bool): Whether to memory-map the arrays read-only instead of reading them into memory.
+
+        Returns:
+            FeatureSet: The loaded version.
+        """
+        if version is None:
+            versions = self.versions()
+            if not versions:
+                raise FileNotFoundError(f"The feature store {self.root} is empty.")
+            version = versions[-1]
+
+        path = os.path.join(self.root, version)
+        with open(os.path.join(path, MANIFEST_FILE), encoding='utf-8') as manifest_file:
+            manifest = json.load(manifest_file)
+
+        arrays = {name: np.load(os.path.join(path, entry['file']), mmap_mode='r' if mmap else None,
+                                allow_pickle=False)
+                  for name, entry in manifest['arrays'].items()}
+        return FeatureSet(version, arrays, manifest['columns'], manifest['split'])
+
+
+def import_csv_split(store, csv_dir, version):
+    """
+    Imports the train/test split the modeling notebook wrote as CSV files.
+
+    Args:
+        store (FeatureStore): The store to write to.
+        csv_dir (str): The directory with X_train.csv, X_test.csv, y_train.csv and y_test.csv.
+        version (str): The name of the new version.
+
+    Returns:
+        str: The directory of the version.
+    """
+    frames = {name: pd.read_csv(os.path.join(csv_dir, f'{name}.csv')) for name in SPLIT_ARRAYS}
+
+    # The targets are single columns, stored as vectors like the notebook's y_train
+    arrays = {name: frame.to_numpy() if name.startswith('X') else frame.iloc[:, 0].to_numpy()
+              for name, frame in frames.items()}
+    return store.write(version, arrays, frames['X_train'].columns, split={'source': os.path.abspath(csv_dir)})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Import the notebook's modeling_data CSV files into a feature store.")
+    parser.add_argument('csv_dir')
+    parser.add_argument('store')
+    parser.add_argument('--version', default='notebook')
+    args = parser.parse_args()
+
+    print(f"Imported into {import_csv_split(FeatureStore(args.store), args.csv_dir, args.version)}")
@@ -0,0 +1,155 @@
+import logging
+import re
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import shapely
+
+GADM_FILE = './geo_data/gadm36_CZE_1.shp'
+
+# Define the list of locations for standardization, the first matching location wins
+LOCATIONS = [
+    ('Praha', 'Praha'),
+    ('Moravskoslezský kraj', 'Moravskoslezský kraj'),
+    ('Ústecký kraj', 'Ústecký kraj'),
+    ('Pardubický kraj', 'Pardubický kraj'),
+    ('Jihomoravský kraj', 'Jihomoravský kraj'),
+    ('Olomoucký kraj', 'Olomoucký kraj'),
+    ('Liberecký kraj', 'Liberecký kraj'),
+    ('Středočeský kraj', 'Středočeský kraj'),
+    ('Bratislavský kraj', 'Bratislavský kraj'),
+    ('Plzeňský kraj', 'Plzeňský kraj'),
+    ('Královéhradecký kraj', 'Královéhradecký kraj'),
+    ('Karlovarský kraj', 'Karlovarský kraj'),
+    ('kraj Vysočina', 'kraj Vysočina'),
+    ('Zlínský kraj', 'Zlínský kraj'),
+    ('Jihočeský kraj', 'Jihočeský kraj')
+]
+
+# One alternative per location, tried in list order, so a single match finds the first matching location
+LOCATION_PATTERN = re.compile('|'.join(f'^.*?({re.escape(old_name)})' for old_name, _ in LOCATIONS), re.IGNORECASE)
+
+REGION_NAMES = list(dict.fromkeys(new_name for _, new_name in LOCATIONS))
+
+# GADM names of the regions that differ from the scraped ones, the others only lack the ' kraj' suffix
+GADM_NAMES = {
+    'Prague': 'Praha',
+    'Kraj Vysočina': 'kraj Vysočina',
+}
+
+
+@lru_cache(maxsize=2**16)
+def resolve_region(location):
+    """
+    Resolves a scraped location to its region, each distinct location is matched only once per process.
+
+    Args:
+        location (str): The scraped location, such as "Čs. armády, Hlučín, Moravskoslezský kraj".
+
+    Returns:
+        str: The standardized region name, or the input if no known location matches.
+    """
+    match = LOCATION_PATTERN.match(location)
+    if match is None:
+        return location
+    return LOCATIONS[match.lastindex - 1][1]
+
+
+def gadm_region_name(name):
+    """
+    Args:
+        name (str): A region name from the NAME_1 column of the GADM shapefile.
+
+    Returns:
+        str: The region name used in the cleaned listings.
+    """
+    return GADM_NAMES.get(name, f'{name} kraj')
+
+
+class RegionIndex:
+    """
+    Region polygons prepared for assigning many points at once.
+    Each point is only tested against the regions whose bounding box contains it, with the polygons prepared once.
+    """
+
+    def __init__(self, names, geometries):
+        """
+        Args:
+            names (list): The region names, from REGION_NAMES.
+            geometries (list): The region polygons in longitude and latitude, aligned with the names.
+        """
+        self.names = list(names)
+        self.geometries = np.asarray(geometries, dtype=object)
+        self.bounds = shapely.bounds(self.geometries)
+
+        # Build the internal spatial index of every polygon now rather than on the first query
+        shapely.prepare(self.geometries)
+
+    @classmethod
+    def from_shapefile(cls, file_name=GADM_FILE):
+        """
+        Args:
+            file_name (str): The GADM level 1 shapefile of the Czech Republic.
+
+        Returns:
+            RegionIndex: The index of the regions in the shapefile.
+        """
+        # geopandas is only needed to read the shapefile
+        import geopandas as gpd
+
+        gdf = gpd.read_file(file_name).to_crs(epsg=4326)
+        logging.info(f"Loaded {len(gdf)} region polygons from {file_name}.")
+        return cls([gadm_region_name(name) for name in gdf['NAME_1']], gdf.geometry.to_numpy())
+
+    def assign(self, lng, lat):
+        """
+        Finds the region of each point.
+
+        Args:
+            lng (array-like): The longitudes of the points.
+            lat (array-like): The latitudes of the points.
+
+        Returns:
+            pd.Categorical: The region of each point over REGION_NAMES, NaN for points outside all regions or with
+            missing coordinates.
+        """
+        lng = np.asarray(lng, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        codes = np.full(len(lng), -1, dtype=np.int8)
+
+        for name, geometry, (min_lng, min_lat, max_lng, max_lat) in zip(self.names, self.geometries, self.bounds):
+            # Test only the unassigned points inside the bounding box, so each polygon sees a small part of the points
+            candidates = np.flatnonzero((codes == -1)
+                                        & (lng >= min_lng) & (lng <= max_lng)
+                                        & (lat >= min_lat) & (lat <= max_lat))
+            inside = shapely.contains_xy(geometry, lng[candidates], lat[candidates])
+            codes[candidates[inside]] = REGION_NAMES.index(name)
+
+        return pd.Categorical.from_codes(codes, dtype=pd.CategoricalDtype(REGION_NAMES))
+
+
+@lru_cache(maxsize=None)
+def load_region_index(file_name=GADM_FILE):
+    """
+    Args:
+        file_name (str): The GADM level 1 shapefile of the Czech Republic.
+
+    Returns:
+        RegionIndex: The index of the regions, the shapefile is read only once per process.
+    """
+    return RegionIndex.from_shapefile(file_name)
+
+
+def assign_regions(lng, lat, file_name=GADM_FILE):
+    """
+    Finds the region of each point using the GADM region polygons.
+
+    Args:
+        lng (array-like): The longitudes of the points.
+        lat (array-like): The latitudes of the points.
+        file_name (str): The GADM level 1 shapefile of the Czech Republic.
+
+    Returns:
+        pd.Categorical: The region of each point over REGION_NAMES, NaN where no region contains the point.
+    """
+    return load_region_index(file_name).assign(lng, lat)
@@ -0,0 +1,284 @@
+import argparse
+import logging
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from cube import YEAR_COLUMN
+from datahandler import DataHandler, CLEANED_SCHEMA, map_unique_values
+from geo import GADM_FILE, assign_regions
+from ingest import read_listings_chunks, clean_chunks
+
+EXCEL_HISTORY_FILE = './data/data_2022.xlsx'
+EXCEL_HISTORY_YEAR = 2022
+
+# The 2022 export only has the path of each listing
+LISTING_URL_PREFIX = 'https://www.bezrealitky.cz/nemovitosti-byty-domy/'
+
+# Columns of the 2022 export and their names in the scraped listings, like the notebook's mapping_df2
+LEGACY_COLUMN_MAPPING = {
+    'price': 'CENA',
+    'utilities': 'POPLATKY ZA SLUŽBY',
+    'deposit': 'VRATNÁ KAUCE',
+    'key_offer_type': 'TYP NABÍDKY',
+    'key_disposition': 'DISPOZICE',
+    'condition': 'STAV',
+    'property_type': 'VLASTNICTVÍ',
+    'building_type': 'TYP BUDOVY',
+    'surface': 'PLOCHA',
+    'facilities': 'VYBAVENO',
+    'floor': 'PODLAŽÍ',
+    'penb': 'PENB',
+    'balcony': 'Balkón',
+    'terrace': 'Terasa',
+    'cellar': 'Sklep',
+    'loggia': 'Lodžie',
+    'parking': 'Parkování',
+    'elevator': 'Výtah',
+    'garage': 'Garáž',
+    'public_transport_stop': 'MHD',
+    'post_office': 'Pošta',
+    'store': 'Obchod',
+    'bank': 'Banka',
+    'restaurant': 'Restaurace',
+    'pharmacy': 'Lékárna',
+    'school': 'Škola',
+    'kindergarten': 'Mateřská škola',
+    'sport_field': 'Sportoviště',
+    'playground': 'Hřiště',
+}
+
+# Values of the 2022 export that the scraped listings spell differently
+LEGACY_VALUE_MAPPING = {
+    'TYP NABÍDKY': {'pronajem': 'PRONÁJEM', 'prodej': 'PRODEJ'},
+    'DISPOZICE': {
+        **{f'{rooms}-{kind}': f'{rooms}+{kind}' for rooms in range(1, 7) for kind in ('kk', '1')},
+        'garsoniera': 'Garsoniéra',
+        'ostatní': 'Ostatní',
+    },
+    'VYBAVENO': {'Vybavený': 'Vybaveno', 'Nevybavený': 'Nevybaveno'},
+}
+
+BATCH_COLUMN = 'BATCH'
+
+# Arrow types of the CLEANED_SCHEMA dtypes, categoricals are stored dictionary-encoded with one index width so every
+# partition has the same schema
+ARROW_TYPES = {
+    'int32': pa.int32(),
+    'Int32': pa.int32(),
+    'Int16': pa.int16(),
+    'uint8': pa.uint8(),
+    'category': pa.dictionary(pa.int32(), pa.string()),
+}
+
+HISTORY_SCHEMA = pa.schema([('URL', pa.string())]
+                           + [(col, ARROW_TYPES[str(dtype)]) for col, dtype in CLEANED_SCHEMA.items()])
+
+# Every listing file sits in a year and batch directory, such as ROK=2023/BATCH=20231015T060000
+PARTITION_SCHEMA = pa.schema([(YEAR_COLUMN, pa.int16()), (BATCH_COLUMN, pa.string())])
+
+
+def map_legacy_values(series, mapping):
+    """
+    Args:
+        series (pd.Series): A column of the 2022 export.
+        mapping (dict): Its values spelled the way the scraped listings spell them.
+
+    Returns:
+        pd.Series: The column with the values replaced, each distinct value looked up once.
+    """
+    return pd.Series(map_unique_values(series, lambda uniques: uniques.replace(mapping)), index=series.index)
+
+
+def read_excel_history(file_name=EXCEL_HISTORY_FILE, gadm_file=GADM_FILE):
+    """
+    Reads the 2022 export into the columns of the scraped listings, with the region of each listing found from its
+    coordinates instead of the notebook's spatial join.
+
+    Args:
+        file_name (str): The Excel export.
+        gadm_file (str): The GADM level 1 shapefile of the Czech Republic.
+
+    Returns:
+        pd.DataFrame: The listings as scraped listings, ready for DataHandler.clean_data.
+    """
+    # Parse only the columns that are used, the workbook is slow to read
+    df = pd.read_excel(file_name, usecols=['uri', 'lat', 'lng'] + list(LEGACY_COLUMN_MAPPING))
+    listings = df[list(LEGACY_COLUMN_MAPPING)].rename(columns=LEGACY_COLUMN_MAPPING)
+
+    for col, mapping in LEGACY_VALUE_MAPPING.items():
+        listings[col] = map_legacy_values(listings[col], mapping)
+
+    listings['URL'] = LISTING_URL_PREFIX + df['uri']
+    listings['LOKACE'] = assign_regions(df['lng'], df['lat'], gadm_file)
+    return listings
+
+
+class ListingsHistory:
+    """
+    The cleaned listings of every year as a Parquet dataset partitioned by year and batch, where a batch is the
+    import of an older export or one crawl. Batches are only ever added, so appending a crawl writes just its own
+    listings and the whole history loads in one columnar read.
+    """
+
+    def __init__(self, root):
+        """
+        Args:
+            root (str): The directory of the dataset, created on the first write.
+        """
+        self.root = root
+
+    def batches(self):
+        """
+        Returns:
+            list: The (year, batch) pairs in the history, in year and batch order.
+        """
+        batches = []
+        if not os.path.isdir(self.root):
+            return batches
+
+        for year_dir in os.listdir(self.root):
+            if not year_dir.startswith(f'{YEAR_COLUMN}='):
+                continue
+            for batch_dir in os.listdir(os.path.join(self.root, year_dir)):
+                if batch_dir.startswith(f'{BATCH_COLUMN}='):
+                    batches.append((int(year_dir.split('=', 1)[1]), batch_dir.split('=', 1)[1]))
+        return sorted(batches)
+
+    def years(self):
+        """
+        Returns:
+            list: The years in the history, ascending.
+        """
+        return sorted({year for year, _ in self.batches()})
+
+    def append(self, cleaned, year, batch=None):
+        """
+        Writes cleaned listings as a new batch. The file is written under a hidden name first and then renamed, so
+        readers never see a partial batch.
+
+        Args:
+            cleaned (pd.DataFrame): Cleaned listings with their 'URL' column, see CLEANED_SCHEMA.
+            year (int): The year the listings were scraped in.
+            batch (str): The name of the batch, the current time by default. Later batches of a year replace the
+                listings of earlier ones with the same URL.
+
+        Returns:
+            str: The directory of the batch.
+        """
+        batch = batch or datetime.now().strftime('%Y%m%dT%H%M%S')
+        path = os.path.join(self.root, f'{YEAR_COLUMN}={year}', f'{BATCH_COLUMN}={batch}')
+        if os.path.exists(path):
+            raise FileExistsError(f"Batch '{batch}' of {year} is already in the history.")
+
+        table = pa.Table.from_pandas(cleaned[HISTORY_SCHEMA.names], schema=HISTORY_SCHEMA, preserve_index=False)
+        os.makedirs(path)
+        temporary_file = os.path.join(path, f'.part-{os.getpid()}.parquet')
+        pq.write_table(table, temporary_file)
+        os.rename(temporary_file, os.path.join(path, 'part-0.parquet'))
+
+        logging.info(f"Appended {len(cleaned)} listings of {year} to the history as batch {batch}.")
+        return path
+
+    def append_csv(self, file_name, year, start_byte=0, batch=None):
+        """
+        Cleans the listings a crawl appended to the listings CSV and writes them as a new batch.
+
+        Args:
+            file_name (str): The listings CSV file.
+            year (int): The year the listings were scraped in.
+            start_byte (int): The size of the CSV file before the crawl, 0 appends the whole file.
+            batch (str): The name of the batch, the current time by default.
+
+        Returns:
+            str: The directory of the batch, None if the crawl added no listings.
+        """
+        if not os.path.isfile(file_name) or os.path.getsize(file_name) <= start_byte:
+            return None
+
+        cleaned, _, _ = clean_chunks(read_listings_chunks(file_name, start_byte=start_byte))
+        if cleaned.empty:
+            return None
+        return self.append(cleaned, year, batch)
+
+    def import_excel(self, file_name=EXCEL_HISTORY_FILE, year=EXCEL_HISTORY_YEAR, gadm_file=GADM_FILE):
+        """
+        Converts an Excel export into a batch named after the file, once.
+
+        Args:
+            file_name (str): The Excel export, such as the 2022 listings.
+            year (int): The year of the export.
+            gadm_file (str): The GADM level 1 shapefile of the Czech Republic.
+
+        Returns:
+            str: The directory of the batch, None if the export was imported before.
+        """
+        batch = os.path.splitext(os.path.basename(file_name))[0]
+        if (year, batch) in self.batches():
+            return None
+
+        listings = read_excel_history(file_name, gadm_file)
+        cleaned = DataHandler(listings).clean_data(verbose=False)
+        cleaned['URL'] = listings['URL'].loc[cleaned.index]
+        return self.append(cleaned, year, batch)
+
+    def load(self, years=None):
+        """
+        Args:
+            years (list): The years to load, all by default.
+
+        Returns:
+            pd.DataFrame: The cleaned listings with their 'URL' and the year as YEAR_COLUMN, each URL once per year
+            in its latest batch.
+        """
+        if not self.batches():
+            return pd.DataFrame({'URL': pd.Series(dtype=object),
+                                 **{col: pd.Series(dtype=dtype) for col, dtype in CLEANED_SCHEMA.items()},
+                                 YEAR_COLUMN: pd.Series(dtype='int16')})
+
+        dataset = ds.dataset(self.root, format='parquet', schema=pa.unify_schemas([HISTORY_SCHEMA, PARTITION_SCHEMA]),
+                             partitioning=ds.partitioning(PARTITION_SCHEMA, flavor='hive'))
+        table = dataset.to_table(filter=None if years is None else ds.field(YEAR_COLUMN).isin(list(years)))
+        listings = table.to_pandas()
+
+        # Keep the latest version of each URL per year, batch names sort in the order they were written
+        batch = listings.pop(BATCH_COLUMN).astype('category')
+        order = np.argsort(batch.cat.reorder_categories(sorted(batch.cat.categories)).cat.codes.to_numpy(),
+                           kind='stable')
+        listings = listings.iloc[order]
+        listings = listings[~listings.duplicated([YEAR_COLUMN, 'URL'], keep='last')].reset_index(drop=True)
+
+        # Restore the cleaned dtypes, with the categories of every batch merged and sorted
+        listings = listings.astype(CLEANED_SCHEMA)
+        for col, dtype in CLEANED_SCHEMA.items():
+            if dtype == 'category' and not isinstance(dtype, pd.CategoricalDtype):
+                listings[col] = listings[col].cat.remove_unused_categories()
+                listings[col] = listings[col].cat.reorder_categories(sorted(listings[col].cat.categories))
+        return listings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the multi-year listings history.")
+    parser.add_argument('history')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    excel_parser = subparsers.add_parser('import-excel', help="import an Excel export of older listings once")
+    excel_parser.add_argument('--file', default=EXCEL_HISTORY_FILE)
+    excel_parser.add_argument('--year', type=int, default=EXCEL_HISTORY_YEAR)
+
+    csv_parser = subparsers.add_parser('append-csv', help="append the listings of a crawl CSV as a new batch")
+    csv_parser.add_argument('csv_file')
+    csv_parser.add_argument('--year', type=int, required=True, help="the year the listings were scraped in")
+    csv_parser.add_argument('--start-byte', type=int, default=0, help="the size of the CSV file before the crawl")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    history = ListingsHistory(args.history)
+    if args.command == 'import-excel':
+        history.import_excel(args.file, args.year)
+    else:
+        history.append_csv(args.csv_file, args.year, args.start_byte)
+    print(f"{args.history}: {', '.join(f'{year}/{batch}' for year, batch in history.batches())}")
@@ -0,0 +1,130 @@
+import logging
+import os
+from urllib.parse import urlparse
+import requests
+from lxml import etree
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from listingparser import parse_listing_html
+from metrics import CrawlMetrics
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/74.0.3729.169 Safari/537.36"
+
+
+def fixture_path(fixture_dir, url):
+    """
+    Returns the path of the saved HTML fixture for the given URL.
+
+    Args:
+        fixture_dir (str): The directory with the saved pages.
+        url (str): The URL of the page.
+
+    Returns:
+        str: The path of the fixture file.
+    """
+    name = urlparse(url).path.strip('/').replace('/', '_') or 'index'
+    return os.path.join(fixture_dir, f"{name}.html")
+
+
+def save_fixture(fixture_dir, url, page_source):
+    """
+    Saves the HTML of a page so that it can be replayed offline.
+
+    Args:
+        fixture_dir (str): The directory with the saved pages.
+        url (str): The URL of the page.
+        page_source (str): The HTML of the page.
+
+    Returns:
+        str: The path of the written fixture file.
+    """
+    os.makedirs(fixture_dir, exist_ok=True)
+    path = fixture_path(fixture_dir, url)
+    with open(path, 'w', encoding='utf-8') as fixture_file:
+        fixture_file.write(page_source)
+    return path
+
+
+class HttpEngine:
+    """
+    Extracts listing detail pages over plain HTTP, without a browser.
+    """
+
+    def __init__(self, pool_size=10, timeout=15, retries=2, fixture_dir=None, metrics=None):
+        """
+        Args:
+            pool_size (int): The number of keep-alive connections kept per host.
+            timeout (float): The request timeout in seconds.
+            retries (int): The number of retries for failed connections and 5xx responses.
+            fixture_dir (str): If set, pages are read from saved fixtures instead of the network.
+            metrics (CrawlMetrics): Where fetch and parse times, bytes and retries are recorded.
+        """
+        self.timeout = timeout
+        self.fixture_dir = fixture_dir
+        self.metrics = metrics if metrics is not None else CrawlMetrics()
+
+        self.session = requests.Session()
+        self.session.headers.update({"User-Agent": USER_AGENT, "Accept-Language": "cs,en;q=0.8"})
+        retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def fetch(self, url):
+        """
+        Returns the HTML of the given URL, from the fixtures if configured.
+
+        Args:
+            url (str): The URL to fetch.
+
+        Returns:
+            str: The HTML of the page.
+        """
+        if self.fixture_dir is not None:
+            with open(fixture_path(self.fixture_dir, url), encoding='utf-8') as fixture_file:
+                self.metrics.count('bytes_fetched', os.fstat(fixture_file.fileno()).st_size)
+                return fixture_file.read()
+
+        with self.metrics.stage('http_fetch'):
+            response = self.session.get(url, timeout=self.timeout)
+
+        # urllib3 keeps the retries of this request in the history of its Retry object
+        retries = getattr(response.raw, 'retries', None)
+        if retries is not None and retries.history:
+            self.metrics.count('retries', len(retries.history))
+        self.metrics.count('bytes_fetched', len(response.content))
+
+        response.raise_for_status()
+        return response.text
+
+    def extract_info(self, url):
+        """
+        Extracts the listing data from the given URL.
+
+        Args:
+            url (str): The URL to extract information from.
+
+        Returns:
+            dict: The extracted data, or None if the page could not be fetched or parsed.
+        """
+        try:
+            page_source = self.fetch(url)
+            with self.metrics.stage('http_parse'):
+                data = parse_listing_html(page_source, url)
+        except (requests.RequestException, OSError, etree.LxmlError) as e:
+            logging.warning(f"HTTP engine could not extract {url}: {e}")
+            self.metrics.count('http_errors')
+            return None
+
+        # Without the core fields the page was not server-rendered as expected
+        if data["LOKACE"] is None and data["CENA"] is None:
+            logging.warning(f"HTTP engine found no listing data on {url}.")
+            return None
+
+        return data
+
+    def close(self):
+        """
+        Closes the pooled connections.
+        """
+        self.session.close()
@@ -0,0 +1,222 @@
+import logging
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pyarrow import csv
+from pandas.api.types import union_categoricals
+from datahandler import (DataHandler, map_unique_values, NON_DIGIT_PATTERN, COLS_BOOLEAN, COLS_DISTANCE, COLS_PRICE,
+                         CLEANED_SCHEMA)
+from listingwriter import LISTING_COLUMNS, read_csv_header
+
+# Older scrapes wrote the energy fees under a misspelled title, its values are merged into 'POPLATKY ZA ENERGIE'
+LEGACY_ENERGY_COLUMN = 'POPLATKY ZA ENERGII'
+
+# Low-cardinality text columns are parsed straight into categoricals
+TEXT_COLUMNS = ['TYP NABÍDKY', 'LOKACE', 'DISPOZICE', 'STAV', 'VLASTNICTVÍ', 'TYP BUDOVY', 'VYBAVENO', 'PENB']
+
+# Columns holding amounts with units, such as "2 750 000 Kč", "61 m²" or "1 324 m"
+AMOUNT_COLUMNS = COLS_PRICE + [LEGACY_ENERGY_COLUMN, 'PLOCHA'] + COLS_DISTANCE
+
+# The size of the CSV blocks parsed at once, roughly 50 000 listings
+DEFAULT_BLOCK_SIZE = 16 * 2**20
+
+
+def parse_amount(text):
+    """
+    Parses an amount written with units and thousands separators, such as "2 750 000 Kč", "61 m²" or "1 324 m".
+
+    Args:
+        text (str): The scraped text.
+
+    Returns:
+        float: The parsed number, NaN if the text has no digits.
+    """
+    digits = NON_DIGIT_PATTERN.sub('', text)
+    return float(digits) if digits else np.nan
+
+
+def parse_float(text):
+    """
+    Parses a plain number such as the floor "9.0".
+
+    Args:
+        text (str): The scraped text.
+
+    Returns:
+        float: The parsed number, NaN if the text is not a number.
+    """
+    try:
+        return float(text)
+    except ValueError:
+        return np.nan
+
+
+# Converters of the formatted numeric columns, applied to their distinct values only
+CSV_CONVERTERS = {
+    **{col: parse_amount for col in AMOUNT_COLUMNS},
+    'PODLAŽÍ': parse_float,
+}
+
+# Declared types of the columns read from the listings CSV, formatted numbers are read dictionary-encoded so every
+# distinct text is converted only once
+CSV_TYPES = {
+    'URL': pa.string(),
+    **{col: pa.dictionary(pa.int32(), pa.string()) for col in TEXT_COLUMNS + list(CSV_CONVERTERS)},
+    **{col: pa.float32() for col in COLS_BOOLEAN},
+}
+
+
+def convert_column(series, converter):
+    """
+    Converts a column of formatted numbers, calling the converter once per distinct text.
+
+    Args:
+        series (pd.Series): The column as read from the CSV file.
+        converter (callable): Parses one text into a float.
+
+    Returns:
+        pd.Series: The parsed numbers, NaN where the input was null.
+    """
+    parsed = map_unique_values(series, lambda uniques: uniques.map(converter))
+    return pd.Series(parsed, index=series.index, dtype=float)
+
+
+def check_listings_header(file_name):
+    """
+    Checks that a listings CSV file has every listing column, older files may have the energy fees under the
+    misspelled title instead.
+
+    Args:
+        file_name (str): The name of the CSV file.
+
+    Returns:
+        list: The column names of the file's header.
+
+    Raises:
+        ValueError: If the header lacks some of the listing columns.
+    """
+    header = read_csv_header(file_name) or []
+    present = set(header) | ({'POPLATKY ZA ENERGIE'} if LEGACY_ENERGY_COLUMN in header else set())
+    missing = [col for col in LISTING_COLUMNS if col not in present]
+    if missing:
+        raise ValueError(f"Schema mismatch: {file_name} has no {', '.join(missing)} columns.")
+    return header
+
+
+def read_listings_chunks(file_name, block_size=DEFAULT_BLOCK_SIZE, start_byte=0, first_row=0):
+    """
+    Streams the listings CSV in typed chunks, skipping columns the cleaning does not use.
+
+    Args:
+        file_name (str): The name of the CSV file.
+        block_size (int): The number of bytes parsed per chunk.
+        start_byte (int): The offset of the first row to read, 0 reads the file from its header.
+        first_row (int): The index of the first row read.
+
+    Yields:
+        pd.DataFrame: The next chunk with all CSV_TYPES columns, the index continuing across chunks.
+
+    Raises:
+        ValueError: If the header lacks listing columns or a row does not have the header's number of columns.
+    """
+    header = check_listings_header(file_name)
+    read_options = csv.ReadOptions(block_size=block_size)
+    if start_byte:
+        # A read from the middle of the file takes the column names from its header
+        read_options.column_names = header
+
+    convert_options = csv.ConvertOptions(column_types=CSV_TYPES, include_columns=list(CSV_TYPES),
+                                         include_missing_columns=True, strings_can_be_null=True)
+    with open(file_name, 'rb') as csv_file:
+        csv_file.seek(start_byte)
+        try:
+            for batch in csv.open_csv(csv_file, read_options=read_options, convert_options=convert_options):
+                chunk = batch.to_pandas()
+                chunk.index = pd.RangeIndex(first_row, first_row + len(chunk))
+                first_row += len(chunk)
+
+                for col, converter in CSV_CONVERTERS.items():
+                    chunk[col] = convert_column(chunk[col], converter)
+
+                # Merge the misspelled energy fees column into the current one
+                chunk['POPLATKY ZA ENERGIE'] = chunk['POPLATKY ZA ENERGIE'].fillna(chunk.pop(LEGACY_ENERGY_COLUMN))
+                yield chunk
+        except pa.ArrowInvalid as e:
+            # Rows written in another layout than the header's cannot be read by name, the file has to be fixed
+            raise ValueError(f"Schema mismatch: {file_name} has rows that do not match its {len(header)} column "
+                             f"header: {e}") from e
+
+
+def concat_cleaned(frames):
+    """
+    Concatenates cleaned chunks, keeping categorical columns categorical when their categories differ.
+
+    Args:
+        frames (list): The cleaned DataFrames, all with the same columns.
+
+    Returns:
+        pd.DataFrame: The combined DataFrame.
+    """
+    index = frames[0].index.append([frame.index for frame in frames[1:]])
+    columns = {}
+    for col in frames[0].columns:
+        dtype = CLEANED_SCHEMA.get(col)
+        if dtype == 'category' and not isinstance(dtype, pd.CategoricalDtype):
+            categorical = union_categoricals([frame[col] for frame in frames], sort_categories=True)
+            columns[col] = pd.Series(categorical, index=index)
+        else:
+            # Columns with a fixed dtype, including the LOKACE categories, concatenate as they are
+            columns[col] = pd.concat([frame[col] for frame in frames])
+    return pd.DataFrame(columns, index=index)
+
+
+def clean_chunks(chunks, first_row=0):
+    """
+    Cleans chunks of raw listings as they arrive, so memory is bounded by one raw chunk plus the cleaned output.
+
+    Args:
+        chunks (iterable): The raw chunks from read_listings_chunks.
+        first_row (int): The index of the first row of the first chunk.
+
+    Returns:
+        tuple: The cleaned listings with their 'URL' column, keeping only the most recently scraped version of each URL,
+            the URLs of all rows read, and the index of the row after the last one read.
+    """
+    cleaned_chunks = []
+    last_rows = {}
+    next_row = first_row
+    for chunk in chunks:
+        # Remember the row of the latest version of every URL, later chunks overwrite earlier ones
+        urls = chunk['URL']
+        last_rows.update(zip(urls.to_numpy(dtype=object), chunk.index))
+        next_row += len(chunk)
+
+        cleaned = DataHandler(chunk).clean_data(verbose=False)
+        cleaned['URL'] = urls.loc[cleaned.index]
+        cleaned_chunks.append(cleaned)
+
+    if not cleaned_chunks:
+        empty = pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in CLEANED_SCHEMA.items()})
+        return empty.assign(URL=pd.Series(dtype=object)), set(), next_row
+
+    cleaned = concat_cleaned(cleaned_chunks)
+
+    # Drop versions of a listing that were superseded in a later chunk
+    cleaned = cleaned[cleaned.index.isin(np.fromiter(last_rows.values(), dtype=np.int64, count=len(last_rows)))]
+    return cleaned, set(last_rows), next_row
+
+
+def load_listings(file_name, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Loads and cleans the listings CSV chunk by chunk.
+
+    Args:
+        file_name (str): The name of the CSV file.
+        block_size (int): The number of bytes parsed per chunk.
+
+    Returns:
+        pd.DataFrame: The cleaned listings, only the most recently scraped version of each URL is kept.
+    """
+    cleaned, _, rows = clean_chunks(read_listings_chunks(file_name, block_size))
+    logging.info(f"Loaded {len(cleaned)} cleaned listings from {rows} rows of {file_name}.")
+    return cleaned.drop(columns='URL')
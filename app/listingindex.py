@@ -0,0 +1,160 @@
+import hashlib
+import json
+import logging
+import sqlite3
+from datetime import datetime
+
+
+def content_hash(content):
+    """
+    Returns a stable hash of a listing card text or an extracted listing dictionary.
+
+    Args:
+        content (str or dict): The content to hash.
+
+    Returns:
+        str: The hex digest of the content.
+    """
+    if not isinstance(content, str):
+        content = json.dumps(content, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+class ListingIndex:
+    """
+    A persistent SQLite index of the listings seen by previous crawls.
+    """
+
+    def __init__(self, db_path):
+        """
+        Args:
+            db_path (str): The path to the SQLite database file.
+        """
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS listings (
+                url TEXT PRIMARY KEY,
+                listing_id TEXT,
+                first_seen TEXT NOT NULL,
+                last_seen TEXT NOT NULL,
+                card_hash TEXT,
+                content_hash TEXT,
+                removed_at TEXT
+            )
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS listings_listing_id ON listings (listing_id)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS sweeps (finished_at TEXT NOT NULL)")
+        self.connection.commit()
+        self.run_started = None
+
+    def start_run(self):
+        """
+        Marks the start of a crawl, listings not seen after this moment can later be marked as removed.
+        """
+        self.run_started = self._now()
+
+    def needs_update(self, url, card_hash):
+        """
+        Checks whether the detail page of a listing has to be downloaded.
+
+        Args:
+            url (str): The URL of the listing.
+            card_hash (str): The hash of the listing card on the results page.
+
+        Returns:
+            bool: True if the listing is new, was removed before, or its card changed.
+        """
+        row = self.connection.execute("SELECT card_hash, removed_at FROM listings WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return True
+
+        known_card_hash, removed_at = row
+        return removed_at is not None or known_card_hash != card_hash
+
+    def touch(self, url):
+        """
+        Records that an unchanged listing is still online.
+
+        Args:
+            url (str): The URL of the listing.
+        """
+        self.connection.execute("UPDATE listings SET last_seen = ?, removed_at = NULL WHERE url = ?", (self._now(), url))
+        self.connection.commit()
+
+    def record(self, url, data, card_hash=None):
+        """
+        Stores a freshly extracted listing.
+
+        Args:
+            url (str): The URL of the listing.
+            data (dict): The extracted listing data.
+            card_hash (str): The hash of the listing card on the results page.
+
+        Returns:
+            bool: True if the listing is new or its content changed since the last crawl.
+        """
+        new_hash = content_hash(data)
+        now = self._now()
+        row = self.connection.execute("SELECT content_hash FROM listings WHERE url = ?", (url,)).fetchone()
+
+        self.connection.execute("""
+            INSERT INTO listings (url, listing_id, first_seen, last_seen, card_hash, content_hash, removed_at)
+            VALUES (?, ?, ?, ?, ?, ?, NULL)
+            ON CONFLICT (url) DO UPDATE SET
+                listing_id = excluded.listing_id,
+                last_seen = excluded.last_seen,
+                card_hash = excluded.card_hash,
+                content_hash = excluded.content_hash,
+                removed_at = NULL
+        """, (url, data.get('ČÍSLO INZERÁTU'), now, now, card_hash, new_hash))
+        self.connection.commit()
+
+        return row is None or row[0] != new_hash
+
+    def mark_removed(self):
+        """
+        Marks listings that were not seen since the start of the current run as removed.
+
+        Returns:
+            int: The number of listings marked as removed.
+        """
+        if self.run_started is None:
+            raise RuntimeError("start_run() must be called before mark_removed().")
+
+        now = self._now()
+        cursor = self.connection.execute(
+            "UPDATE listings SET removed_at = ? WHERE last_seen < ? AND removed_at IS NULL", (now, self.run_started))
+        self.connection.execute("INSERT INTO sweeps (finished_at) VALUES (?)", (now,))
+        self.connection.commit()
+        logging.info(f"Marked {cursor.rowcount} listings as removed.")
+        return cursor.rowcount
+
+    def last_sweep(self):
+        """
+        Returns when a crawl that saw every page last marked the removed listings.
+
+        Returns:
+            datetime: The time of the last sweep, None if no crawl has seen every page yet.
+        """
+        finished_at = self.connection.execute("SELECT MAX(finished_at) FROM sweeps").fetchone()[0]
+        return datetime.fromisoformat(finished_at) if finished_at is not None else None
+
+    def removed_listings(self):
+        """
+        Returns the URLs of listings that have disappeared from the website.
+
+        Returns:
+            list: The URLs of the removed listings.
+        """
+        return [row[0] for row in self.connection.execute("SELECT url FROM listings WHERE removed_at IS NOT NULL")]
+
+    def close(self):
+        """
+        Closes the database connection.
+        """
+        self.connection.close()
+
+    @staticmethod
+    def _now():
+        return datetime.now().isoformat(timespec='microseconds')
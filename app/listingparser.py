@@ -0,0 +1,158 @@
+import re
+from lxml import html as lxml_html
+
+# Locations of the listing detail page sections, shared by the Selenium and HTTP engines
+LOKACE_XPATH = '/html/body/div[1]/main/div[2]/section/div/div[1]/span/span[1]/span[2]/a'
+TYP_NABIDKY_XPATH = '//*[@id="__next"]/main/div[1]/div/div[1]/nav/ol/li[3]/a'
+CENA_XPATH = '/html/body/div[1]/main/div[2]/section/div/div[2]/div/div/div[1]/div/div[1]/span[2]/strong'
+EXTRA_DATA_XPATH = '/html/body/div[1]/main/div[2]/section/div/div[2]/div/div/div[1]/div/div'
+PARAMETERS_AREA_XPATH = '/html/body/div[1]/main/div[2]/section/div/div[1]/div[4]/div'
+PARAMETERS_TABLES_XPATH = '/html/body/div[1]/main/div[2]/section/div/div[1]/div[4]/div/section'
+POI_AREA_XPATH = '/html/body/div[1]/main/div[2]/section/div/div[1]/section[1]/div/div[2]'
+POI_TABLES_XPATH = '/html/body/div[1]/main/div[2]/section/div/div[1]/section[1]/div/div[2]/div[1]'
+POI_ITEM_XPATH = './/div[@class="Poi_poiItem__o_ASS poiItem"]'
+POI_TITLE_XPATH = './/span[@class="Poi_poiItemContentType__N5P4D poiItemContentType"]'
+POI_VALUE_XPATH = './/div[@class="Poi_poiItemTimes__5AhQ0 poiItemTimes"]/strong'
+
+WHITESPACE_PATTERN = re.compile(r'[ \t\r\n]+')
+
+
+def parse_listing_html(page_source, url):
+    """
+    Parses a listing detail page into the same dictionary that WebScraper.extract_data returns.
+
+    Args:
+        page_source (str): The HTML of the listing page.
+        url (str): The URL of the listing page.
+
+    Returns:
+        dict: The extracted data.
+    """
+    tree = lxml_html.fromstring(page_source)
+
+    data = {"URL": url}
+    data.update(parse_basic_data(tree))
+    data.update(parse_table_data(tree))
+    data.update(parse_poi_data(tree))
+    return data
+
+
+def parse_basic_data(tree):
+    """
+    Parses the location, offer type, price and (for rentals) the extra price data.
+
+    Args:
+        tree (lxml.html.HtmlElement): The parsed listing page.
+
+    Returns:
+        dict: The extracted basic data.
+    """
+    data = {
+        "LOKACE": first_text(tree, LOKACE_XPATH),
+        "TYP NABÍDKY": first_text(tree, TYP_NABIDKY_XPATH),
+    }
+
+    data["CENA"] = first_text(tree, CENA_XPATH)
+    if data["TYP NABÍDKY"] != "PRODEJ":
+        data.update(parse_extra_data(tree))
+
+    return data
+
+
+def parse_extra_data(tree):
+    """
+    Parses the extra price data shown when the listing type is not "PRODEJ".
+
+    Args:
+        tree (lxml.html.HtmlElement): The parsed listing page.
+
+    Returns:
+        dict: The extracted extra data.
+    """
+    data = {}
+    for div in tree.xpath(EXTRA_DATA_XPATH):
+        title = first_text(div, './span[1]/span')
+        value = first_text(div, './span[2]/strong')
+        if title is None or value is None:
+            continue
+
+        data[title.replace('+', '')] = value
+
+    return data
+
+
+def parse_table_data(tree):
+    """
+    Parses the parameters tables.
+
+    Args:
+        tree (lxml.html.HtmlElement): The parsed listing page.
+
+    Returns:
+        dict: The extracted table data.
+    """
+    data = {}
+    if not tree.xpath(PARAMETERS_AREA_XPATH):
+        return data
+
+    for table in tree.xpath(PARAMETERS_TABLES_XPATH):
+        for row in table.iter('tr'):
+            title = first_text(row, './th')
+            if title is None:
+                title = "title"
+            value = first_text(row, './td')
+            if value is None:
+                value = first_text(row, './td/div/a/span/span[1]')
+            if value is None:
+                continue
+
+            if title != "":
+                data[title] = value
+            else:
+                data[value] = 1
+
+    return data
+
+
+def parse_poi_data(tree):
+    """
+    Parses the points of interest (POI) section.
+
+    Args:
+        tree (lxml.html.HtmlElement): The parsed listing page.
+
+    Returns:
+        dict: The extracted POI data.
+    """
+    data = {}
+    if not tree.xpath(POI_AREA_XPATH):
+        return data
+
+    for table in tree.xpath(POI_TABLES_XPATH):
+        for div in table.xpath(POI_ITEM_XPATH):
+            title = first_text(div, POI_TITLE_XPATH)
+            value = first_text(div, POI_VALUE_XPATH)
+            if title is None or value is None:
+                continue
+
+            data[title] = value.replace(u'\xa0', u' ')
+
+    return data
+
+
+def first_text(element, xpath):
+    """
+    Returns the normalized text of the first element matching the XPath.
+
+    Args:
+        element (lxml.html.HtmlElement): The element to search from.
+        xpath (str): The XPath of the wanted element.
+
+    Returns:
+        str: The element's text with collapsed whitespace, or None if not found.
+    """
+    matches = element.xpath(xpath)
+    if not matches:
+        return None
+    # Collapse whitespace the way the browser renders it
+    return WHITESPACE_PATTERN.sub(' ', matches[0].text_content()).strip()
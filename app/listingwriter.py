@@ -0,0 +1,139 @@
+import csv
+import os
+from datetime import date
+import pandas as pd
+
+# Define a dictionary to map scraped titles to the column names of the output schema
+COLUMN_MAPPING = {
+    'Poplatky za energie': 'POPLATKY ZA ENERGIE',
+    'Poplatky za služby': 'POPLATKY ZA SLUŽBY',
+    'Vratná kauce': 'VRATNÁ KAUCE'
+}
+
+# Define the fixed schema with the columns to include
+LISTING_COLUMNS = ['URL', 'CENA', 'POPLATKY ZA SLUŽBY', 'POPLATKY ZA ENERGIE', 'VRATNÁ KAUCE', 'TYP NABÍDKY', 'LOKACE',
+                   'ČÍSLO INZERÁTU', 'DISPOZICE', 'STAV', 'DOSTUPNÉ OD', 'VLASTNICTVÍ', 'TYP BUDOVY', 'PLOCHA',
+                   'VYBAVENO', 'PODLAŽÍ', 'PENB', 'Internet', 'Energie', 'Balkón', 'Terasa', 'Sklep', 'Lodžie',
+                   'Bezbariérový přístup', 'Parkování', 'Výtah', 'Garáž', 'MHD', 'Pošta', 'Obchod', 'Banka',
+                   'Restaurace', 'Lékárna', 'Škola', 'Mateřská škola', 'Sportoviště', 'Hřiště']
+
+# Amenity flags are scraped as 1 when present and missing otherwise
+FLAG_COLUMNS = ['Internet', 'Energie', 'Balkón', 'Terasa', 'Sklep', 'Lodžie', 'Bezbariérový přístup', 'Parkování',
+                'Výtah', 'Garáž']
+
+PARTITION_COLUMNS = ['SCRAPE DATE', 'TYP NABÍDKY']
+
+
+def records_to_frame(records):
+    """
+    Converts scraped listing dictionaries into a DataFrame with the fixed schema.
+
+    Args:
+        records (list): The scraped listing dictionaries.
+
+    Returns:
+        pd.DataFrame: The listings with exactly the LISTING_COLUMNS, text columns as strings and flags as UInt8.
+    """
+    df = pd.DataFrame.from_records(records).rename(columns=COLUMN_MAPPING)
+
+    # A title scraped under two names keeps its first occurrence
+    df = df.loc[:, ~df.columns.duplicated()].reindex(columns=LISTING_COLUMNS)
+
+    # Typed nulls keep the schema identical across batches, even for columns missing from a batch
+    text_columns = [col for col in LISTING_COLUMNS if col not in FLAG_COLUMNS]
+    df[text_columns] = df[text_columns].astype('string')
+    df[FLAG_COLUMNS] = df[FLAG_COLUMNS].apply(pd.to_numeric, errors='coerce').astype('UInt8')
+    return df
+
+
+def count_csv_rows(file_name):
+    """
+    Counts the data rows already written to a CSV file.
+
+    Args:
+        file_name (str): The name of the CSV file.
+
+    Returns:
+        int: The number of rows, 0 if the file does not exist.
+    """
+    if not os.path.isfile(file_name) or os.path.getsize(file_name) == 0:
+        return 0
+    return len(pd.read_csv(file_name, usecols=[0]))
+
+
+def read_csv_header(file_name):
+    """
+    Args:
+        file_name (str): The name of the CSV file.
+
+    Returns:
+        list: The column names of the file's header, None if the file does not exist or is empty.
+    """
+    if not os.path.isfile(file_name) or os.path.getsize(file_name) == 0:
+        return None
+    with open(file_name, newline='', encoding='utf-8') as csv_file:
+        return next(csv.reader(csv_file))
+
+
+def check_csv_header(file_name):
+    """
+    Checks that listings can be appended to a CSV file. Older files have other columns, such as the misspelled
+    'POPLATKY ZA ENERGII', and another order, appended rows follow that layout as long as it has every listing column.
+
+    Args:
+        file_name (str): The name of the CSV file.
+
+    Returns:
+        list: The columns appended rows are written in, None if the file is new and gets the fixed schema.
+
+    Raises:
+        ValueError: If the file's header lacks some of the listing columns.
+    """
+    header = read_csv_header(file_name)
+    if header is None:
+        return None
+
+    missing = [col for col in ['Index'] + LISTING_COLUMNS if col not in header]
+    if missing:
+        raise ValueError(f"Schema mismatch: {file_name} has no {', '.join(missing)} columns, "
+                         f"move it aside to start a new file before appending listings.")
+    return header
+
+
+def write_csv(df, file_name, first_index=1):
+    """
+    Appends listings to a CSV file in one vectorized write, in the layout of the file's header if it has one.
+
+    Args:
+        df (pd.DataFrame): The listings in the fixed schema.
+        file_name (str): The name of the CSV file.
+        first_index (int): The 'Index' value of the first appended row.
+
+    Returns:
+        pd.DataFrame: The written DataFrame including the 'Index' column.
+    """
+    df = df.copy()
+    df.insert(0, 'Index', range(first_index, first_index + len(df)))
+
+    # Write the header only when the file is new, otherwise every row needs the header's columns in its order
+    header = check_csv_header(file_name)
+    written = df if header is None else df.reindex(columns=header)
+    written.to_csv(file_name, mode='a', header=header is None, index=False, encoding='utf-8')
+    return df
+
+
+def write_parquet(df, root_path, scrape_date=None):
+    """
+    Appends listings to a Parquet dataset partitioned by scrape date and offer type.
+
+    Args:
+        df (pd.DataFrame): The listings in the fixed schema.
+        root_path (str): The root directory of the dataset.
+        scrape_date (str): The scrape date in ISO format, today by default.
+
+    Returns:
+        pd.DataFrame: The written DataFrame including the 'SCRAPE DATE' column.
+    """
+    df = df.assign(**{'SCRAPE DATE': scrape_date or date.today().isoformat()})
+    df.to_parquet(root_path, engine='pyarrow', partition_cols=PARTITION_COLUMNS, index=False)
+    return df
@@ -1,62 +1,327 @@
+import json
 import os
+from contextlib import nullcontext
+from datetime import date, datetime, timedelta
 import pandas as pd
-import dash
-from dash import dcc, html
-from dash.dependencies import Input, Output
-import plotly.express as px
-from webscraper import WebScraper, configure_logging
-from datahandler import DataHandler
-import threading
+from webscraper import configure_logging
+from crawlplanner import CrawlPlanner, plan_segments
+from drivermanager import DriverManager
+from listingindex import ListingIndex
+from listingwriter import check_csv_header
+from cache import CleanedListingsCache
+from datahandler import CLEANED_SCHEMA
+from pricemodel import PricePipeline, start_price_server
+from cube import ListingsCube, YEAR_COLUMN
+from comparables import ComparablesIndex, start_comparables_server
+from history import ListingsHistory, EXCEL_HISTORY_FILE, EXCEL_HISTORY_YEAR
+from dashboard import create_dashboard
+from scheduler import CrawlScheduler
+from metrics import CrawlMetrics, METRICS_FILE
 
 # Define constants
-chrome_driver_path = 'D:/chdriver/chromedriver.exe'
-url = "https://www.bezrealitky.cz/vypis/nabidka-pronajem/"
+chrome_driver_path = os.environ.get('CHROMEDRIVER_PATH', 'D:/chdriver/chromedriver.exe')
 csv_file = 'listings_data.csv'
+index_file = 'listings_index.sqlite'
+progress_file = 'crawl_progress.json'
+
+# The listings in the CSV file come from one year, recorded here by the crawls that write it together with where the
+# rows of the last crawl start until they are in the history. The bundled listings are the notebook's 2023 data
+# ('Data z roku').
+csv_year_file = 'listings_data_year.json'
+bundled_data_year = 2023
+
+# Crawls cover rentals and sales of flats in every region, one segment per offer type and region
+crawl_segments = plan_segments(['PRONÁJEM', 'PRODEJ'], ['BYT'])
+
+# The cleaned listings are cached here, keyed by a fingerprint of the CSV file and the cleaning version
+cleaned_cache_file = 'listings_cleaned.parquet'
+
+# Every crawl is also appended to the multi-year history, which starts with the converted 2022 Excel export
+history = ListingsHistory('listings_history')
+
+# The trained price model artifact, served on this port when it exists
+price_model_file = 'price_model.joblib'
+price_service_port = 8060
+
+# The k most similar listings of a flat are served on this port, from an index updated with every crawl
+comparables_port = 8070
+
+# The dashboard charts aggregates of the cleaned listings and checks for newly scraped ones every few seconds
+dashboard_port = 8050
+dashboard_refresh_interval = 5
+
+# Background crawls run this many seconds apart, listings they write are loaded at most every crawl_refresh_interval
+crawl_interval = 6 * 60 * 60
+crawl_refresh_interval = 30
+
+# The pages of all segments are fetched over HTTP by this many worker processes, which together send at most one
+# request every min_request_interval seconds
+crawl_processes = 4
+min_request_interval = 0.5
+
+# Crawls stop a segment at its first results page with only known listings, so they never see the listings that
+# disappeared. A crawl at least this many seconds after the last one that saw every page walks all pages again and
+# marks the listings it didn't see as removed.
+full_sweep_interval = 7 * 24 * 60 * 60
+
+# Listings the HTTP engine fails on are extracted with a headless, resource-blocking browser, started the first time
+# one fails, kept warm between crawls and restarted every driver_max_pages pages
+driver_max_pages = 200
+driver_manager = DriverManager(chrome_driver_path, max_pages=driver_max_pages, max_idle=1)
+
+def create_planner(index, on_flush=None, output_lock=None):
+    """
+    Function to create a crawl planner for the crawl segments, resuming an interrupted crawl. The planner walks all
+    pages of every segment if the last full sweep is older than full_sweep_interval.
+
+    Args:
+        index (ListingIndex): The seen-listings index of the crawls, closed by the caller.
+        on_flush (callable): Called with the number of listings after each batch written to the CSV file.
+        output_lock (threading.Lock): Held while a batch is written to the CSV file.
+
+    Returns:
+        planner (CrawlPlanner): The configured planner.
+    """
+    last_sweep = index.last_sweep()
+    full_sweep = last_sweep is None or datetime.now() - last_sweep >= timedelta(seconds=full_sweep_interval)
+    if full_sweep:
+        print("Crawling all pages to find the removed listings")
+
+    return CrawlPlanner(crawl_segments, workers=crawl_processes, min_request_interval=min_request_interval,
+                        index=index, stop_on_known_page=not full_sweep, output_file=csv_file,
+                        progress_file=progress_file, on_flush=on_flush, output_lock=output_lock,
+                        metrics=CrawlMetrics(METRICS_FILE), driver_manager=driver_manager)
 
 def start_scraping():
     """
     Function to start the scraping process.
     """
     configure_logging()
-    main_driver = WebScraper.init_driver(chrome_driver_path)
-    scraper = WebScraper(main_driver)
-    listings_data = scraper.scrape_listings(url)
-    print("Scraped listings data:")
-    print(listings_data)
+    seed_history()
+    planner = run_crawl()
+    print(f"Scraped {planner.listings_count} listings into {csv_file}")
+
+def crawl_in_background(scheduler):
+    """
+    Function to run one crawl for the background scheduler, streaming the listings into the CSV file.
+
+    Args:
+        scheduler (CrawlScheduler): The scheduler to report written listings to.
+    """
+    run_crawl(on_flush=scheduler.report, output_lock=scheduler.output_lock)
+
+def run_crawl(on_flush=None, output_lock=None):
+    """
+    Function to run one crawl into the CSV file and add its listings to the history, under the year it started in.
+    The CSV file keeps the listings of one year, so a crawl starting in a new year first moves the previous year's
+    file aside, its listings are already in the history. The rows of an interrupted crawl are added to the history
+    by the crawl that resumes it.
 
-def load_data():
+    Args:
+        on_flush (callable): Called with the number of listings after each batch written to the CSV file.
+        output_lock (threading.Lock): Held while the CSV file is written or moved.
+
+    Returns:
+        planner (CrawlPlanner): The planner that ran the crawl.
     """
-    Function to load listings data from a CSV file or scrape it if the file doesn't exist.
+    year = date.today().year
+    with output_lock or nullcontext():
+        # An interrupted crawl's rows are not in the history yet, they start where that crawl started
+        start_byte = crawl_start()
+        if year != data_year() and os.path.isfile(csv_file):
+            if start_byte is not None:
+                history.append_csv(csv_file, data_year(), start_byte)
+                start_byte = None
+            past_file = f'{os.path.splitext(csv_file)[0]}_{data_year()}.csv'
+            os.replace(csv_file, past_file)
+            print(f"Moved the listings of {data_year()} to {past_file}")
+        if start_byte is None:
+            start_byte = csv_size()
+        save_csv_state(year, start_byte)
+
+        # Fail before crawling if the listings cannot be appended to the CSV file
+        check_csv_header(csv_file)
+
+    index = ListingIndex(index_file)
+    try:
+        planner = create_planner(index, on_flush=on_flush, output_lock=output_lock)
+        planner.crawl()
+    finally:
+        index.close()
+
+    # The listings of the crawl become a new batch of the history, only then the crawl is done
+    history.append_csv(csv_file, year, start_byte)
+    save_csv_state(year)
+    return planner
+
+def load_data(resume=True):
+    """
+    Function to load the cleaned listings data from a CSV file or scrape it if the file doesn't exist.
+    An interrupted crawl (one that left its progress file behind) is resumed first.
+
+    Args:
+        resume (bool): Whether to resume an interrupted crawl before loading, otherwise it is left to the caller.
 
     Returns:
-        listings_data (pd.DataFrame): DataFrame containing the listings data.
+        listings_data (pd.DataFrame): DataFrame containing the cleaned listings data, empty if the crawl wrote none.
     """
+    if not os.path.isfile(csv_file) or (resume and os.path.isfile(progress_file)):
+        # Scraped listings are streamed to the CSV file as they are extracted
+        run_crawl()
+
+    # A crawl that wrote nothing leaves no CSV file, the dashboard starts empty and refreshes once listings arrive
     if not os.path.isfile(csv_file):
-        configure_logging()
-        main_driver = WebScraper.init_driver(chrome_driver_path)
-        scraper = WebScraper(main_driver)
-        listings_data = scraper.scrape_listings(url)
-        
-        # Save scraped data to the CSV file
-        scraper.save_to_csv(csv_file)
-        listings_data = pd.read_csv(csv_file)
-    else:
-        listings_data = pd.read_csv(csv_file)
+        print(f"No listings in {csv_file} yet")
+        return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in CLEANED_SCHEMA.items()})
+
+    # Only rows not covered by the cleaned cache are parsed and cleaned
+    listings_data = CleanedListingsCache(cleaned_cache_file).load(csv_file)
 
     return listings_data
 
+def start_price_service():
+    """
+    Function to load the price model once and serve predictions in the background.
+
+    Returns:
+        server (ThreadingHTTPServer): The running prediction server, or None if no model has been trained.
+    """
+    if not os.path.isfile(price_model_file):
+        return None
+    return start_price_server(PricePipeline.load(price_model_file), port=price_service_port)
+
+def csv_size():
+    """
+    Function to get the size of the listings CSV file, where the rows of the next crawl will start.
+
+    Returns:
+        size (int): The size of the CSV file in bytes, 0 if it doesn't exist yet.
+    """
+    return os.path.getsize(csv_file) if os.path.isfile(csv_file) else 0
+
+def seed_history():
+    """
+    Function to start the history on the first run: the Excel export is converted and the listings in the CSV file
+    become the first batch of their year. The CSV file only holds the listings of its year, so seeding a year that
+    has no batches yet never counts a listing twice. Called once before any crawl, the history is not locked.
+    """
+    if os.path.isfile(EXCEL_HISTORY_FILE):
+        history.import_excel(EXCEL_HISTORY_FILE, EXCEL_HISTORY_YEAR)
+    if os.path.isfile(csv_file) and data_year() not in history.years():
+        history.append_csv(csv_file, data_year())
+
+def load_history(year):
+    """
+    Function to load the listings of the years before the CSV file from the history.
+
+    Args:
+        year (int): The year the listings in the CSV file come from.
+
+    Returns:
+        past_data (pd.DataFrame): The cleaned listings of the other years, with the year as 'ROK'.
+    """
+    return history.load([other_year for other_year in history.years() if other_year != year])
+
+def data_year():
+    """
+    Function to get the year the listings in the CSV file come from.
+
+    Returns:
+        year (int): The year recorded for the CSV file, bundled_data_year if none was recorded.
+    """
+    return read_csv_state().get('year', bundled_data_year)
+
+def crawl_start():
+    """
+    Function to get where the rows of a crawl that has not reached the history yet start in the CSV file.
+
+    Returns:
+        start_byte (int): The size of the CSV file before that crawl, None if every crawl is in the history.
+    """
+    return read_csv_state().get('crawl_start')
+
+def read_csv_state():
+    """
+    Function to read the state recorded for the CSV file.
+
+    Returns:
+        state (dict): The 'year' of the listings and the 'crawl_start' of an unfinished crawl, empty if none was
+            recorded.
+    """
+    if not os.path.isfile(csv_year_file):
+        return {}
+    with open(csv_year_file, encoding='utf-8') as year_file:
+        return json.load(year_file)
+
+def save_csv_state(year, start_byte=None):
+    """
+    Function to record the year the listings in the CSV file come from and where an unfinished crawl's rows start.
+
+    Args:
+        year (int): The year of the listings.
+        start_byte (int): The size of the CSV file before the running crawl, None once its rows are in the history.
+    """
+    temp_path = csv_year_file + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as year_file:
+        json.dump({'year': year, 'crawl_start': start_byte}, year_file)
+    os.replace(temp_path, csv_year_file)
+
 def main():
     """
     The main function that loads data, cleans it, analyzes it, and starts the Dash app.
     """
-    # Load data
-    df = load_data()
+    configure_logging()
 
-    # Clean and analyze data
-    data_handler = DataHandler(df)  # Pass the loaded DataFrame instead of the CSV file name
-    cleaned_df = data_handler.clean_data()
+    # Load the price model before serving anything
+    start_price_service()
+
+    # Start the history before the first crawl and before the crawls of the scheduler can write to it
+    seed_history()
+
+    # Load and clean data, only the very first crawl blocks
+    cleaned_df = load_data(resume=False)
     print(cleaned_df)
 
+    # Aggregate the listings once, later appends to the CSV only update the aggregates
+    year = data_year()
+    cube = ListingsCube(cleaned_df, year)
+
+    # Chart the earlier years next to the current listings
+    past_df = load_history(year)
+    if len(past_df):
+        cube.add(past_df, past_df[YEAR_COLUMN].to_numpy())
+
+    # Index the current listings for comparables queries
+    comparables = ComparablesIndex(cleaned_df)
+    start_comparables_server(comparables, port=comparables_port)
+
+    cache = CleanedListingsCache(cleaned_cache_file)
+
+    def refresh():
+        # A crawl in a new year starts a new CSV file, so the year is read again
+        if not os.path.isfile(csv_file):
+            return
+        current_year = data_year()
+        changes = cache.load_changes(csv_file)
+        cube.apply_changes(changes, current_year)
+        comparables.apply_changes(changes)
+
+        # A rebuilt cube holds only the CSV file's listings, the earlier years are added again from the history
+        if changes[1] is None:
+            past_df = load_history(current_year)
+            if len(past_df):
+                cube.add(past_df, past_df[YEAR_COLUMN].to_numpy())
+
+    # Crawl in the background while the dashboard serves, an interrupted crawl is resumed right away
+    scheduler = CrawlScheduler(crawl_in_background, interval=crawl_interval, on_data=refresh,
+                               refresh_interval=crawl_refresh_interval)
+    scheduler.start()
+    if os.path.isfile(progress_file):
+        scheduler.request_crawl()
+
+    app = create_dashboard(cube, refresh_interval=dashboard_refresh_interval, scheduler=scheduler)
+    app.run(port=dashboard_port)
+
 
 if __name__ == "__main__":
     main()
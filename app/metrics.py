@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Structured metrics are written next to webscraper.log, one JSON object per line
+METRICS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "webscraper_metrics.jsonl")
+
+
+class CrawlMetrics:
+    """
+    Per-stage timers and counters of a crawl, shared by the scraper, its workers and the HTTP engine.
+    Stages can nest, e.g. 'parse' is part of 'listing'.
+    """
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str): The JSON lines file to append events and run summaries to, None to keep metrics in memory.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Clears all timers and counters and starts a new run.
+        """
+        with self._lock:
+            self.started = time.time()
+            self.stages = {}
+            self.counters = Counter()
+            self.timeouts = Counter()
+            self.missing_elements = Counter()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times the enclosed block as one call of a stage, also when it raises.
+
+        Args:
+            name (str): The name of the stage.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(name, time.perf_counter() - start)
+
+    def record_stage(self, name, seconds):
+        """
+        Args:
+            name (str): The name of the stage.
+            seconds (float): The duration of one call of the stage.
+        """
+        with self._lock:
+            calls, total, longest = self.stages.get(name, (0, 0.0, 0.0))
+            self.stages[name] = (calls + 1, total + seconds, max(longest, seconds))
+
+    def count(self, name, value=1):
+        """
+        Args:
+            name (str): The name of the counter, such as 'listings' or 'bytes_fetched'.
+            value (int): The amount to add.
+        """
+        with self._lock:
+            self.counters[name] += value
+
+    def merge(self, stages, counters):
+        """
+        Adds the timers and counters recorded by another CrawlMetrics, such as one in a worker process.
+
+        Args:
+            stages (dict): The other metrics' stages, (calls, total, longest) by name.
+            counters (dict): The other metrics' counters.
+        """
+        with self._lock:
+            for name, (calls, total, longest) in stages.items():
+                own_calls, own_total, own_longest = self.stages.get(name, (0, 0.0, 0.0))
+                self.stages[name] = (own_calls + calls, own_total + total, max(own_longest, longest))
+            self.counters.update(counters)
+
+    def timeout(self, locator, seconds):
+        """
+        Records a wait for an element that timed out.
+
+        Args:
+            locator (str): The XPath or other locator that was waited for.
+            seconds (float): How long the wait took.
+        """
+        with self._lock:
+            self.timeouts[locator] += 1
+        self.emit('timeout', locator=locator, seconds=round(seconds, 3))
+
+    def missing(self, locator):
+        """
+        Records an element that was not on a ready page.
+
+        Args:
+            locator (str): The XPath or other locator that was looked up.
+        """
+        with self._lock:
+            self.missing_elements[locator] += 1
+
+    def emit(self, event, **fields):
+        """
+        Appends one event to the metrics file, if there is one.
+
+        Args:
+            event (str): The event type, such as 'listing', 'page', 'timeout' or 'summary'.
+            **fields: The JSON-serializable fields of the event.
+        """
+        if self.path is None:
+            return
+
+        line = json.dumps({'time': time.time(), 'event': event, **fields}, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as metrics_file:
+                metrics_file.write(line + '\n')
+
+    def summary(self):
+        """
+        Returns:
+            dict: The run duration, throughput, counters, timeouts and missing elements per locator and the stages
+            sorted by total time.
+        """
+        with self._lock:
+            elapsed = time.time() - self.started
+            minutes = elapsed / 60 or 1
+            stages = sorted(self.stages.items(), key=lambda item: item[1][1], reverse=True)
+            return {
+                'elapsed': round(elapsed, 3),
+                'pages_per_minute': round(self.counters['pages'] / minutes, 2),
+                'listings_per_minute': round(self.counters['listings'] / minutes, 2),
+                'counters': dict(self.counters),
+                'timeouts': dict(self.timeouts.most_common()),
+                'missing': dict(self.missing_elements.most_common()),
+                'stages': {name: {'calls': calls, 'total': round(total, 3), 'mean': round(total / calls, 4),
+                                  'max': round(longest, 4)}
+                           for name, (calls, total, longest) in stages},
+            }
+
+    def report(self):
+        """
+        Logs a summary table of the run and appends it to the metrics file.
+
+        Returns:
+            dict: The summary, see summary().
+        """
+        summary = self.summary()
+        self.emit('summary', **summary)
+
+        counters = summary['counters']
+        lines = [f"Crawl summary: {summary['elapsed']:.1f} s, "
+                 f"{counters.get('pages', 0)} result pages ({summary['pages_per_minute']:.1f}/min), "
+                 f"{counters.get('listings', 0)} listings ({summary['listings_per_minute']:.1f}/min), "
+                 f"{counters.get('listings_failed', 0)} failed, {counters.get('http_fallbacks', 0)} HTTP fallbacks, "
+                 f"{counters.get('retries', 0)} retries, {counters.get('bytes_fetched', 0) / 2**20:.1f} MiB fetched",
+                 f"{'stage':<20} {'calls':>7} {'total s':>9} {'mean ms':>9} {'max ms':>9} {'% of run':>9}"]
+        for name, stage in summary['stages'].items():
+            lines.append(f"{name:<20} {stage['calls']:>7} {stage['total']:>9.1f} {stage['mean'] * 1000:>9.1f} "
+                         f"{stage['max'] * 1000:>9.1f} {stage['total'] / (summary['elapsed'] or 1):>9.1%}")
+        for locator, timeouts in summary['timeouts'].items():
+            lines.append(f"{timeouts} timeouts waiting for {locator}")
+        for locator, missing in summary['missing'].items():
+            lines.append(f"{missing} pages without {locator}")
+        logging.info('\n'.join(lines))
+        return summary
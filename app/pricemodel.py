@@ -0,0 +1,419 @@
+import argparse
+import json
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+from datahandler import COLS_BOOLEAN, COLS_DISTANCE
+
+# Define the order for each ordinal column, as in the modeling notebook
+DISPOZICE_ORDER = ['1+kk', '1+1', '2+kk', '2+1', '3+kk', '3+1', '4+kk', '4+1']
+PENB_ORDER = ['Unknown', 'G', 'F', 'E', 'D', 'C', 'B', 'A']
+VYBAVENO_ORDER = ['Unknown', 'Nevybaveno', 'Částečně', 'Vybaveno']
+
+ORDINAL_COLUMNS = {'Dispozice': DISPOZICE_ORDER, 'PENB': PENB_ORDER, 'Vybaveno': VYBAVENO_ORDER}
+
+# Create a mapping from category to number for each column
+ORDINAL_CODES = {col: {category: i for i, category in enumerate(order)} for col, order in ORDINAL_COLUMNS.items()}
+
+# The amenity flags the notebook model uses, 'Internet', 'Energie' and 'Bezbariérový přístup' are not among them
+FLAG_FEATURES = [col for col in COLS_BOOLEAN if col not in ('Internet', 'Energie', 'Bezbariérový přístup')]
+
+# The scaled input features in model order, followed by one 'Kraj_<region>' column per training region. The notebook
+# also feeds the model 'Price per m2', which is derived from the price being predicted, so it is left out here.
+NUMERIC_FEATURES = (['Dispozice', 'Plocha', 'Vybaveno', 'Podlaží', 'PENB'] + FLAG_FEATURES + COLS_DISTANCE
+                    + ['Data z roku'])
+
+# The best parameters found by the notebook's grid search
+XGBOOST_PARAMS = {'colsample_bytree': 0.7, 'learning_rate': 0.1, 'max_depth': 5, 'n_estimators': 100}
+
+DEFAULT_PORT = 8060
+
+
+def default_price_model():
+    """
+    Creates the XGBoost regressor the notebook selected.
+
+    Returns:
+        xgb.XGBRegressor: The unfitted model.
+    """
+    import xgboost as xgb
+
+    return xgb.XGBRegressor(objective='reg:squarederror', seed=42, **XGBOOST_PARAMS)
+
+
+def training_frame(cleaned, year):
+    """
+    Converts cleaned listings into the notebook's training columns.
+
+    Args:
+        cleaned (pd.DataFrame): The output of DataHandler.clean_data.
+        year (int): The year the listings were scraped in.
+
+    Returns:
+        pd.DataFrame: The sale listings with 'Cena', 'Kraj' and the input features.
+    """
+    sales = cleaned[cleaned['TYP NABÍDKY'] == 'PRODEJ']
+    df = pd.DataFrame({
+        'Cena': sales['CENA'],
+        'Kraj': sales['LOKACE'].astype(object),
+        'Dispozice': sales['DISPOZICE'].astype(object),
+        'Plocha': sales['PLOCHA'].astype(float),
+        'Vybaveno': sales['VYBAVENO'].astype(object),
+        'Podlaží': sales['PODLAŽÍ'].astype(float),
+        'PENB': sales['PENB'].astype(object),
+        **{col: sales[col].astype(float) for col in FLAG_FEATURES + COLS_DISTANCE},
+        'Data z roku': year,
+    })
+    return df.dropna(subset=['Plocha', 'Podlaží'] + COLS_DISTANCE)
+
+
+class PricePipeline:
+    """
+    The notebook's sale price model with its encoders and scalers, persisted as one artifact.
+    """
+
+    def __init__(self, model):
+        """
+        Args:
+            model: A regressor with fit and predict, such as default_price_model().
+        """
+        self.model = model
+        self.regions = []
+        self.scaler = StandardScaler()
+        self.scaler_cena = StandardScaler()
+
+    @property
+    def feature_columns(self):
+        return NUMERIC_FEATURES + [f'Kraj_{region}' for region in self.regions]
+
+    def fit(self, df):
+        """
+        Fits the scalers and the model.
+
+        Args:
+            df (pd.DataFrame): Listings with 'Cena', 'Kraj' and the input features, see training_frame.
+
+        Returns:
+            PricePipeline: The fitted pipeline.
+        """
+        features, target = self.fit_transform(df)
+        self.model.fit(features, target)
+        logging.info(f"Trained the price model on {len(df)} listings.")
+        return self
+
+    def fit_transform(self, df):
+        """
+        Fits the region encoding and the scalers, without the model.
+
+        Args:
+            df (pd.DataFrame): Listings with 'Cena', 'Kraj' and the input features, see training_frame.
+
+        Returns:
+            tuple: The scaled feature matrix in feature_columns order and the scaled target.
+        """
+        df = self.modelled(df)
+        self.regions = sorted(df['Kraj'].dropna().unique())
+        features = self._encode(df)
+        scaled = self.scaler.fit_transform(features[:, :len(NUMERIC_FEATURES)])
+        features[:, :len(NUMERIC_FEATURES)] = scaled
+
+        target = self.scaler_cena.fit_transform(df[['Cena']].to_numpy(dtype=float)).ravel()
+        return features, target
+
+    def transform_target(self, df):
+        """
+        Encodes, scales and returns the features and the target of listings, with the fitted scalers.
+
+        Args:
+            df (pd.DataFrame): Listings with 'Cena', 'Kraj' and the input features, see training_frame.
+
+        Returns:
+            tuple: The scaled feature matrix and the scaled target.
+        """
+        df = self.modelled(df)
+        target = self.scaler_cena.transform(df[['Cena']].to_numpy(dtype=float)).ravel()
+        return self.transform(df), target
+
+    @staticmethod
+    def modelled(df):
+        """
+        Args:
+            df (pd.DataFrame): Listings with 'Cena', 'Kraj' and the input features, see training_frame.
+
+        Returns:
+            pd.DataFrame: The listings the model covers.
+        """
+        # Dispositions outside the ordinal order are not modelled
+        return df[df['Dispozice'].isin(DISPOZICE_ORDER)]
+
+    def transform(self, listings):
+        """
+        Encodes and scales listings into the model's input matrix.
+
+        Args:
+            listings (pd.DataFrame or list): The listings as a DataFrame or a list of dictionaries with 'Kraj' and
+                the NUMERIC_FEATURES.
+
+        Returns:
+            np.ndarray: The feature matrix in feature_columns order.
+        """
+        features = self._encode(listings)
+
+        # StandardScaler.transform without its per-call validation, which dominates small batches
+        numeric = features[:, :len(NUMERIC_FEATURES)]
+        numeric -= self.scaler.mean_
+        numeric /= self.scaler.scale_
+        return features
+
+    def predict_batch(self, listings):
+        """
+        Predicts sale prices for a batch of listings in one vectorized pass.
+
+        Args:
+            listings (pd.DataFrame or list): The listings, see transform.
+
+        Returns:
+            np.ndarray: The predicted prices in CZK.
+        """
+        if len(listings) == 0:
+            return np.empty(0)
+
+        scaled_prices = self.model.predict(self.transform(listings))
+        return scaled_prices * self.scaler_cena.scale_[0] + self.scaler_cena.mean_[0]
+
+    def save(self, path):
+        """
+        Args:
+            path (str): The path to write the artifact to.
+        """
+        joblib.dump(self, path)
+
+    @staticmethod
+    def load(path):
+        """
+        Args:
+            path (str): The path to an artifact written by save.
+
+        Returns:
+            PricePipeline: The fitted pipeline.
+
+        Raises:
+            ValueError: If the artifact was trained on other input features.
+        """
+        pipeline = joblib.load(path)
+        if pipeline.scaler.n_features_in_ != len(NUMERIC_FEATURES):
+            raise ValueError(f"{path} was trained on {pipeline.scaler.n_features_in_} input features instead of "
+                             f"{len(NUMERIC_FEATURES)}, train it again.")
+        return pipeline
+
+    def _encode(self, listings):
+        # Plain column arrays avoid building a DataFrame for the common case of a few listings
+        if isinstance(listings, pd.DataFrame):
+            def column(col):
+                return listings[col].to_numpy(dtype=object)
+        else:
+            def column(col):
+                return [listing[col] for listing in listings]
+
+        features = np.zeros((len(listings), len(self.feature_columns)), dtype=np.float64)
+        for position, col in enumerate(NUMERIC_FEATURES):
+            if col in ORDINAL_COLUMNS:
+                features[:, position] = self._ordinal_codes(column(col), col)
+            else:
+                features[:, position] = np.asarray(column(col), dtype=np.float64)
+
+        # One-hot encode 'Kraj', unknown regions get no column like in the notebook
+        region_codes = self._lookup(column('Kraj'), {region: code for code, region in enumerate(self.regions)})
+        rows = np.flatnonzero(region_codes >= 0)
+        features[rows, len(NUMERIC_FEATURES) + region_codes[rows]] = 1
+        return features
+
+    @staticmethod
+    def _lookup(values, codes):
+        return np.fromiter((codes.get(value, -1) for value in values), dtype=np.int64, count=len(values))
+
+    @staticmethod
+    def _ordinal_codes(values, col):
+        order = ORDINAL_COLUMNS[col]
+        codes = PricePipeline._lookup(values, ORDINAL_CODES[col])
+
+        # Missing and unrecognized values, including the cleaned data's 'unknown', count as 'Unknown'
+        if order[0] == 'Unknown':
+            return np.where(codes < 0, 0, codes)
+
+        if (codes < 0).any():
+            unsupported = sorted({str(value) for value, code in zip(values, codes) if code < 0})
+            raise ValueError(f"Unsupported {col} values: {', '.join(unsupported)}")
+        return codes
+
+
+class BatchingPredictor:
+    """
+    Coalesces concurrent prediction requests into one predict_batch call, so the per-call cost of the model is paid
+    once per batch instead of once per request. Requests are never delayed to wait for others.
+    """
+
+    def __init__(self, pipeline, max_batch_size=4096):
+        """
+        Args:
+            pipeline (PricePipeline): The fitted pipeline.
+            max_batch_size (int): The maximum number of listings predicted in one call.
+        """
+        self.pipeline = pipeline
+        self.max_batch_size = max_batch_size
+        self.requests = queue.Queue()
+        threading.Thread(target=self._work, name='price-batcher', daemon=True).start()
+
+    def predict(self, listings):
+        """
+        Predicts prices for one request, blocking until its batch has been predicted.
+
+        Args:
+            listings (list): The listings as dictionaries.
+
+        Returns:
+            np.ndarray: The predicted prices in CZK.
+        """
+        future = Future()
+        self.requests.put((list(listings), future))
+        return future.result()
+
+    def _work(self):
+        while True:
+            # Take whatever requests queued up while the previous batch was predicted
+            batch = [self.requests.get()]
+            size = len(batch[0][0])
+            while size < self.max_batch_size:
+                try:
+                    request = self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(request)
+                size += len(request[0])
+
+            try:
+                prices = self.pipeline.predict_batch([listing for listings, _ in batch for listing in listings])
+            except Exception:
+                # One invalid request must not fail the others, so predict them one by one to isolate it
+                for listings, future in batch:
+                    self._predict_one(listings, future)
+                continue
+
+            offset = 0
+            for listings, future in batch:
+                future.set_result(prices[offset:offset + len(listings)])
+                offset += len(listings)
+
+    def _predict_one(self, listings, future):
+        try:
+            future.set_result(self.pipeline.predict_batch(listings))
+        except Exception as e:
+            future.set_exception(e)
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """
+    Serves POST /predict with a JSON list of listings, or an object with a 'listings' list, and answers with
+    {"prices": [...]}.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    # Headers and body are written separately, with Nagle's algorithm every response would wait for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self._send(404, {'error': 'Not found'})
+            return
+
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            listings = body['listings'] if isinstance(body, dict) else body
+            prices = self.server.predictor.predict(listings)
+        except KeyError as e:
+            self._send(400, {'error': f"Missing field {e}"})
+            return
+        except (ValueError, TypeError) as e:
+            self._send(400, {'error': str(e)})
+            return
+
+        self._send(200, {'prices': prices.tolist()})
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+
+def create_price_server(pipeline, host='127.0.0.1', port=DEFAULT_PORT):
+    """
+    Creates the prediction HTTP server around a loaded pipeline.
+
+    Args:
+        pipeline (PricePipeline): The fitted pipeline, shared by all requests.
+        host (str): The interface to listen on.
+        port (int): The port to listen on, 0 picks a free one.
+
+    Returns:
+        ThreadingHTTPServer: The server, not yet serving.
+    """
+    server = ThreadingHTTPServer((host, port), PredictionHandler)
+    server.daemon_threads = True
+    server.predictor = BatchingPredictor(pipeline)
+    return server
+
+
+def start_price_server(pipeline, host='127.0.0.1', port=DEFAULT_PORT):
+    """
+    Serves predictions from a background thread.
+
+    Args:
+        pipeline (PricePipeline): The fitted pipeline.
+        host (str): The interface to listen on.
+        port (int): The port to listen on, 0 picks a free one.
+
+    Returns:
+        ThreadingHTTPServer: The running server, stop it with shutdown().
+    """
+    server = create_price_server(pipeline, host, port)
+    threading.Thread(target=server.serve_forever, name='price-server', daemon=True).start()
+    logging.info(f"Serving price predictions on http://{host}:{server.server_address[1]}/predict")
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Train the price model or serve predictions from a saved one.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    train_parser = subparsers.add_parser('train', help="train on a scraped listings CSV and save the artifact")
+    train_parser.add_argument('csv_file')
+    train_parser.add_argument('model_path')
+    train_parser.add_argument('--year', type=int, required=True, help="the year the listings were scraped in")
+
+    serve_parser = subparsers.add_parser('serve', help="serve POST /predict from a saved artifact")
+    serve_parser.add_argument('model_path')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'train':
+        from ingest import load_listings
+
+        pipeline = PricePipeline(default_price_model()).fit(training_frame(load_listings(args.csv_file), args.year))
+        pipeline.save(args.model_path)
+    else:
+        create_price_server(PricePipeline.load(args.model_path), args.host, args.port).serve_forever()
@@ -0,0 +1,268 @@
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urljoin, urlparse
+from lxml import html as lxml_html
+from httpengine import HttpEngine
+from webscraper import LISTING_CARD_XPATH, NEXT_PAGE_XPATH
+
+DEFAULT_PORT = 8070
+
+MANIFEST_FILE = 'manifest.json'
+
+
+def page_key(url):
+    """
+    Returns the key a page is stored under: its path and query, so that result pages differing only in the page
+    number are kept apart.
+
+    Args:
+        url (str): The URL of the page.
+
+    Returns:
+        str: The path and query of the URL.
+    """
+    parsed = urlparse(url)
+    return (parsed.path or '/') + (f'?{parsed.query}' if parsed.query else '')
+
+
+class FixtureStore:
+    """
+    Recorded pages of one site, saved as HTML files in a directory with a JSON manifest that maps every page key to
+    its file. The site's origin is kept so that absolute links can be pointed to the replay server, and the first
+    result page of the recorded crawl so that it can be replayed from the start.
+    """
+
+    def __init__(self, root):
+        """
+        Args:
+            root (str): The directory of the store, created on the first save.
+        """
+        self.root = root
+        self.origin = None
+        self.start = None
+        self.pages = {}
+
+        manifest_path = os.path.join(root, MANIFEST_FILE)
+        if os.path.isfile(manifest_path):
+            with open(manifest_path, encoding='utf-8') as manifest_file:
+                manifest = json.load(manifest_file)
+            self.origin = manifest['origin']
+            self.start = manifest['start']
+            self.pages = manifest['pages']
+
+    def save(self, url, page_source):
+        """
+        Saves the HTML of a page and records it in the manifest.
+
+        Args:
+            url (str): The URL the page was recorded from.
+            page_source (str): The HTML of the page.
+
+        Returns:
+            str: The path of the written file.
+        """
+        parsed = urlparse(url)
+        origin = f'{parsed.scheme}://{parsed.netloc}'
+        if self.origin is None:
+            self.origin = origin
+        elif origin != self.origin:
+            raise ValueError(f"The store holds pages of {self.origin}, not of {origin}.")
+
+        key = page_key(url)
+        name = re.sub(r'[^\w.-]+', '_', key.strip('/')) or 'index'
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, f'{name}.html')
+        with open(path, 'w', encoding='utf-8') as page_file:
+            page_file.write(page_source)
+
+        self.pages[key] = os.path.basename(path)
+        self._write_manifest()
+        return path
+
+    def load(self, key):
+        """
+        Args:
+            key (str): The path and query of the page, see page_key().
+
+        Returns:
+            str: The HTML of the page, or None if it was not recorded.
+        """
+        name = self.pages.get(key)
+        if name is None:
+            return None
+        with open(os.path.join(self.root, name), encoding='utf-8') as page_file:
+            return page_file.read()
+
+    def _write_manifest(self):
+        # Written through a temporary file, so an interrupted recording keeps the previous manifest
+        manifest_path = os.path.join(self.root, MANIFEST_FILE)
+        with open(manifest_path + '.tmp', 'w', encoding='utf-8') as manifest_file:
+            json.dump({'origin': self.origin, 'start': self.start, 'pages': self.pages}, manifest_file, ensure_ascii=False, indent=1)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def record_crawl(store, url, max_pages=1, engine=None):
+    """
+    Records the result pages starting at the given URL and every listing linked from them, the way scrape_listings
+    walks them.
+
+    Args:
+        store (FixtureStore): The store to save the pages to.
+        url (str): The first result page.
+        max_pages (int): The maximum number of result pages to record.
+        engine (HttpEngine): The engine to fetch the pages with, a new one by default.
+
+    Returns:
+        int: The number of recorded pages.
+    """
+    engine = engine or HttpEngine()
+    store.start = page_key(url)
+    recorded = 0
+    for _ in range(max_pages):
+        page_source = engine.fetch(url)
+        store.save(url, page_source)
+        recorded += 1
+
+        # The listing links and the 'next' button are in the server-rendered results page
+        tree = lxml_html.fromstring(page_source)
+        for card in tree.xpath(LISTING_CARD_XPATH):
+            links = card.xpath('.//div[2]/h2//a/@href')
+            if not links:
+                continue
+            listing_url = urljoin(url, links[0])
+            try:
+                store.save(listing_url, engine.fetch(listing_url))
+                recorded += 1
+            except Exception as e:
+                logging.warning(f"Could not record {listing_url}: {e}")
+
+        next_links = tree.xpath(f'{NEXT_PAGE_XPATH}/@href')
+        if not next_links:
+            break
+        url = urljoin(url, next_links[0])
+
+    logging.info(f"Recorded {recorded} pages into {store.root}")
+    return recorded
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """
+    Serves GET requests with the recorded pages, their absolute links pointing back to the replay server.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        page_source = self.server.store.load(page_key(self.path))
+        if page_source is None:
+            self._send(404, 'Not recorded')
+            return
+
+        # Simulates the time the real site takes to answer
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        self.server.count_request()
+        self._send(200, page_source.replace(self.server.store.origin, self.server.base_url))
+
+    def _send(self, status, text):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """
+    The local stand-in for the recorded site. Its base_url replaces the recorded origin in the served pages, and
+    requests counts the pages served so far.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, store, host='127.0.0.1', port=DEFAULT_PORT, latency=0.0):
+        """
+        Args:
+            store (FixtureStore): The recorded pages.
+            host (str): The interface to listen on.
+            port (int): The port to listen on, 0 picks a free one.
+            latency (float): Seconds added to every response.
+        """
+        super().__init__((host, port), ReplayHandler)
+        self.store = store
+        self.latency = latency
+        self.base_url = f'http://{host}:{self.server_address[1]}'
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+
+def start_replay_server(store, host='127.0.0.1', port=DEFAULT_PORT, latency=0.0):
+    """
+    Serves the recorded pages from a background thread.
+
+    Args:
+        store (FixtureStore): The recorded pages.
+        host (str): The interface to listen on.
+        port (int): The port to listen on, 0 picks a free one.
+        latency (float): Seconds added to every response.
+
+    Returns:
+        ReplayServer: The running server, stop it with shutdown().
+    """
+    server = ReplayServer(store, host, port, latency)
+    threading.Thread(target=server.serve_forever, name='replay-server', daemon=True).start()
+    logging.info(f"Replaying {len(store.pages)} pages of {store.origin} on {server.base_url}")
+    return server
+
+
+def replay_url(server, url):
+    """
+    Args:
+        server (ReplayServer): The running replay server.
+        url (str): A URL of the recorded site.
+
+    Returns:
+        str: The same page on the replay server.
+    """
+    return server.base_url + page_key(url)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Record result and listing pages, or replay them locally.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = subparsers.add_parser('record', help="record the result pages from URL and their listings")
+    record_parser.add_argument('store')
+    record_parser.add_argument('url')
+    record_parser.add_argument('--pages', type=int, default=1)
+
+    serve_parser = subparsers.add_parser('serve', help="serve the recorded pages")
+    serve_parser.add_argument('store')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'record':
+        record_crawl(FixtureStore(args.store), args.url, args.pages)
+    else:
+        server = ReplayServer(FixtureStore(args.store), args.host, args.port, args.latency)
+        logging.info(f"Replaying on {server.base_url}")
+        server.serve_forever()
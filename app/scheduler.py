@@ -0,0 +1,178 @@
+import logging
+import threading
+import time
+
+
+class CrawlProgress:
+    """
+    The progress of the running crawl and the outcome of the last one, updated by the crawl thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.state = 'idle'
+        self.runs = 0
+        self.started = None
+        self.finished = None
+        self.listings = 0
+        self.last_error = None
+        self.refresh_error = None
+
+    def start(self):
+        with self._lock:
+            self.state = 'running'
+            self.runs += 1
+            self.started = time.time()
+            self.finished = None
+            self.listings = 0
+            self.last_error = None
+
+    def add_listings(self, count):
+        with self._lock:
+            self.listings += count
+
+    def finish(self, error=None):
+        with self._lock:
+            self.state = 'idle' if error is None else 'failed'
+            self.finished = time.time()
+            self.last_error = None if error is None else str(error)
+
+    def refreshed(self, error=None):
+        with self._lock:
+            self.refresh_error = None if error is None else str(error)
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: The state ('idle', 'running' or 'failed'), the number of crawls so far, the listings written by the
+            current or last crawl, its duration in seconds, its throughput in listings per minute, its error and the
+            error of the last failed load of its listings, None once a load succeeds again.
+        """
+        with self._lock:
+            if self.started is None:
+                elapsed = 0.0
+            else:
+                elapsed = (self.finished or time.time()) - self.started
+            return {
+                'state': self.state,
+                'runs': self.runs,
+                'listings': self.listings,
+                'elapsed': elapsed,
+                'listings_per_minute': self.listings / elapsed * 60 if elapsed else 0.0,
+                'last_error': self.last_error,
+                'refresh_error': self.refresh_error,
+            }
+
+
+class CrawlScheduler:
+    """
+    Runs crawls on a background thread, periodically or on demand, one at a time.
+    Listings written by a crawl are loaded by on_data on a second thread, at most once per refresh_interval, so the
+    crawl only waits for the dataset while writing a batch. The crawl writes its output holding output_lock, and
+    on_data reads it holding the same lock, so no partly written batch is ever loaded.
+    """
+
+    def __init__(self, crawl, interval=None, on_data=None, refresh_interval=30):
+        """
+        Args:
+            crawl (callable): Runs one crawl, called with the scheduler. It writes its output holding output_lock and
+                calls report with the number of listings after each written batch.
+            interval (float): Seconds from the end of a crawl to the next scheduled one, None to crawl only on demand.
+            on_data (callable): Called without arguments to load newly written listings into the live dataset.
+            refresh_interval (float): The minimum number of seconds between two calls of on_data during a crawl.
+        """
+        self.crawl = crawl
+        self.interval = interval
+        self.on_data = on_data
+        self.refresh_interval = refresh_interval
+        self.progress = CrawlProgress()
+        self.output_lock = threading.Lock()
+        self._requested = threading.Event()
+        self._new_data = threading.Event()
+        self._stopped = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """
+        Starts the crawl and refresh threads, the first scheduled crawl starts after one interval.
+        """
+        self._threads = [threading.Thread(target=self._run_crawls, name='crawl-scheduler', daemon=True)]
+        if self.on_data is not None:
+            self._threads.append(threading.Thread(target=self._run_refreshes, name='crawl-refresher', daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def request_crawl(self):
+        """
+        Starts a crawl as soon as the current one, if any, has finished.
+
+        Returns:
+            bool: False if a crawl was already requested and has not started yet.
+        """
+        if self._requested.is_set():
+            return False
+        self._requested.set()
+        return True
+
+    def stop(self, timeout=None):
+        """
+        Stops scheduling crawls and waits for the running crawl to finish.
+
+        Args:
+            timeout (float): The maximum number of seconds to wait for each thread, None to wait indefinitely.
+        """
+        self._stopped.set()
+        self._requested.set()
+        self._new_data.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def report(self, count):
+        """
+        Records a batch of listings written by the crawl, the batch is loaded by the next refresh.
+
+        Args:
+            count (int): The number of listings in the batch.
+        """
+        self.progress.add_listings(count)
+        self._new_data.set()
+
+    def _run_crawls(self):
+        while not self._stopped.is_set():
+            # Wait for a request or the next scheduled crawl, whichever comes first
+            self._requested.wait(self.interval)
+            if self._stopped.is_set():
+                break
+            self._requested.clear()
+
+            self.progress.start()
+            logging.info("Background crawl started.")
+            try:
+                self.crawl(self)
+            except Exception as e:
+                logging.error(f"Background crawl failed: {e}")
+                self.progress.finish(e)
+            else:
+                self.progress.finish()
+                logging.info(f"Background crawl finished, {self.progress.listings} listings written.")
+
+    def _run_refreshes(self):
+        while not self._stopped.is_set():
+            self._new_data.wait()
+            if self._stopped.is_set():
+                break
+            self._new_data.clear()
+
+            start = time.monotonic()
+            try:
+                with self.output_lock:
+                    self.on_data()
+            except Exception as e:
+                # The dashboard shows the error, otherwise it would silently keep charting stale listings
+                logging.error(f"Loading newly scraped listings failed: {e}")
+                self.progress.refreshed(e)
+            else:
+                self.progress.refreshed()
+
+            # Batches written meanwhile are loaded together on the next refresh
+            self._stopped.wait(max(0.0, self.refresh_interval - (time.monotonic() - start)))
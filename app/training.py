@@ -0,0 +1,342 @@
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import time
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.model_selection import KFold, ParameterGrid, train_test_split
+from featurestore import FeatureStore
+from pricemodel import PricePipeline, default_price_model, training_frame
+
+# The notebook's grid search over XGBoost
+XGBOOST_GRID = {
+    'colsample_bytree': [0.5, 0.7],
+    'n_estimators': [50, 100],
+    'max_depth': [2, 5, 7],
+    'learning_rate': [0.01, 0.1],
+}
+
+# Bump when PricePipeline's preprocessing changes, so that cached feature matrices are rebuilt
+FEATURES_VERSION = 3
+
+DEFAULT_CACHE_DIR = 'training_cache'
+
+
+def config_hash(config):
+    """
+    Args:
+        config (dict): A JSON-serializable configuration, values that are not are hashed by their repr.
+
+    Returns:
+        str: A stable hash of the configuration.
+    """
+    return hashlib.sha1(json.dumps(config, sort_keys=True, default=repr).encode('utf-8')).hexdigest()[:16]
+
+
+def model_config(model, params):
+    # Everything that changes the fitted model, except the thread count
+    config = clone(model).set_params(**params).get_params()
+    config.pop('n_jobs', None)
+    return {'model': type(model).__name__, 'params': config}
+
+
+class TrainingCache:
+    """
+    The preprocessed train and test matrices in a FeatureStore, versioned by a fingerprint of the training frame, and
+    the cross-validation scores and fitted models of the search candidates, keyed by their configuration, so that
+    re-runs only preprocess and train what changed.
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR):
+        """
+        Args:
+            root (str): The directory of the cache, created when first written to.
+        """
+        self.root = root
+        self.feature_store = FeatureStore(os.path.join(root, 'features'))
+        self.hits = 0
+        self.misses = 0
+
+    def features(self, df, test_size=0.2, random_state=42):
+        """
+        Splits the training frame like the notebook and preprocesses both parts, the preprocessing is fitted on the
+        train part only.
+
+        Args:
+            df (pd.DataFrame): The output of training_frame.
+            test_size (float): The share of listings held out for testing.
+            random_state (int): The seed of the split.
+
+        Returns:
+            tuple: The fitted preprocessor (a PricePipeline without a model), the features key, and the X_train,
+            X_test, y_train and y_test arrays, memory-mapped from the feature store.
+        """
+        fingerprint = pd.util.hash_pandas_object(df, index=False).to_numpy()
+        key = config_hash({'data': hashlib.sha1(fingerprint.tobytes()).hexdigest(), 'columns': list(df.columns),
+                           'version': FEATURES_VERSION, 'test_size': test_size, 'random_state': random_state})
+        preprocessor_path = self._path('preprocessors', f'{key}.joblib')
+
+        if self.feature_store.exists(key) and os.path.isfile(preprocessor_path):
+            logging.info(f"Loaded the preprocessed features {key} from the cache.")
+            preprocessor = joblib.load(preprocessor_path)
+        else:
+            train, test = train_test_split(df, test_size=test_size, random_state=random_state)
+            preprocessor = PricePipeline(None)
+            X_train, y_train = preprocessor.fit_transform(train)
+            X_test, y_test = preprocessor.transform_target(test)
+
+            if not self.feature_store.exists(key):
+                self.feature_store.write(key, {'X_train': X_train, 'X_test': X_test, 'y_train': y_train,
+                                               'y_test': y_test}, preprocessor.feature_columns,
+                                         split={'test_size': test_size, 'random_state': random_state,
+                                                'rows': len(df)})
+            os.makedirs(os.path.dirname(preprocessor_path), exist_ok=True)
+            joblib.dump(preprocessor, preprocessor_path)
+
+        # Even a fresh split is read back from the store, so every run trains on the same float32 arrays
+        features = self.feature_store.load(key)
+        return (preprocessor, key, features['X_train'], features['X_test'], features['y_train'],
+                features['y_test'])
+
+    def load_score(self, key):
+        """
+        Args:
+            key (str): The configuration hash of a candidate evaluation.
+
+        Returns:
+            dict: The cached evaluation, or None.
+        """
+        path = self._path('scores', f'{key}.json')
+        if not os.path.isfile(path):
+            self.misses += 1
+            return None
+        self.hits += 1
+        with open(path, encoding='utf-8') as score_file:
+            return json.load(score_file)
+
+    def save_score(self, key, evaluation):
+        """
+        Args:
+            key (str): The configuration hash of a candidate evaluation.
+            evaluation (dict): The evaluation, see evaluate_candidate.
+        """
+        path = self._path('scores', f'{key}.json')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as score_file:
+            json.dump(evaluation, score_file)
+
+    def fitted(self, key, fit):
+        """
+        Returns the model fitted for a configuration, fitting and caching it if needed.
+
+        Args:
+            key (str): The configuration hash of the model.
+            fit (callable): Fits and returns the model, called on a cache miss.
+
+        Returns:
+            The fitted model.
+        """
+        path = self._path('models', f'{key}.joblib')
+        if os.path.isfile(path):
+            self.hits += 1
+            return joblib.load(path)
+
+        self.misses += 1
+        model = fit()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        joblib.dump(model, path)
+        return model
+
+    def _path(self, kind, name):
+        return os.path.join(self.root, kind, name)
+
+
+def fit_model(model, X, y, early_stopping_rounds=None):
+    """
+    Fits a model, XGBoost models stop early on a held-out tenth of the data.
+
+    Args:
+        model: An unfitted regressor.
+        X (np.ndarray): The features.
+        y (np.ndarray): The target.
+        early_stopping_rounds (int): Rounds without improvement before XGBoost stops, None to fit every round.
+
+    Returns:
+        tuple: The fitted model and the number of boosting rounds it kept, None without early stopping.
+    """
+    if early_stopping_rounds is None or not hasattr(model, 'get_booster'):
+        return model.fit(X, y), None
+
+    X_fit, X_stop, y_fit, y_stop = train_test_split(X, y, test_size=0.1, random_state=42)
+    model.set_params(early_stopping_rounds=early_stopping_rounds)
+    model.fit(X_fit, y_fit, eval_set=[(X_stop, y_stop)], verbose=False)
+    return model, model.best_iteration + 1
+
+
+def evaluate_candidate(model, params, X, y, folds, n_samples, early_stopping_rounds):
+    """
+    Cross-validates one candidate on the first n_samples listings of a fixed shuffle of the training set.
+
+    Args:
+        model: The unfitted base regressor.
+        params (dict): The candidate's parameters.
+        X (np.ndarray): The training features.
+        y (np.ndarray): The training target.
+        folds (int): The number of cross-validation folds.
+        n_samples (int): The number of listings to evaluate on, see search.
+        early_stopping_rounds (int): See fit_model.
+
+    Returns:
+        dict: The parameters, the mean R² over the folds, the number of samples and the boosting rounds kept per fold.
+    """
+    rows = np.random.default_rng(42).permutation(len(y))[:n_samples]
+    X, y = X[rows], y[rows]
+
+    scores, rounds = [], []
+    for train_rows, test_rows in KFold(folds, shuffle=True, random_state=42).split(X):
+        fitted, kept = fit_model(clone(model).set_params(**params), X[train_rows], y[train_rows],
+                                 early_stopping_rounds)
+        scores.append(r2_score(y[test_rows], fitted.predict(X[test_rows])))
+        rounds.append(kept)
+
+    return {'params': params, 'score': float(np.mean(scores)), 'n_samples': int(n_samples), 'rounds': rounds}
+
+
+def search(model, grid, X, y, cache, features_key, strategy='halving', folds=5, factor=3, early_stopping_rounds=10,
+           n_jobs=-1):
+    """
+    Searches the parameter grid with cross-validation, in parallel over the candidates. With successive halving every
+    round keeps the best 1/factor of the candidates and evaluates them on factor times more listings, the last round
+    on the full training set. Evaluations are memoized by their configuration, so a re-run only trains new candidates.
+
+    Args:
+        model: The unfitted base regressor.
+        grid (dict): The parameter grid, in GridSearchCV's format.
+        X (np.ndarray): The training features.
+        y (np.ndarray): The training target.
+        cache (TrainingCache): Where the evaluations are memoized.
+        features_key (str): The key of the preprocessed features, see TrainingCache.features.
+        strategy (str): 'halving' or 'grid', which evaluates every candidate on the full training set.
+        folds (int): The number of cross-validation folds.
+        factor (float): The halving factor.
+        early_stopping_rounds (int): See fit_model.
+        n_jobs (int): The number of parallel jobs, -1 for all cores.
+
+    Returns:
+        list: The evaluations of the last round, best first.
+    """
+    if strategy not in ('halving', 'grid'):
+        raise ValueError(f"Unknown search strategy '{strategy}'.")
+
+    candidates = list(ParameterGrid(grid))
+    rounds = 1 if strategy == 'grid' else max(1, math.ceil(math.log(len(candidates), factor)))
+    min_samples = max(folds * 10, len(y) // factor ** (rounds - 1))
+
+    # Candidates run in parallel, so each model trains on a single thread
+    parallel_model = clone(model)
+    if 'n_jobs' in parallel_model.get_params():
+        parallel_model.set_params(n_jobs=1)
+
+    for round_number in range(rounds):
+        n_samples = len(y) if round_number == rounds - 1 else min(len(y), int(min_samples * factor ** round_number))
+        keys = [config_hash({'model': model_config(model, params), 'features': features_key, 'folds': folds,
+                             'n_samples': n_samples, 'early_stopping_rounds': early_stopping_rounds})
+                for params in candidates]
+        evaluations = {key: cache.load_score(key) for key in keys}
+
+        missing = [(key, params) for key, params in zip(keys, candidates) if evaluations[key] is None]
+        results = Parallel(n_jobs=n_jobs)(
+            delayed(evaluate_candidate)(parallel_model, params, X, y, folds, n_samples, early_stopping_rounds)
+            for _, params in missing)
+        for (key, _), evaluation in zip(missing, results):
+            cache.save_score(key, evaluation)
+            evaluations[key] = evaluation
+
+        ranked = sorted((evaluations[key] for key in keys), key=lambda evaluation: evaluation['score'], reverse=True)
+        logging.info(f"Search round {round_number + 1}/{rounds}: {len(candidates)} candidates on {n_samples} listings, "
+                     f"{len(missing)} trained, best R² {ranked[0]['score']:.4f} with {ranked[0]['params']}")
+        candidates = [evaluation['params'] for evaluation in ranked[:math.ceil(len(ranked) / factor)]]
+
+    return ranked
+
+
+def train_price_model(cleaned, year, model=None, grid=None, cache_dir=DEFAULT_CACHE_DIR, strategy='halving',
+                      folds=5, early_stopping_rounds=10, n_jobs=-1):
+    """
+    Preprocesses the cleaned listings, searches the model parameters and fits the best candidate on the whole
+    training set, reusing everything the cache already has.
+
+    Args:
+        cleaned (pd.DataFrame): The output of DataHandler.clean_data.
+        year (int): The year the listings were scraped in.
+        model: The unfitted base regressor, default_price_model() by default.
+        grid (dict): The parameter grid, XGBOOST_GRID by default.
+        cache_dir (str): The directory of the TrainingCache.
+        strategy (str): 'halving' or 'grid', see search.
+        folds (int): The number of cross-validation folds.
+        early_stopping_rounds (int): See fit_model.
+        n_jobs (int): The number of parallel jobs, -1 for all cores.
+
+    Returns:
+        tuple: The fitted PricePipeline and a report with the best parameters, their cross-validation R², the test
+        R² and mean absolute error in CZK, the cache hits and misses and the duration.
+    """
+    start = time.perf_counter()
+    model = model if model is not None else default_price_model()
+    grid = grid if grid is not None else XGBOOST_GRID
+    cache = TrainingCache(cache_dir)
+
+    pipeline, features_key, X_train, X_test, y_train, y_test = cache.features(training_frame(cleaned, year))
+    ranked = search(model, grid, X_train, y_train, cache, features_key, strategy, folds,
+                    early_stopping_rounds=early_stopping_rounds, n_jobs=n_jobs)
+    best = ranked[0]
+
+    # With early stopping the final model gets the median number of rounds the folds kept
+    params = dict(best['params'])
+    if all(kept is not None for kept in best['rounds']):
+        params['n_estimators'] = int(np.median(best['rounds']))
+
+    final_key = config_hash({'model': model_config(model, params), 'features': features_key, 'final': True})
+    pipeline.model = cache.fitted(final_key, lambda: clone(model).set_params(**params).fit(X_train, y_train))
+
+    # Test metrics in CZK, like the notebook reports them
+    scale, mean = pipeline.scaler_cena.scale_[0], pipeline.scaler_cena.mean_[0]
+    predicted = pipeline.model.predict(X_test) * scale + mean
+    actual = y_test * scale + mean
+    report = {
+        'best_params': params,
+        'cv_r2': best['score'],
+        'test_r2': float(r2_score(actual, predicted)),
+        'test_mae': float(mean_absolute_error(actual, predicted)),
+        'cache_hits': cache.hits,
+        'cache_misses': cache.misses,
+        'seconds': time.perf_counter() - start,
+    }
+    logging.info(f"Trained the price model in {report['seconds']:.1f} s: {report}")
+    return pipeline, report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Search the price model parameters and save the best model.")
+    parser.add_argument('csv_file')
+    parser.add_argument('model_path')
+    parser.add_argument('--year', type=int, required=True, help="the year the listings were scraped in")
+    parser.add_argument('--strategy', choices=['halving', 'grid'], default='halving')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--jobs', type=int, default=-1)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from ingest import load_listings
+
+    trained, _ = train_price_model(load_listings(args.csv_file), args.year, cache_dir=args.cache_dir,
+                                   strategy=args.strategy, folds=args.folds, n_jobs=args.jobs)
+    trained.save(args.model_path)
@@ -1,8 +1,11 @@
-import csv
 import logging
 import os
+import queue
+import threading
 import time
-import pandas as pd
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from urllib.parse import urlparse
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
@@ -10,6 +13,28 @@ from selenium.webdriver.remote.remote_connection import LOGGER
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from checkpoint import CrawlCheckpoint
+from httpengine import HttpEngine, USER_AGENT
+from listingindex import content_hash
+from listingwriter import records_to_frame, count_csv_rows, write_csv, write_parquet
+from metrics import CrawlMetrics
+from listingparser import LOKACE_XPATH, TYP_NABIDKY_XPATH, CENA_XPATH, parse_listing_html
+
+LISTING_CARD_XPATH = '//*[@id="__next"]/main/section/div/div[2]/div/div[5]/section/article'
+COOKIES_BUTTON_XPATH = "//button[@id='CybotCookiebotDialogBodyLevelButtonLevelOptinAllowAll']"
+
+# The cookies banner is rendered by a script shortly after the first page loads, a page without it costs this wait
+COOKIES_TIMEOUT = 5
+
+# The cookie the banner stores the consent in, a reused browser that has it shows no banner
+COOKIES_CONSENT_COOKIE = 'CookieConsent'
+NEXT_PAGE_XPATH = "//li[@class='page-item']/a[@class='page-link'][span[contains(text(), 'Další')]]"
+
+# A listing page is ready once its location or price is rendered, every other section is optional
+LISTING_READY_XPATH = f'{LOKACE_XPATH} | {CENA_XPATH}'
+
+# Fields every listing page should have, a missing one is reported
+BASIC_FIELD_XPATHS = {"LOKACE": LOKACE_XPATH, "TYP NABÍDKY": TYP_NABIDKY_XPATH, "CENA": CENA_XPATH}
 
 def configure_logging():
     # Set up the main logging configuration
@@ -45,13 +70,250 @@ def silence_third_party_loggers():
     logging.getLogger("selenium").setLevel(logging.WARNING)
     logging.getLogger("urllib3").setLevel(logging.WARNING)
 
+class HostRateLimiter:
+    """
+    Limits the number of concurrent requests and the request rate for each host.
+    """
+
+    def __init__(self, max_concurrent=2, min_interval=1.0):
+        """
+        Args:
+            max_concurrent (int): The maximum number of requests in flight per host.
+            min_interval (float): The minimum number of seconds between two request starts per host.
+        """
+        self.max_concurrent = max_concurrent
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_slot = {}
+
+    @contextmanager
+    def limit(self, url):
+        """
+        Blocks until a request to the host of the given URL is allowed, and holds the slot while in use.
+
+        Args:
+            url (str): The URL that is about to be requested.
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            semaphore = self._semaphores.setdefault(host, threading.BoundedSemaphore(self.max_concurrent))
+
+        semaphore.acquire()
+        try:
+            # Reserve the next free start time for this host
+            with self._lock:
+                now = time.monotonic()
+                slot = max(now, self._next_slot.get(host, now))
+                self._next_slot[host] = slot + self.min_interval
+            if slot > now:
+                time.sleep(slot - now)
+            yield
+        finally:
+            semaphore.release()
+
+
+class AdaptiveTimeout:
+    """
+    A page readiness timeout tuned from the recently observed readiness latencies: a multiple of their high
+    percentile, kept within fixed bounds. Until enough latencies have been observed the maximum is used.
+    """
+
+    def __init__(self, min_timeout=2.0, max_timeout=30.0, factor=3.0, percentile=95, window=50, min_samples=5):
+        """
+        Args:
+            min_timeout (float): The lower bound of the timeout in seconds.
+            max_timeout (float): The upper bound of the timeout in seconds, also used before there are enough samples.
+            factor (float): The multiple of the latency percentile used as the timeout.
+            percentile (float): The percentile of the recent latencies the timeout is derived from.
+            window (int): The number of most recent latencies kept.
+            min_samples (int): The number of latencies needed before the timeout is tuned.
+        """
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.factor = factor
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        """
+        Args:
+            seconds (float): How long a page took to become ready, or the timeout if it never did.
+        """
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def current(self):
+        """
+        Returns:
+            float: The timeout in seconds for the next page.
+        """
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return self.max_timeout
+            latencies = sorted(self._latencies)
+
+        rank = min(len(latencies) - 1, int(len(latencies) * self.percentile / 100))
+        return min(self.max_timeout, max(self.min_timeout, latencies[rank] * self.factor))
+
+
+class ListingWorkerPool:
+    """
+    A pool of WebDriver workers that pull listing URLs from a shared queue.
+    """
+
+    def __init__(self, driver_path, workers, rate_limiter=None, sleep_time=0, engine='selenium', metrics=None,
+                 page_timeout=None, driver_manager=None):
+        """
+        Args:
+            driver_path (str): The path to the chromedriver executable used for every worker.
+            workers (int): The number of drivers to run in parallel.
+            rate_limiter (HostRateLimiter): The per-host limiter shared by all workers.
+            sleep_time (int): The sleep time passed to every worker's scraper.
+            engine (str): The extraction engine passed to every worker's scraper.
+            metrics (CrawlMetrics): The metrics shared by every worker's scraper.
+            page_timeout (AdaptiveTimeout): The page readiness timeout shared by every worker's scraper.
+            driver_manager (DriverManager): Lends the workers' drivers, None to start a browser per worker.
+        """
+        self.driver_path = driver_path
+        self.workers = workers
+        self.rate_limiter = rate_limiter or HostRateLimiter(max_concurrent=workers, min_interval=0)
+        self.sleep_time = sleep_time
+        self.engine = engine
+        self.metrics = metrics
+        self.page_timeout = page_timeout
+        self.driver_manager = driver_manager
+        self.tasks = queue.Queue()
+        self.results = {}
+        self._results_lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        """
+        Starts one driver and one worker thread per worker.
+        """
+        for worker_id in range(self.workers):
+            # Drivers are created here so that a broken driver path fails loudly in the caller
+            if self.driver_manager is not None:
+                driver = self.driver_manager.acquire()
+            else:
+                driver = WebScraper.init_driver(self.driver_path)
+            scraper = WebScraper(driver, sleep_time=self.sleep_time, engine=self.engine, metrics=self.metrics,
+                                 page_timeout=self.page_timeout)
+            thread = threading.Thread(target=self._work, args=(scraper,), name=f"scraper-worker-{worker_id}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        logging.info(f"Started {self.workers} scraper workers.")
+
+    def _work(self, scraper):
+        """
+        Processes listing URLs from the queue until a stop signal is received.
+
+        Args:
+            scraper (WebScraper): The scraper owned by this worker.
+        """
+        try:
+            while True:
+                task = self.tasks.get()
+                if task is None:
+                    self.tasks.task_done()
+                    break
+
+                index, listing_url = task
+                try:
+                    start = time.perf_counter()
+                    with self.rate_limiter.limit(listing_url):
+                        scraper.metrics.record_stage('rate_limit_wait', time.perf_counter() - start)
+                        listing_data = scraper.extract_info(listing_url)
+                except Exception as e:
+                    logging.error(f"Error extracting data from {listing_url}: {e}")
+                    listing_data = None
+
+                with self._results_lock:
+                    self.results[index] = listing_data
+                self.tasks.task_done()
+        finally:
+            scraper.close_engine()
+            scraper.driver.quit()
+
+    def map(self, urls):
+        """
+        Extracts data from all given listing URLs using the workers.
+
+        Args:
+            urls (list): The listing URLs to extract.
+
+        Returns:
+            list: The extracted data in the same order as the URLs, with None for failed listings.
+        """
+        self.results = {}
+        for index, listing_url in enumerate(urls):
+            self.tasks.put((index, listing_url))
+        self.tasks.join()
+
+        return [self.results.get(index) for index in range(len(urls))]
+
+    def close(self):
+        """
+        Stops all worker threads and quits their drivers.
+        """
+        for _ in self._threads:
+            self.tasks.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+
 class WebScraper:
-    def __init__(self, driver, sleep_time=5):
+    def __init__(self, driver, sleep_time=0, driver_path=None, workers=1, max_per_host=2, min_request_interval=0.0,
+                 engine='selenium', index=None, stop_on_known_page=True, output_file=None, checkpoint_file=None,
+                 output_format='csv', write_batch_size=20, on_flush=None, output_lock=None, metrics=None,
+                 page_timeout=None, driver_manager=None):
         self.driver = driver
-        self.wait = WebDriverWait(self.driver, 30)
         self.listings_data = []
+        self.listings_count = 0
         self.sleep_time = sleep_time
 
+        # Pages are waited for once until they are ready, the timeout follows the observed page latencies
+        self.page_timeout = page_timeout if page_timeout is not None else AdaptiveTimeout()
+
+        # With an output file, records are streamed to disk in batches instead of being kept in listings_data
+        if output_format not in ('csv', 'parquet'):
+            raise ValueError(f"Unknown output format '{output_format}'.")
+        self.output_file = output_file
+        self.output_format = output_format
+        self.write_batch_size = write_batch_size
+        self.pending = []
+        self.csv_rows = {}
+        self.checkpoint = CrawlCheckpoint(checkpoint_file) if checkpoint_file else None
+
+        # A background scheduler is told about every written batch and can hold output_lock to read a consistent file
+        self.on_flush = on_flush
+        self.output_lock = output_lock
+
+        # Stage timings and counters, shared with the worker pool and the HTTP engine
+        self.metrics = metrics if metrics is not None else CrawlMetrics()
+
+        # The HTTP engine extracts listing pages without the browser, Selenium stays the fallback
+        if engine not in ('selenium', 'http'):
+            raise ValueError(f"Unknown extraction engine '{engine}'.")
+        self.engine = engine
+        self.http_engine = HttpEngine(metrics=self.metrics) if engine == 'http' else None
+
+        # The seen-listings index (ListingIndex) enables incremental crawls
+        self.index = index
+        self.stop_on_known_page = stop_on_known_page
+
+        # Worker pool settings, used only when workers > 1, the workers' drivers come from driver_manager if set
+        self.driver_path = driver_path
+        self.driver_manager = driver_manager
+        self.workers = workers
+        self.max_per_host = max_per_host
+        self.min_request_interval = min_request_interval
+
         
     @classmethod
     def init_driver(cls, driver_path):
@@ -71,11 +333,11 @@ class WebScraper:
         chrome_options.add_argument("--disable-notifications")
         chrome_options.add_argument("--disable-extensions")
         chrome_options.add_argument("--disable-infobars")
-        chrome_options.add_argument("--disable-fonts")
         chrome_options.add_argument("--disable-popup-blocking")
         # chrome_options.add_argument("--headless")  # Disable view of browser
-        chrome_options.add_argument("--disable-images")
-        chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/74.0.3729.169 Safari/537.36")
+        # Images are blocked by a content setting, Chrome ignores a --disable-images flag
+        chrome_options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+        chrome_options.add_argument(f"user-agent={USER_AGENT}")
         
         return chrome_options
 
@@ -89,20 +351,42 @@ class WebScraper:
         Returns:
             dict: The extracted data, or None if an error occurred.
         """
-        self.driver.get(url)
-        logging.info(f"Visiting URL: {url}")
-
+        start = time.perf_counter()
+        data = None
+        engine = 'http'
         try:
-            data = self.extract_data(url)
-            logging.info(f"Data extracted: {data}")
-            return data
-        except Exception as e:
-            logging.error(f"An error occurred while scraping the page: {str(e)}")
-            return None
+            if self.http_engine is not None:
+                data = self.http_engine.extract_info(url)
+                if data is not None:
+                    logging.info(f"Data extracted over HTTP: {data}")
+                    return data
+                logging.info(f"Falling back to Selenium for {url}")
+                self.metrics.count('http_fallbacks')
+
+            engine = 'selenium'
+            with self.metrics.stage('page_load'):
+                self.driver.get(url)
+            logging.info(f"Visiting URL: {url}")
+            self.wait_for_page(LISTING_READY_XPATH)
+
+            try:
+                data = self.extract_data(url)
+                logging.info(f"Data extracted: {data}")
+                return data
+            except Exception as e:
+                logging.error(f"An error occurred while scraping the page: {str(e)}")
+                return None
+        finally:
+            # Every listing is timed as a whole, whichever engine extracted it and however it ended
+            seconds = time.perf_counter() - start
+            self.metrics.record_stage('listing', seconds)
+            self.metrics.count('listings' if data is not None else 'listings_failed')
+            self.metrics.emit('listing', url=url, engine=engine, ok=data is not None, seconds=round(seconds, 3))
 
     def extract_data(self, url):
         """
-        Extracts and organizes data from the current page.
+        Extracts and organizes data from the current page. The rendered page is read from the browser once and parsed
+        locally with the HTTP engine's parser, instead of one WebDriver call per table row and cell.
 
         Args:
             url (str): The URL to extract information from.
@@ -110,275 +394,352 @@ class WebScraper:
         Returns:
             dict: The extracted data.
         """
-        data = {"URL": url}
-        data.update(self.extract_basic_data())
-        data.update(self.extract_table_data())
-        data.update(self.extract_poi_data())
+        with self.metrics.stage('page_source'):
+            page_source = self.driver.page_source
+        with self.metrics.stage('parse'):
+            data = parse_listing_html(page_source, url)
+
+        for field, locator in BASIC_FIELD_XPATHS.items():
+            if data[field] is None:
+                logging.warning(f"Unable to find the element in locaiton '{locator}' on the page.")
+                self.metrics.missing(locator)
+
         return data
 
-    def extract_basic_data(self):
+    def wait_for_page(self, locator):
         """
-        Extracts basic data from the current page.
+        Waits until the current page is ready, i.e. an element matching the locator is present. The wait is bounded
+        by the adaptive page timeout, and its duration tunes the timeout for the next pages.
+
+        Args:
+            locator (str): The XPath of the elements that mark the page as ready.
 
         Returns:
-            dict: The extracted basic data.
+            bool: True if the page became ready, False if the wait timed out.
         """
-        data = {
-            "LOKACE": self.try_extract_element(By.XPATH, '/html/body/div[1]/main/div[2]/section/div/div[1]/span/span[1]/span[2]/a'),
-            "TYP NABÍDKY": self.try_extract_element(By.XPATH, '//*[@id="__next"]/main/div[1]/div/div[1]/nav/ol/li[3]/a'),
-        }
-
-        cena_xpath = '/html/body/div[1]/main/div[2]/section/div/div[2]/div/div/div[1]/div/div[1]/span[2]/strong'
-        if data["TYP NABÍDKY"] != "PRODEJ":
-            data["CENA"] = self.try_extract_element(By.XPATH, cena_xpath)
-            data.update(self.extract_extra_data())
-        else:
-            data["CENA"] = self.try_extract_element(By.XPATH, cena_xpath)
-
-        return data
-
-    def extract_extra_data(self):
+        timeout = self.page_timeout.current()
+        start = time.perf_counter()
+        try:
+            WebDriverWait(self.driver, timeout, poll_frequency=0.1).until(
+                EC.presence_of_element_located((By.XPATH, locator)))
+            return True
+        except TimeoutException:
+            logging.warning(f"The page was not ready after {timeout:.1f} s.")
+            self.metrics.timeout(locator, time.perf_counter() - start)
+            return False
+        finally:
+            seconds = time.perf_counter() - start
+            self.page_timeout.observe(seconds)
+            self.metrics.record_stage('page_ready', seconds)
+
+    def save_to_csv(self, file_name, records=None):
         """
-        Extracts extra data from the current page when the listing type is not "PRODEJ".
+        Save the listings_data to a CSV file with a specified schema.
+
+        Args:
+        file_name (str): The name of the CSV file to save the data.
+        records (list): The listings to save instead of listings_data.
 
         Returns:
-            dict: The extracted extra data.
+        combined_df (pd.DataFrame): The DataFrame containing the data saved to the CSV file.
         """
-        data = {}
-        divs = self.driver.find_elements(By.XPATH, '/html/body/div[1]/main/div[2]/section/div/div[2]/div/div/div[1]/div/div')
+        df = records_to_frame(self.listings_data if records is None else records)
 
-        for div in divs:
-            try:
-                title_element = div.find_element(By.XPATH, './span[1]/span')
-                value_element = div.find_element(By.XPATH, './span[2]/strong')
-            except NoSuchElementException:
-                continue
+        # Continue the 'Index' column of the rows already in the file
+        if file_name not in self.csv_rows:
+            self.csv_rows[file_name] = count_csv_rows(file_name)
 
-            title = title_element.text.strip().replace('\n', '').replace('+', '')
-            value = value_element.text.strip().replace('\n', '')
+        combined_df = write_csv(df, file_name, first_index=self.csv_rows[file_name] + 1)
+        self.csv_rows[file_name] += len(combined_df)
 
-            data[title] = value
+        return combined_df
 
-        return data
-    
-    def extract_table_data(self):
+    def save_to_parquet(self, root_path, records=None, scrape_date=None):
         """
-        Extracts table data from the current page.
+        Save the listings_data to a Parquet dataset partitioned by scrape date and offer type.
+
+        Args:
+        root_path (str): The root directory of the dataset.
+        records (list): The listings to save instead of listings_data.
+        scrape_date (str): The scrape date in ISO format, today by default.
 
         Returns:
-            dict: The extracted table data.
-        """
-        data = {}
-        parameters_area1 = self.try_extract_element(By.XPATH, '/html/body/div[1]/main/div[2]/section/div/div[1]/div[4]/div')
-
-        if parameters_area1:
-            tables1 = self.driver.find_elements(By.XPATH, '/html/body/div[1]/main/div[2]/section/div/div[1]/div[4]/div/section')
-            for table in tables1:
-                rows = table.find_elements(By.TAG_NAME, 'tr')
-
-                for row in rows:
-                    try:
-                        title = row.find_element(By.XPATH, './th').text.strip().replace('\n', '')  # Parameter's title
-                    except:
-                        title = "title"
-                    try:
-                        value = row.find_element(By.XPATH, './td').text.strip().replace('\n', '')  # Parameter's value
-                    except:
-                        value = row.find_element(By.XPATH, './td/div/a/span/span[1]').text.strip().replace('\n', '')  # Parameter's title
-
-                    if title != "":
-                        data[title] = value
-                    else:
-                        title = value
-                        data[title] = 1
+        df (pd.DataFrame): The DataFrame containing the data saved to the dataset.
+        """
+        df = records_to_frame(self.listings_data if records is None else records)
+        return write_parquet(df, root_path, scrape_date)
 
-        return data
-                
-    def extract_poi_data(self):
+    def close_engine(self):
         """
-        Extracts points of interest (POI) data from the current page.
+        Closes the HTTP engine's pooled connections if the HTTP engine is used.
+        """
+        if self.http_engine is not None:
+            self.http_engine.close()
 
-        Returns:
-            dict: The extracted POI data.
+    def accept_cookies(self):
+        """
+        Accept cookies on the website if the cookies banner is present.
         """
-        data = {}
-        parameters_area2 = self.try_extract_element(By.XPATH, '/html/body/div[1]/main/div[2]/section/div/div[1]/section[1]/div/div[2]')
+        # A reused browser has accepted the cookies in an earlier crawl already
+        if self.driver.get_cookie(COOKIES_CONSENT_COOKIE) is not None:
+            return
 
-        if parameters_area2:
-            tables3 = self.driver.find_elements(By.XPATH, '/html/body/div[1]/main/div[2]/section/div/div[1]/section[1]/div/div[2]/div[1]')
+        start = time.perf_counter()
+        try:
+            # Find the 'accept cookies' button and click it
+            wait = WebDriverWait(self.driver, COOKIES_TIMEOUT, poll_frequency=0.1)
+            accept_button = wait.until(EC.element_to_be_clickable((By.XPATH, COOKIES_BUTTON_XPATH)))
+            accept_button.click()
+        except TimeoutException:
+            logging.warning("Could not find the accept cookies button or it took too long to load.")
+            self.metrics.timeout(COOKIES_BUTTON_XPATH, time.perf_counter() - start)
+        finally:
+            self.metrics.record_stage('accept_cookies', time.perf_counter() - start)
 
-            for table in tables3:
-                divs = table.find_elements(By.XPATH, './/div[@class="Poi_poiItem__o_ASS poiItem"]')
+    def start_worker_pool(self):
+        """
+        Starts a pool of WebDriver workers if more than one worker is configured.
 
-                for div in divs:
-                    try:
-                        title = div.find_element(By.XPATH, './/span[@class="Poi_poiItemContentType__N5P4D poiItemContentType"]').text.strip().replace('\n', '')  # Parameter's title
-                        value_element = div.find_element(By.XPATH, './/div[@class="Poi_poiItemTimes__5AhQ0 poiItemTimes"]/strong')
-                        value = value_element.text.strip().replace('\n', '').replace(u'\xa0', u' ')  # Parameter's value
+        Returns:
+            ListingWorkerPool: The started pool, or None when scraping serially.
+        """
+        if self.workers <= 1:
+            return None
+        if self.driver_path is None and self.driver_manager is None:
+            raise ValueError("driver_path or driver_manager is required to scrape with more than one worker.")
 
-                        data[title] = value
-                    except:
-                        continue
+        rate_limiter = HostRateLimiter(max_concurrent=self.max_per_host, min_interval=self.min_request_interval)
+        pool = ListingWorkerPool(self.driver_path, self.workers, rate_limiter, self.sleep_time, self.engine,
+                                 self.metrics, self.page_timeout, self.driver_manager)
+        try:
+            pool.start()
+        except Exception:
+            pool.close()
+            raise
+        return pool
 
-        return data
-        
-    def try_extract_element(self, by, locator):
+    def extract_listings(self, urls, pool=None):
         """
-        Tries to extract an element's text from the page using the given locator.
+        Extracts data from the given listing URLs, one by one with this scraper's driver or with the worker pool.
 
         Args:
-            by (By): The method to locate the element (e.g., By.XPATH, By.ID, etc.).
-            locator (str): The locator to find the element.
+            urls (list): The listing URLs to extract.
+            pool (ListingWorkerPool): The worker pool, or None to scrape serially.
 
-        Returns:
-            str: The element's text if found, or None if not found.
+        Yields:
+            tuple: The listing URL and its extracted data (None for failed listings), in the order of the URLs.
         """
-        try:
-            return self.wait.until(EC.presence_of_element_located((by, locator))).text
-        except TimeoutException:
-            logging.warning(f"Unable to find the element in locaiton '{locator}' on the page.")
-            return None
-        
-    def save_to_csv(self, file_name):
+        if pool is not None:
+            yield from zip(urls, pool.map(urls))
+            return
+
+        for listing_url in urls:
+            try:
+                listing_data = self.extract_info(listing_url)
+            except Exception as e:
+                logging.error(f"Error extracting data from {listing_url}: {e}")
+                listing_data = None
+            yield listing_url, listing_data
+
+    def handle_listing(self, listing_url, listing_data, card_hash=None):
         """
-        Save the listings_data to a CSV file with a specified schema.
+        Stores one extracted listing, buffering it for the output file if one is configured.
 
         Args:
-        file_name (str): The name of the CSV file to save the data.
+            listing_url (str): The URL of the listing.
+            listing_data (dict): The extracted data, or None if the extraction failed.
+            card_hash (str): The hash of the listing card on the results page.
+        """
+        if listing_data is None:
+            return
 
-        Returns:
-        combined_df (pd.DataFrame): The DataFrame containing the data saved to the CSV file.
+        self.pending.append((listing_url, listing_data, card_hash))
+        if len(self.pending) >= self.write_batch_size:
+            self.flush_pending()
+
+    def flush_pending(self):
+        """
+        Writes the buffered listings in one batch, then records them in the index and the checkpoint.
         """
+        if not self.pending:
+            return
+
+        records = [listing_data for _, listing_data, _ in self.pending]
+        with self.metrics.stage('write'), self.output_lock or nullcontext():
+            if self.output_file is None:
+                self.listings_data.extend(records)
+            elif self.output_format == 'parquet':
+                self.save_to_parquet(self.output_file, records=records)
+            else:
+                self.save_to_csv(self.output_file, records=records)
+        self.listings_count += len(records)
+
+        # Listings only count as processed once they are safely on disk
+        if self.index is not None:
+            for listing_url, listing_data, card_hash in self.pending:
+                self.index.record(listing_url, listing_data, card_hash)
+        if self.checkpoint is not None:
+            self.checkpoint.mark_processed([listing_url for listing_url, _, _ in self.pending])
+
+        # Let a background scheduler know that the output has new listings
+        if self.on_flush is not None:
+            self.on_flush(len(records))
+
+        self.pending = []
+
+    def extract_listing_cards(self):
+        """
+        Extracts the listing URLs and the listing card texts from the current results page, which is already ready.
 
-        # Convert the listings_data to a DataFrame
-        df = pd.DataFrame(self.listings_data)
-
-        # Add 'Index' column with range 1 to length of DataFrame
-        df.insert(0, 'Index', range(1, len(df) + 1))
-
-        # Define a dictionary to map old column names to new column names
-        column_mapping = {
-            'Balkón': 'Balkón',
-            'Terasa': 'Terasa',
-            'Sklep': 'Sklep',
-            'Lodžie': 'Lodžie',
-            'Bezbariérový přístup': 'Bezbariérový přístup',
-            'Parkování': 'Parkování',
-            'Výtah': 'Výtah',
-            'Garáž': 'Garáž',
-            'Poplatky za energie': 'POPLATKY ZA ENERGIE',
-            'Poplatky za služby': 'POPLATKY ZA SLUŽBY',
-            'Vratná kauce': 'VRATNÁ KAUCE'
-        }
-
-        # Rename the columns in the DataFrame using the dictionary
-        for old_col, new_col in column_mapping.items():
-            if old_col in df.columns:
-                df.rename(columns={old_col: new_col}, inplace=True)
-
-        # Define the fixed schema with the columns to include
-        columns = ['URL', 'CENA', 'POPLATKY ZA SLUŽBY', 'POPLATKY ZA ENERGIE', 'VRATNÁ KAUCE', 'TYP NABÍDKY', 'LOKACE', 'ČÍSLO INZERÁTU', 'DISPOZICE', 'STAV', 'DOSTUPNÉ OD', 'VLASTNICTVÍ', 'TYP BUDOVY', 'PLOCHA', 'VYBAVENO', 'PODLAŽÍ', 'PENB', 'Internet', 'Energie', 'Balkón', 'Terasa', 'Sklep', 'Lodžie', 'Bezbariérový přístup', 'Parkování', 'Výtah', 'Garáž', 'MHD', 'Pošta', 'Obchod', 'Banka', 'Restaurace', 'Lékárna', 'Škola', 'Mateřská škola', 'Sportoviště', 'Hřiště']  # List of column names
-        fixed_schema_df = pd.DataFrame(columns=columns)
-        fixed_schema_df.insert(0, 'Index', range(1, len(fixed_schema_df) + 1))
-
-        # Reset the index for both DataFrames before concatenating
-        fixed_schema_df.reset_index(drop=True, inplace=True)
-        df.reset_index(drop=True, inplace=True)
-
-        # Handle duplicate column names by adding suffixes
-        cols = pd.Series(df.columns)
-        for dup in cols[cols.duplicated()].unique():
-            cols[cols[cols == dup].index.values.tolist()] = [dup + '_' + str(i) if i != 0 else dup for i in range(sum(cols == dup))]
-        df.columns = cols
-
-        # Combine the DataFrames, filling missing values with 'NaN'
-        combined_df = pd.concat([fixed_schema_df, df], axis=0, ignore_index=True, sort=False).fillna('NaN')[columns]
-
-        # Reset index and add 'Index' column with range 1 to length of combined_df
-        combined_df.reset_index(drop=True, inplace=True)
-        combined_df.insert(0, 'Index', range(1, len(combined_df) + 1))
-
-        # Save the data to a CSV file
-        file_exists = os.path.isfile(file_name)
-        with open(file_name, 'a', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=combined_df.columns)
-
-            # Write the header if the file does not exist
-            if not file_exists:
-                writer.writeheader()
-
-            # Write the data to the CSV file
-            for _, row in combined_df.iterrows():
-                writer.writerow(row.to_dict())
+        Returns:
+            list: A list of (URL, card text) tuples.
+        """
+        listing_cards = self.driver.find_elements(By.XPATH, LISTING_CARD_XPATH)
 
-        return combined_df
+        cards = []
+        for card in listing_cards:
+            try:
+                link = card.find_element(By.XPATH, './/div[2]/h2').find_element_by_css_selector('a')
+                cards.append((link.get_attribute("href"), card.text))
+            except NoSuchElementException as e:
+                logging.error(f"Error extracting listing URLs: {e}")
+        return cards
 
-    def accept_cookies(self):
+    def select_changed_listings(self, cards):
         """
-        Accept cookies on the website if the cookies banner is present.
+        Selects the listings whose detail pages have to be downloaded, based on the seen-listings index.
+
+        Args:
+            cards (list): A list of (URL, card text) tuples from the results page.
+
+        Returns:
+            tuple: The URLs to extract and a dictionary mapping every URL to its card hash.
         """
-        try:
-            # Find the 'accept cookies' button and click it
-            accept_button = self.wait.until(EC.element_to_be_clickable((By.XPATH, "//button[@id='CybotCookiebotDialogBodyLevelButtonLevelOptinAllowAll']")))
-            accept_button.click()
-        except TimeoutException:
-            logging.warning("Could not find the accept cookies button or it took too long to load.") 
+        card_hashes = {listing_url: content_hash(card_text) for listing_url, card_text in cards}
+        if self.index is None:
+            return list(card_hashes), card_hashes
+
+        urls = []
+        for listing_url, card_hash in card_hashes.items():
+            if self.index.needs_update(listing_url, card_hash):
+                urls.append(listing_url)
+            else:
+                self.index.touch(listing_url)
+
+        logging.info(f"Skipping {len(card_hashes) - len(urls)} unchanged listings out of {len(card_hashes)}.")
+        return urls, card_hashes
 
-    def scrape_listings(self, url):
+    def scrape_listings(self, url, max_pages=1):
         """
         Scrape listing data from the given URL and return the data.
 
         Args:
             url (str): The URL to scrape listings from.
+            max_pages (int): The maximum number of result pages to scrape.
 
         Returns:
-            list: A list of dictionaries containing the scraped listing data.
+            list: A list of dictionaries containing the scraped listing data (empty when streaming to output_file).
         """
         main_url = url  # Store the main URL
-        self.driver.get(main_url)
+        page_counter = 1
+
+        # Time this run from the start, its summary is reported when it ends
+        self.metrics.reset()
+        self.metrics.emit('run_start', url=url, engine=self.engine, workers=self.workers)
+
+        # Continue an interrupted crawl from its checkpoint
+        resumed = self.checkpoint is not None and self.checkpoint.load()
+        if resumed:
+            main_url = self.checkpoint.page_url
+            page_counter = self.checkpoint.page_counter
+        elif self.checkpoint is not None:
+            self.checkpoint.start_page(main_url, page_counter)
+
+        with self.metrics.stage('results_page_load'):
+            self.driver.get(main_url)
         self.accept_cookies()
         logging.info(f"Starting to scrape listings from {main_url}")
 
-        page_counter = 1
-        max_pages = 1
+        if self.index is not None:
+            self.index.start_run()
 
-        while page_counter <= max_pages:
-            time.sleep(self.sleep_time)
-            # Find all listing links on the current page
-            listing_links = self.wait.until(EC.presence_of_all_elements_located((By.XPATH, '//*[@id="__next"]/main/section/div/div[2]/div/div[5]/section/article//div[2]/h2')))
+        pool = self.start_worker_pool()
 
-            try:
-                # Extract URLs from the listing links
-                urls = [link.find_element_by_css_selector('a').get_attribute("href") for link in listing_links]
-            except NoSuchElementException as e:
-                logging.error(f"Error extracting listing URLs: {e}")
-
-            # Extract data from each listing URL
-            for listing_url in urls:
-                try:
-                    listing_data = self.extract_info(listing_url)
-                    if listing_data is not None:
-                        self.listings_data.append(listing_data)
-                except Exception as e:
-                    logging.error(f"Error extracting data from {listing_url}: {e}")
+        crawled_all_pages = False
 
-            # Go to the next page of listings
-            try:
-                self.driver.get(main_url)  # Go back to the main URL after processing each listing
-                # Find the 'next' button and click it
-                link_button = self.wait.until(EC.presence_of_element_located((By.XPATH, "//li[@class='page-item']/a[@class='page-link'][span[contains(text(), 'Další')]]")))
-                self.wait.until_not(EC.staleness_of(link_button))
-                link_url = link_button.get_attribute("href")
-                self.driver.get(link_url)
+        try:
+            while page_counter <= max_pages:
+                page_start = time.perf_counter()
+                # Wait for the listing cards instead of a fixed time, an optional pause only spaces the requests out
+                if not self.wait_for_page(LISTING_CARD_XPATH):
+                    logging.warning("No listings appeared on the results page, exiting.")
+                    break
+                if self.sleep_time:
+                    with self.metrics.stage('sleep'):
+                        time.sleep(self.sleep_time)
+                # Find all listings on the current page and keep only new or changed ones
+                with self.metrics.stage('listing_cards'):
+                    cards = self.extract_listing_cards()
+                with self.metrics.stage('index_lookup'):
+                    changed_urls, card_hashes = self.select_changed_listings(cards)
+                urls = changed_urls
+                if self.checkpoint is not None:
+                    urls = [listing_url for listing_url in urls if listing_url not in self.checkpoint.processed]
+
+                # Extract data from each listing URL
+                for listing_url, listing_data in self.extract_listings(urls, pool):
+                    self.handle_listing(listing_url, listing_data, card_hashes[listing_url])
+                self.flush_pending()
+
+                self.metrics.count('pages')
+                self.metrics.emit('page', page=page_counter, url=main_url, cards=len(cards), changed=len(changed_urls),
+                                  extracted=len(urls), seconds=round(time.perf_counter() - page_start, 3),
+                                  page_timeout=round(self.page_timeout.current(), 3))
+
+                # Listings are ordered from the newest, so a fully known page means the rest is known too
+                if self.index is not None and self.stop_on_known_page and cards and not changed_urls:
+                    logging.info("Page contains only known listings, stopping early.")
+                    break
+
+                # Go to the next page of listings
+                if pool is None and urls:
+                    with self.metrics.stage('results_page_load'):
+                        self.driver.get(main_url)  # Go back to the main URL after processing each listing
+                    if not self.wait_for_page(LISTING_CARD_XPATH):
+                        logging.warning("The results page did not load again, exiting.")
+                        break
+
+                # The results page is ready, so a missing 'next' button means that this is the last page
+                next_links = self.driver.find_elements(By.XPATH, NEXT_PAGE_XPATH)
+                if not next_links:
+                    logging.info("No more pages to scrape, exiting.")
+                    crawled_all_pages = True
+                    break
+
+                link_url = next_links[0].get_attribute("href")
+                with self.metrics.stage('results_page_load'):
+                    self.driver.get(link_url)
                 main_url = link_url  # Update the main URL
                 page_counter += 1
-            except TimeoutException:
-                logging.info("No more pages to scrape, exiting.")
-                break
+                if self.checkpoint is not None:
+                    self.checkpoint.start_page(main_url, page_counter)
+        finally:
+            if pool is not None:
+                pool.close()
+            self.metrics.report()
+
+        # Only a crawl that saw every page can tell which listings have disappeared
+        if self.index is not None and crawled_all_pages and not resumed:
+            self.index.mark_removed()
+
+        # The crawl finished, so there is nothing left to resume
+        if self.checkpoint is not None:
+            self.checkpoint.clear()
 
-        logging.info(f"Web scraping completed. Collected {len(self.listings_data)} listings.")
+        logging.info(f"Web scraping completed. Collected {self.listings_count} listings.")
 
-        # Close the driver
+        # Close the driver, a driver lent by a DriverManager goes back to it
+        self.close_engine()
         self.driver.quit()
 
         data = self.listings_data
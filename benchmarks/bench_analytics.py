@@ -0,0 +1,107 @@
+"""
+Compares the notebook's chart cells, each copying the listings, converting the price, area and year columns again and
+grouping them, with ListingsAnalytics, which aggregates the listings once and slices the shared cells for every
+report. The listings are resampled to --rows per year for --years years.
+
+    python benchmarks/bench_analytics.py --rows 100000 --years 5
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from analytics import DISPOSITIONS, OUTSIDE_PRAGUE, PRAGUE, ListingsAnalytics  # noqa: E402
+from bench_price_model import SAMPLE_FILE  # noqa: E402
+from cube import SHARE_ATTRIBUTES, YEAR_COLUMN  # noqa: E402
+from datahandler import COLS_BOOLEAN  # noqa: E402
+from ingest import load_listings  # noqa: E402
+
+MEASURE_COLUMNS = {'Cena': 'CENA', 'Plocha': 'PLOCHA', 'Vratná kauce': 'VRATNÁ KAUCE',
+                   'Poplatky za služby': 'POPLATKY ZA SLUŽBY'}
+
+
+def notebook_mean(listings, offer_type, column, by='DISPOZICE', area=None, per_m2=False):
+    # One chart cell: copy, convert, filter and group the listings
+    df = listings[listings['TYP NABÍDKY'] == offer_type].copy()
+    df['CENA'] = pd.to_numeric(df['CENA'], errors='coerce')
+    df['PLOCHA'] = pd.to_numeric(df['PLOCHA'], errors='coerce')
+    df[YEAR_COLUMN] = pd.to_numeric(df[YEAR_COLUMN], errors='coerce')
+    if per_m2:
+        df['Cena za m²'] = df['CENA'] / df['PLOCHA']
+    if area == PRAGUE:
+        df = df[df['LOKACE'] == PRAGUE]
+    elif area == OUTSIDE_PRAGUE:
+        df = df[df['LOKACE'] != PRAGUE]
+    df = df[df['DISPOZICE'].isin(DISPOSITIONS)]
+    df = df[df[column] != 0]
+    grouped = df.groupby([by, YEAR_COLUMN], observed=True)[column].mean().reset_index()
+    sizes = df.groupby([by, YEAR_COLUMN], observed=True).size().reset_index(name='counts')
+    return (grouped.pivot(index=by, columns=YEAR_COLUMN, values=column).fillna(0),
+            sizes.pivot(index=by, columns=YEAR_COLUMN, values='counts').fillna(0))
+
+
+def notebook_share(listings, offer_type, category):
+    # One Novostavba chart cell
+    df = listings[listings['TYP NABÍDKY'] == offer_type].copy()
+    df = df[df['STAV'] == 'Novostavba']
+    grouped = df.groupby([category, YEAR_COLUMN], observed=True).size().reset_index(name='Count')
+    total_count = grouped.groupby(YEAR_COLUMN)['Count'].sum()
+    grouped['Percentage'] = grouped['Count'] / grouped[YEAR_COLUMN].map(total_count) * 100
+    return grouped.pivot(index=category, columns=YEAR_COLUMN, values='Percentage').fillna(0)
+
+
+def notebook_features(listings, offer_type):
+    df = listings[listings['TYP NABÍDKY'] == offer_type].copy()
+    return {feature: df.groupby(YEAR_COLUMN)[feature].mean() for feature in COLS_BOOLEAN}
+
+
+def notebook_report(listings):
+    # The same charts as ListingsAnalytics.report, one cell each
+    reports = []
+    for offer_type in ('PRONÁJEM', 'PRODEJ'):
+        for column in MEASURE_COLUMNS.values():
+            reports.append(notebook_mean(listings, offer_type, column))
+        reports.append(notebook_mean(listings, offer_type, 'Cena za m²', per_m2=True))
+        for area in (PRAGUE, OUTSIDE_PRAGUE):
+            reports.append(notebook_mean(listings, offer_type, 'CENA', area=area))
+            reports.append(notebook_mean(listings, offer_type, 'Cena za m²', area=area, per_m2=True))
+        reports.append(notebook_mean(listings, offer_type, 'CENA', by='LOKACE'))
+        for category in ['LOKACE', *SHARE_ATTRIBUTES]:
+            reports.append(notebook_share(listings, offer_type, category))
+        reports.append(notebook_features(listings, offer_type))
+    return reports
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000, help="resample the listings to this many rows per year")
+    parser.add_argument('--years', type=int, default=5)
+    args = parser.parse_args()
+
+    listings = load_listings(SAMPLE_FILE)
+    listings = listings.sample(n=args.rows * args.years, replace=True, random_state=42).reset_index(drop=True)
+    listings[YEAR_COLUMN] = np.repeat(np.arange(2023 - args.years + 1, 2024), args.rows)
+
+    reports, seconds = timed(notebook_report, listings)
+    print(f"notebook cells           {seconds * 1000:9.1f} ms  {len(reports)} charts of {len(listings)} listings")
+
+    analytics, build = timed(ListingsAnalytics, listings)
+    reports, seconds = timed(analytics.report)
+    print(f"analytics, aggregate     {build * 1000:9.1f} ms  {len(analytics.cells)} cells")
+    print(f"analytics, full report   {seconds * 1000:9.1f} ms  {len(reports)} reports")
+    _, seconds = timed(analytics.report)
+    print(f"analytics, cached report {seconds * 1000:9.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
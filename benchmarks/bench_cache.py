@@ -0,0 +1,51 @@
+"""
+Times loading the cleaned listings without the cache, from an up-to-date cache and after rows were appended to the CSV.
+
+    python benchmarks/bench_cache.py --rows 500000 --append 5000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from bench_clean_data import make_listings  # noqa: E402
+from cache import CleanedListingsCache  # noqa: E402
+from ingest import load_listings  # noqa: E402
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--append', type=int, default=5_000, help="rows appended to the CSV after the cache is built")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        file_name = os.path.join(work_dir, 'listings.csv')
+        listings = make_listings(args.rows + args.append)
+        listings.iloc[:args.rows].to_csv(file_name, index=False)
+        cache = CleanedListingsCache(os.path.join(work_dir, 'cleaned.parquet'))
+
+        results = {}
+        _, results['no cache'] = timed(load_listings, file_name)
+        _, results['cache build'] = timed(cache.load, file_name)
+        _, results['cache hit'] = timed(cache.load, file_name)
+
+        listings.iloc[args.rows:].to_csv(file_name, mode='a', header=False, index=False)
+        cleaned, results[f'append {args.append}'] = timed(cache.load, file_name)
+
+        for name, seconds in results.items():
+            print(f"{name:<15} {seconds * 1000:10.1f} ms")
+        print(f"{len(cleaned)} cleaned listings")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Compares the previous in-place DataHandler cleaning with the vectorized, schema-typed one on a synthetic listings file.
+Reports wall time, peak traced memory during cleaning and the memory of the cleaned frame.
+
+    python benchmarks/bench_clean_data.py --rows 1000000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from datahandler import DataHandler, COLS_BOOLEAN, COLS_DISTANCE  # noqa: E402
+from geo import LOCATIONS  # noqa: E402
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'listings_data.csv')
+
+
+def legacy_clean_data(df):
+    # The DataHandler.clean_data implementation before the vectorized pipeline
+    df.drop_duplicates(subset=['URL'], inplace=True)
+    df.dropna(axis=1, how='all', inplace=True)
+    df.drop(labels='URL', axis=1, inplace=True)
+
+    df.dropna(subset=['LOKACE'], inplace=True)
+    for old_name, new_name in LOCATIONS:
+        df.loc[df['LOKACE'].str.contains(old_name, case=False), 'LOKACE'] = new_name
+
+    df.dropna(subset=['CENA'], inplace=True)
+    df['CENA'] = df['CENA'].replace(r'[^\d]', '', regex=True).astype(int)
+    for col in ['POPLATKY ZA SLUŽBY', 'POPLATKY ZA ENERGIE', 'VRATNÁ KAUCE']:
+        if col in df.columns:
+            df[col] = df[col].replace(r'[^\d]', '', regex=True).fillna(0).astype(int)
+    existing_cols_boolean = [col for col in COLS_BOOLEAN if col in df.columns]
+    df[existing_cols_boolean] = df[existing_cols_boolean].fillna(value=0).astype(int)
+    df[COLS_DISTANCE] = df[COLS_DISTANCE].apply(
+        lambda column: column.map(lambda x: int(x.replace('m', '').replace(' ', '')) if pd.notna(x) else x))
+
+    df.dropna(subset=['STAV'], inplace=True)
+    for col in ['VLASTNICTVÍ', 'TYP BUDOVY', 'VYBAVENO', 'PODLAŽÍ', 'PENB'] + COLS_DISTANCE:
+        df[col] = df[col].fillna('unknown')
+    df['PLOCHA'] = pd.to_numeric(df['PLOCHA'].replace(r'[^\d]', '', regex=True), errors='coerce')
+    return df
+
+
+def make_listings(rows, output_file=None):
+    sample = pd.read_csv(SAMPLE_FILE)
+    df = sample.sample(n=rows, replace=True, random_state=42).reset_index(drop=True)
+    # Every synthetic row is its own listing
+    df['URL'] = df['URL'] + '?copy=' + df.index.astype(str)
+    if output_file:
+        df.to_csv(output_file, index=False)
+    return df
+
+
+def measure(function, df):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(df)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--write', help="also write the synthetic listings to this CSV file")
+    args = parser.parse_args()
+
+    source = make_listings(args.rows, args.write)
+    print(f"Input frame: {source.memory_usage(deep=True).sum() / 2**20:.0f} MiB")
+
+    legacy_df, legacy_time, legacy_peak = measure(legacy_clean_data, source.copy())
+    cleaned_df, cleaned_time, cleaned_peak = measure(lambda df: DataHandler(df).clean_data(), source)
+
+    for name, df, elapsed, peak in [('legacy', legacy_df, legacy_time, legacy_peak),
+                                    ('vectorized', cleaned_df, cleaned_time, cleaned_peak)]:
+        print(f"{name:<11} {elapsed:7.2f} s  peak {peak / 2**20:8.0f} MiB  "
+              f"output {df.memory_usage(deep=True).sum() / 2**20:6.0f} MiB  rows {len(df)}")
+
+    print(f"Speedup {legacy_time / cleaned_time:.1f}x, peak memory {legacy_peak / cleaned_peak:.1f}x lower, "
+          f"output {legacy_df.memory_usage(deep=True).sum() / cleaned_df.memory_usage(deep=True).sum():.1f}x smaller")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Compares finding the comparables of listings by filtering the cleaned listings with pandas for every query with the
+ComparablesIndex: building it, single and batched queries, and applying a crawl's appended listings against a rebuild.
+
+    python benchmarks/bench_comparables.py --rows 500000 --queries 1000
+"""
+import argparse
+import os
+import sys
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from bench_price_model import SAMPLE_FILE  # noqa: E402
+from comparables import ComparablesIndex, FEATURES  # noqa: E402
+from ingest import load_listings  # noqa: E402
+
+
+def pandas_comparables(listings, listing, k):
+    # The ad-hoc way: filter the partition, then rank by the summed relative differences of the features
+    same = listings[(listings['TYP NABÍDKY'] == listing['TYP NABÍDKY'])
+                    & (listings['LOKACE'] == listing['LOKACE'])
+                    & (listings['DISPOZICE'] == listing['DISPOZICE'])]
+    differences = sum((same[col].astype(float) - float(listing[col])).abs() / (float(listing[col]) + 1)
+                      for col in FEATURES if pd.notna(listing[col]))
+    return differences.nsmallest(k)
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=500_000, help="resample the listings to this many rows")
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--crawl', type=float, default=0.02, help="the share of listings a crawl appends")
+    args = parser.parse_args()
+
+    listings = load_listings(SAMPLE_FILE)
+    listings = listings.sample(n=args.rows, replace=True, random_state=42).reset_index(drop=True)
+    queries = listings.sample(n=args.queries, random_state=7)
+
+    crawl_size = int(len(listings) * args.crawl)
+    loaded, crawl = listings.iloc[:-crawl_size], listings.iloc[-crawl_size:]
+    index, build = timed(ComparablesIndex, loaded)
+    print(f"{args.rows} listings, {len(index.partitions)} partitions, build {build:8.1f} ms")
+
+    sample = min(args.queries, 100)
+    _, seconds = timed(lambda: [pandas_comparables(loaded, row, args.k) for _, row in queries.iloc[:sample].iterrows()])
+    print(f"pandas filtering     {seconds / sample:9.3f} ms per query")
+    _, seconds = timed(lambda: [index.query(queries.iloc[i:i + 1], k=args.k) for i in range(sample)])
+    print(f"index, one by one    {seconds / sample:9.3f} ms per query")
+    _, seconds = timed(index.query, queries, k=args.k)
+    print(f"index, batch of {args.queries:<5}{seconds / args.queries:9.3f} ms per query, {seconds:8.1f} ms in total")
+
+    _, seconds = timed(index.add, crawl)
+    print(f"append a crawl       {seconds:9.1f} ms for {crawl_size} listings, a rebuild takes {build:8.1f} ms")
+    _, seconds = timed(index.query, queries, k=args.k)
+    print(f"batch after append   {seconds / args.queries:9.3f} ms per query")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Runs scrape_listings end to end against the replay server for every extraction engine and number of workers, and
+reports throughput, CPU time and memory, so that crawl regressions show up before production.
+
+Record a crawl once:
+
+    python app/replay.py record fixtures/crawl https://www.bezrealitky.cz/vypis/nabidka-pronajem/ --pages 3
+
+Then replay it:
+
+    python benchmarks/bench_crawl.py fixtures/crawl --driver path/to/chromedriver --workers 1 4 --latency 0.2
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from metrics import CrawlMetrics  # noqa: E402
+from replay import FixtureStore, start_replay_server  # noqa: E402
+from webscraper import WebScraper  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows, the browser's CPU time is not reported
+    resource = None
+
+
+def children_cpu():
+    # The chromedriver and Chrome processes are children of this one, counted once they have exited
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_crawl(store, driver_path, engine, workers, max_pages, latency):
+    server = start_replay_server(store, port=0, latency=latency)
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            driver = WebScraper.init_driver(driver_path)
+            scraper = WebScraper(driver, driver_path=driver_path, workers=workers, max_per_host=workers,
+                                 engine=engine, output_file=os.path.join(work_dir, 'listings.csv'),
+                                 metrics=CrawlMetrics())
+
+            children_start = children_cpu()
+            tracemalloc.start()
+            cpu_start, start = time.process_time(), time.perf_counter()
+            scraper.scrape_listings(server.base_url + store.start, max_pages=max_pages)
+            elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            browser_cpu = None if children_start is None else children_cpu() - children_start
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # Recorded pages have no working cookies banner, so the one-off wait for it is left out of the throughput
+    cookies_wait = scraper.metrics.summary()['stages'].get('accept_cookies', {}).get('total', 0.0)
+    return {
+        'listings': scraper.listings_count,
+        'seconds': elapsed - cookies_wait,
+        'listings_per_second': scraper.listings_count / (elapsed - cookies_wait),
+        'cpu': cpu,
+        'browser_cpu': browser_cpu,
+        'peak_mib': peak / 2**20,
+        'requests': server.requests,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('store', help="a fixture store written by 'replay.py record'")
+    parser.add_argument('--driver', required=True, help="chromedriver path, result pages are always walked in Chrome")
+    parser.add_argument('--engines', nargs='+', default=['http', 'selenium'], choices=['http', 'selenium'])
+    parser.add_argument('--workers', nargs='+', type=int, default=[1, 4])
+    parser.add_argument('--pages', type=int, default=100, help="the maximum number of result pages to crawl")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds the replay server adds to every page")
+    args = parser.parse_args()
+
+    store = FixtureStore(args.store)
+    if store.start is None:
+        sys.exit(f"No recorded crawl found in {args.store}")
+
+    print(f"{'engine':<9} {'workers':>7} {'listings':>8} {'seconds':>8} {'listings/s':>10} {'cpu s':>7} "
+          f"{'browser cpu s':>13} {'peak MiB':>8} {'requests':>8}")
+    for engine in args.engines:
+        for workers in args.workers:
+            result = run_crawl(store, args.driver, engine, workers, args.pages, args.latency)
+            browser_cpu = 'n/a' if result['browser_cpu'] is None else f"{result['browser_cpu']:.1f}"
+            print(f"{engine:<9} {workers:>7} {result['listings']:>8} {result['seconds']:>8.1f} "
+                  f"{result['listings_per_second']:>10.2f} {result['cpu']:>7.1f} {browser_cpu:>13} "
+                  f"{result['peak_mib']:>8.1f} {result['requests']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Compares answering the dashboard charts from the cleaned listings, like the notebook does, with slicing the
+ListingsCube, and times building the cube and updating it with appended listings.
+
+    python benchmarks/bench_dashboard.py --rows 1000000
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from cube import ListingsCube  # noqa: E402
+from ingest import load_listings  # noqa: E402
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'listings_data.csv')
+
+
+def notebook_by_disposition(listings, offer_type, regions):
+    # The notebook's chart cells: copy, filter and group the listings for every chart
+    df = listings.copy()
+    df = df[(df['TYP NABÍDKY'] == offer_type) & df['LOKACE'].isin(regions)]
+    return df.groupby(['DISPOZICE', 'ROK'], observed=True)['CENA'].mean().reset_index()
+
+
+def notebook_by_region(listings, offer_type):
+    df = listings.copy()
+    df = df[df['TYP NABÍDKY'] == offer_type]
+    df['Price per m2'] = df['CENA'] / df['PLOCHA']
+    return df.groupby(['LOKACE', 'ROK'], observed=True)['Price per m2'].mean().reset_index()
+
+
+def notebook_new_building_shares(listings, offer_type, attribute):
+    df = listings.copy()
+    df = df[(df['TYP NABÍDKY'] == offer_type) & (df['STAV'] == 'Novostavba')]
+    counts = df.groupby([attribute, 'ROK'], observed=True).size().reset_index(name='count')
+    counts['share'] = counts['count'] / counts.groupby('ROK')['count'].transform('sum')
+    return counts
+
+
+def median_ms(function, *args, rounds=20):
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return np.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--append', type=int, default=5_000, help="listings added to the cube incrementally")
+    args = parser.parse_args()
+
+    # Resample the cleaned sample, spread over a few years like the merged notebook data
+    cleaned = load_listings(SAMPLE_FILE)
+    listings = cleaned.sample(n=args.rows + args.append, replace=True, random_state=42).reset_index(drop=True)
+    years = np.random.default_rng(42).choice([2020, 2021, 2022, 2023], len(listings))
+    base, appended = listings.iloc[:args.rows], listings.iloc[args.rows:]
+
+    start = time.perf_counter()
+    cube = ListingsCube(base, years[:args.rows])
+    print(f"build cube, {args.rows} listings   {(time.perf_counter() - start) * 1000:9.1f} ms  {len(cube.cube)} cells")
+    start = time.perf_counter()
+    cube.add(appended, years[args.rows:])
+    print(f"add {args.append} listings           {(time.perf_counter() - start) * 1000:9.1f} ms")
+
+    raw = listings.assign(ROK=years)
+    regions = ['Praha']
+    charts = [
+        ('by disposition', lambda: notebook_by_disposition(raw, 'PRONÁJEM', regions),
+         lambda: cube.by_disposition('PRONÁJEM', 'Cena', regions)),
+        ('by region', lambda: notebook_by_region(raw, 'PRODEJ'),
+         lambda: cube.by_region('PRODEJ', 'Cena za m²')),
+        ('new building shares', lambda: notebook_new_building_shares(raw, 'PRONÁJEM', 'PENB'),
+         lambda: cube.new_building_shares('PRONÁJEM', 'PENB')),
+    ]
+    for name, notebook, sliced in charts:
+        print(f"{name:<22} notebook {median_ms(notebook, rounds=5):9.1f} ms   cube {median_ms(sliced):7.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Compares the scraper's former browser, a fresh windowed Chrome per scraper, with the DriverManager's headless,
+resource-blocking and recycled drivers: the time to get a driver, the load time per listing and the browser's peak
+memory over many pages.
+
+Listings are loaded from a fixture store replayed locally (see app/replay.py), or from the live site with --live:
+
+    python benchmarks/bench_driver.py --driver path/to/chromedriver --store fixtures/crawl --pages 500
+    python benchmarks/bench_driver.py --driver path/to/chromedriver --live URL [URL ...] --pages 200
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from drivermanager import DriverManager, browser_rss  # noqa: E402
+from replay import FixtureStore, start_replay_server  # noqa: E402
+from webscraper import WebScraper  # noqa: E402
+
+
+def load_pages(driver, urls, pages):
+    # Cycle through the listings like a long crawl, sampling the browser's memory after every page
+    load_times, rss = [], []
+    for url in itertools.islice(itertools.cycle(urls), pages):
+        start = time.perf_counter()
+        driver.get(url)
+        load_times.append(time.perf_counter() - start)
+        rss.append(browser_rss(driver))
+    return np.asarray(load_times) * 1000, np.asarray(rss) / 2**20
+
+
+def report(name, acquire_seconds, load_times, rss):
+    p50, p95 = np.percentile(load_times, [50, 95])
+    print(f"{name:<22} get driver {acquire_seconds * 1000:8.1f} ms   load p50 {p50:7.1f} ms  p95 {p95:7.1f} ms   "
+          f"browser RSS mean {rss.mean():7.1f} MiB  max {rss.max():7.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--driver', required=True, help="chromedriver path")
+    parser.add_argument('--store', help="a fixture store written by 'replay.py record'")
+    parser.add_argument('--live', nargs='+', help="listing URLs on the live site")
+    parser.add_argument('--pages', type=int, default=500, help="pages loaded by each driver")
+    parser.add_argument('--max-pages', type=int, default=200, help="pages after which a managed browser restarts")
+    args = parser.parse_args()
+
+    server = None
+    if args.live:
+        urls = args.live
+    elif args.store:
+        store = FixtureStore(args.store)
+        server = start_replay_server(store, port=0)
+        urls = [server.base_url + key for key in store.pages if key != store.start]
+    else:
+        sys.exit("Pass --store or --live.")
+
+    try:
+        start = time.perf_counter()
+        driver = WebScraper.init_driver(args.driver)
+        acquire_seconds = time.perf_counter() - start
+        try:
+            report('fresh windowed Chrome', acquire_seconds, *load_pages(driver, urls, args.pages))
+        finally:
+            driver.quit()
+
+        manager = DriverManager(args.driver, max_pages=args.max_pages)
+        try:
+            start = time.perf_counter()
+            driver = manager.acquire()
+            acquire_seconds = time.perf_counter() - start
+            report('managed, cold', acquire_seconds, *load_pages(driver, urls, args.pages))
+            driver.quit()
+
+            # The next crawl gets the released driver back
+            start = time.perf_counter()
+            driver = manager.acquire()
+            acquire_seconds = time.perf_counter() - start
+            report('managed, warm', acquire_seconds, *load_pages(driver, urls, args.pages))
+            driver.quit()
+        finally:
+            manager.close()
+    finally:
+        if server is not None:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Compares the Selenium and HTTP extraction engines on saved listing pages.
+
+Save pages first (the file names are derived from the listing URLs):
+
+    python benchmarks/bench_engines.py --record fixtures/ URL [URL ...]
+
+Then benchmark both engines offline:
+
+    python benchmarks/bench_engines.py fixtures/ --driver path/to/chromedriver
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from httpengine import HttpEngine, fixture_path, save_fixture  # noqa: E402
+
+
+def fixture_urls(fixture_dir):
+    # Fixtures are replayed under a fake host, their file names are the URL paths
+    return [f"https://fixtures.local/{os.path.splitext(os.path.basename(path))[0]}"
+            for path in sorted(glob.glob(os.path.join(fixture_dir, '*.html')))]
+
+
+def bench_http(fixture_dir, urls, repeat):
+    engine = HttpEngine(fixture_dir=fixture_dir)
+    results = {}
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for url in urls:
+            results[url] = engine.extract_info(url)
+    elapsed = time.perf_counter() - start
+    return results, elapsed / (len(urls) * repeat)
+
+
+def bench_selenium(fixture_dir, urls, driver_path):
+    from webscraper import WebScraper
+
+    driver = WebScraper.init_driver(driver_path)
+    scraper = WebScraper(driver)
+    results = {}
+    try:
+        start = time.perf_counter()
+        for url in urls:
+            driver.get('file:///' + os.path.abspath(fixture_path(fixture_dir, url)).lstrip('/'))
+            results[url] = scraper.extract_data(url)
+        elapsed = time.perf_counter() - start
+    finally:
+        driver.quit()
+    return results, elapsed / len(urls)
+
+
+def compare(http_results, selenium_results):
+    mismatches = 0
+    for url, selenium_data in selenium_results.items():
+        if http_results.get(url) != selenium_data:
+            mismatches += 1
+            print(f"Mismatch on {url}:\n  http:     {http_results.get(url)}\n  selenium: {selenium_data}")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('fixture_dir')
+    parser.add_argument('urls', nargs='*', help="URLs to save with --record")
+    parser.add_argument('--record', action='store_true', help="fetch the URLs and save them as fixtures")
+    parser.add_argument('--driver', help="chromedriver path, the Selenium engine is skipped without it")
+    parser.add_argument('--repeat', type=int, default=20, help="repetitions of the HTTP engine run")
+    args = parser.parse_args()
+
+    if args.record:
+        engine = HttpEngine()
+        for url in args.urls:
+            print(f"Saved {save_fixture(args.fixture_dir, url, engine.fetch(url))}")
+        return
+
+    urls = fixture_urls(args.fixture_dir)
+    if not urls:
+        sys.exit(f"No fixtures found in {args.fixture_dir}")
+
+    http_results, http_time = bench_http(args.fixture_dir, urls, args.repeat)
+    print(f"http:     {len(urls)} pages, {http_time * 1000:.2f} ms per listing")
+
+    if args.driver:
+        selenium_results, selenium_time = bench_selenium(args.fixture_dir, urls, args.driver)
+        print(f"selenium: {len(urls)} pages, {selenium_time * 1000:.2f} ms per listing")
+        print(f"speedup:  {selenium_time / http_time:.1f}x, mismatching pages: {compare(http_results, selenium_results)}")
+
+
+if __name__ == '__main__':
+    main()
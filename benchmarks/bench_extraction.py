@@ -0,0 +1,147 @@
+"""
+Compares extracting a listing page element by element over WebDriver, one round-trip per row and cell, with the
+single pass that reads the page source once and parses it locally. Uses the saved pages of bench_engines.py:
+
+    python benchmarks/bench_extraction.py fixtures/ --driver path/to/chromedriver
+
+Without --driver only the local parsing of the single pass is timed.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from bench_engines import fixture_urls  # noqa: E402
+from httpengine import fixture_path  # noqa: E402
+from listingparser import (LOKACE_XPATH, TYP_NABIDKY_XPATH, CENA_XPATH, EXTRA_DATA_XPATH,  # noqa: E402
+                           PARAMETERS_AREA_XPATH, PARAMETERS_TABLES_XPATH, POI_AREA_XPATH, POI_TABLES_XPATH,
+                           POI_ITEM_XPATH, POI_TITLE_XPATH, POI_VALUE_XPATH, parse_listing_html)
+from selenium.common.exceptions import NoSuchElementException  # noqa: E402
+from selenium.webdriver.common.by import By  # noqa: E402
+
+
+def first_text(parent, xpath):
+    elements = parent.find_elements(By.XPATH, xpath)
+    return elements[0].text.strip().replace('\n', '') if elements else None
+
+
+def element_by_element(driver, url):
+    # The scraper's former extraction: every field, row and cell is a WebDriver call
+    data = {"URL": url, "LOKACE": first_text(driver, LOKACE_XPATH), "TYP NABÍDKY": first_text(driver, TYP_NABIDKY_XPATH),
+            "CENA": first_text(driver, CENA_XPATH)}
+
+    if data["TYP NABÍDKY"] != "PRODEJ":
+        for div in driver.find_elements(By.XPATH, EXTRA_DATA_XPATH):
+            title, value = first_text(div, './span[1]/span'), first_text(div, './span[2]/strong')
+            if title is not None and value is not None:
+                data[title.replace('+', '')] = value
+
+    if driver.find_elements(By.XPATH, PARAMETERS_AREA_XPATH):
+        for table in driver.find_elements(By.XPATH, PARAMETERS_TABLES_XPATH):
+            for row in table.find_elements(By.TAG_NAME, 'tr'):
+                title = first_text(row, './th')
+                value = first_text(row, './td') or first_text(row, './td/div/a/span/span[1]')
+                if value is None:
+                    continue
+                if title is None:
+                    title = "title"
+                if title != "":
+                    data[title] = value
+                else:
+                    data[value] = 1
+
+    if driver.find_elements(By.XPATH, POI_AREA_XPATH):
+        for table in driver.find_elements(By.XPATH, POI_TABLES_XPATH):
+            for div in table.find_elements(By.XPATH, POI_ITEM_XPATH):
+                try:
+                    title = div.find_element(By.XPATH, POI_TITLE_XPATH).text.strip().replace('\n', '')
+                    value = div.find_element(By.XPATH, POI_VALUE_XPATH).text.strip().replace('\n', '')
+                except NoSuchElementException:
+                    continue
+                data[title] = value.replace(u'\xa0', u' ')
+
+    return data
+
+
+def single_pass(driver, url):
+    # What WebScraper.extract_data does: one call for the page source, the rest is local
+    return parse_listing_html(driver.page_source, url)
+
+
+def count_round_trips(driver):
+    # Elements execute their commands through the driver, so this counts every call to the browser
+    calls = [0]
+    execute = driver.execute
+
+    def counting_execute(*args, **kwargs):
+        calls[0] += 1
+        return execute(*args, **kwargs)
+
+    driver.execute = counting_execute
+    return calls
+
+
+def bench_parse(fixture_dir, urls, repeat):
+    pages = {}
+    for url in urls:
+        with open(fixture_path(fixture_dir, url), encoding='utf-8') as page_file:
+            pages[url] = page_file.read()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for url, page_source in pages.items():
+            parse_listing_html(page_source, url)
+    return (time.perf_counter() - start) / (len(urls) * repeat)
+
+
+def bench_driver(fixture_dir, urls, driver_path):
+    from webscraper import WebScraper
+
+    driver = WebScraper.init_driver(driver_path)
+    calls = count_round_trips(driver)
+    totals = {extract.__name__: [0.0, 0] for extract in (element_by_element, single_pass)}
+    mismatches = 0
+    try:
+        for url in urls:
+            driver.get('file:///' + os.path.abspath(fixture_path(fixture_dir, url)).lstrip('/'))
+            results = []
+            for extract in (element_by_element, single_pass):
+                calls[0] = 0
+                start = time.perf_counter()
+                results.append(extract(driver, url))
+                totals[extract.__name__][0] += time.perf_counter() - start
+                totals[extract.__name__][1] += calls[0]
+            if results[0] != results[1]:
+                mismatches += 1
+                print(f"Mismatch on {url}:\n  element by element: {results[0]}\n  single pass:        {results[1]}")
+    finally:
+        driver.quit()
+    return {name: (seconds / len(urls), round_trips / len(urls)) for name, (seconds, round_trips) in totals.items()}, \
+        mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('fixture_dir')
+    parser.add_argument('--driver', help="chromedriver path, the WebDriver comparison is skipped without it")
+    parser.add_argument('--repeat', type=int, default=20, help="repetitions of the local parsing")
+    args = parser.parse_args()
+
+    urls = fixture_urls(args.fixture_dir)
+    if not urls:
+        sys.exit(f"No fixtures found in {args.fixture_dir}")
+
+    print(f"local parse:        {len(urls)} pages, {bench_parse(args.fixture_dir, urls, args.repeat) * 1000:.2f} ms "
+          f"per listing")
+
+    if args.driver:
+        results, mismatches = bench_driver(args.fixture_dir, urls, args.driver)
+        for name, (seconds, round_trips) in results.items():
+            print(f"{name.replace('_', ' '):<19} {seconds * 1000:8.2f} ms per listing, {round_trips:6.1f} round-trips")
+        print(f"mismatching pages: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Compares the notebook's modeling_data CSV files with the FeatureStore: the time to write and load a train/test split,
+and the memory that processes loading the same split hold on their own (USS) versus in pages they share.
+
+    python benchmarks/bench_featurestore.py --rows 1000000 --processes 4
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import psutil
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from featurestore import FeatureStore, SPLIT_ARRAYS  # noqa: E402
+
+MODELING_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'modeling_data')
+
+
+def make_split(rows):
+    # Resample the notebook's split to the wanted size
+    frames = {name: pd.read_csv(os.path.join(MODELING_DATA, f'{name}.csv')) for name in SPLIT_ARRAYS}
+    rng = np.random.default_rng(42)
+    split = {}
+    for part, share in (('train', 0.8), ('test', 0.2)):
+        picked = rng.integers(0, len(frames[f'X_{part}']), int(rows * share))
+        split[f'X_{part}'] = frames[f'X_{part}'].iloc[picked].reset_index(drop=True)
+        split[f'y_{part}'] = frames[f'y_{part}'].iloc[picked].reset_index(drop=True)
+    return split
+
+
+def load_and_touch(store_path, mmap, ready, done):
+    # A training or scoring process: load the split and read all of it
+    features = FeatureStore(store_path).load(mmap=mmap)
+    total = sum(float(features[name].sum()) for name in SPLIT_ARRAYS)
+    memory = psutil.Process().memory_full_info()
+    ready.put((memory.uss, memory.rss, total))
+    done.wait()
+
+
+def measure_processes(store_path, mmap, processes):
+    ready, done = multiprocessing.Queue(), multiprocessing.Event()
+    workers = [multiprocessing.Process(target=load_and_touch, args=(store_path, mmap, ready, done))
+               for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    results = [ready.get() for _ in workers]
+    done.set()
+    for worker in workers:
+        worker.join()
+    return np.mean([uss for uss, _, _ in results]) / 2**20, np.mean([rss for _, rss, _ in results]) / 2**20
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--processes', type=int, default=4, help="processes loading the same split")
+    args = parser.parse_args()
+
+    split = make_split(args.rows)
+    with tempfile.TemporaryDirectory() as work_dir:
+        def write_csv():
+            for name, frame in split.items():
+                frame.to_csv(os.path.join(work_dir, f'{name}.csv'), index=False)
+
+        def read_csv():
+            return {name: pd.read_csv(os.path.join(work_dir, f'{name}.csv')) for name in SPLIT_ARRAYS}
+
+        store = FeatureStore(os.path.join(work_dir, 'store'))
+        _, csv_write = timed(write_csv)
+        _, csv_read = timed(read_csv)
+        _, store_write = timed(store.write, 'bench', {name: frame.to_numpy() for name, frame in split.items()},
+                               split['X_train'].columns)
+        _, store_load = timed(store.load)
+        features, store_read = timed(store.load, mmap=False)
+
+        size = sum(features[name].nbytes for name in SPLIT_ARRAYS) / 2**20
+        print(f"{args.rows} rows, {len(split['X_train'].columns)} features, {size:.1f} MiB as float32")
+        print(f"csv           write {csv_write:9.1f} ms   read {csv_read:9.1f} ms")
+        print(f"feature store write {store_write:9.1f} ms   load {store_load:9.1f} ms memory-mapped, "
+              f"{store_read:9.1f} ms read into memory")
+
+        for mmap in (False, True):
+            uss, rss = measure_processes(store.root, mmap, args.processes)
+            print(f"{args.processes} processes, {'memory-mapped' if mmap else 'read into memory':<17} "
+                  f"own memory (USS) {uss:8.1f} MiB per process, resident (RSS) {rss:8.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
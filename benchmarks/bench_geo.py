@@ -0,0 +1,80 @@
+"""
+Times region assignment for random points over the Czech Republic: a shapely STRtree 'within' query as used by
+spatial joins, and RegionIndex.assign. Also times resolving the scraped LOKACE strings with the notebook's substring
+loop and with resolve_region once per distinct string.
+
+    python benchmarks/bench_geo.py --points 1000000
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+import shapely
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from datahandler import map_unique_values  # noqa: E402
+from geo import GADM_FILE, LOCATIONS, load_region_index, resolve_region  # noqa: E402
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SAMPLE_FILE = os.path.join(ROOT_DIR, 'listings_data.csv')
+
+
+def strtree_assign(index, lng, lat):
+    # One predicate test per point and candidate polygon, like geopandas.sjoin with predicate='within'
+    tree = shapely.STRtree(index.geometries)
+    return tree.query(shapely.points(lng, lat), predicate='within')
+
+
+def legacy_resolve(locations):
+    # The notebook's standardization, one substring search over all rows per location
+    locations = locations.copy()
+    for old_name, new_name in LOCATIONS:
+        locations[locations.str.contains(old_name, case=False)] = new_name
+    return locations
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, default=1_000_000)
+    parser.add_argument('--rows', type=int, default=1_000_000, help="LOKACE strings to resolve")
+    args = parser.parse_args()
+
+    index, seconds = timed(load_region_index, os.path.join(ROOT_DIR, GADM_FILE))
+    print(f"load shapefile      {seconds * 1000:10.1f} ms")
+
+    # Uniform points over the bounding box of the country, about 60 % of them fall inside a region
+    min_lng, min_lat = index.bounds[:, :2].min(axis=0)
+    max_lng, max_lat = index.bounds[:, 2:].max(axis=0)
+    rng = np.random.default_rng(42)
+    lng = rng.uniform(min_lng, max_lng, args.points)
+    lat = rng.uniform(min_lat, max_lat, args.points)
+
+    regions, seconds = timed(index.assign, lng, lat)
+    print(f"RegionIndex.assign  {seconds * 1000:10.1f} ms  {regions.notna().sum()} of {args.points} points assigned")
+    if args.points <= 200_000:
+        _, seconds = timed(strtree_assign, index, lng, lat)
+        print(f"STRtree within      {seconds * 1000:10.1f} ms")
+    else:
+        _, seconds = timed(strtree_assign, index, lng[:100_000], lat[:100_000])
+        print(f"STRtree within      {seconds * 1000:10.1f} ms  for the first 100000 points")
+
+    locations = pd.read_csv(SAMPLE_FILE, usecols=['LOKACE'])['LOKACE'].dropna()
+    locations = locations.sample(n=args.rows, replace=True, random_state=42).reset_index(drop=True)
+    legacy, seconds = timed(legacy_resolve, locations)
+    print(f"substring loop      {seconds * 1000:10.1f} ms")
+    # DataHandler resolves each distinct location once
+    resolved, seconds = timed(map_unique_values, locations, lambda uniques: uniques.map(resolve_region))
+    print(f"resolve_region      {seconds * 1000:10.1f} ms  {(legacy.to_numpy() != resolved).sum()} rows differ")
+
+
+if __name__ == '__main__':
+    main()
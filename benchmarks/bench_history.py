@@ -0,0 +1,75 @@
+"""
+Compares the notebook's rebuild of the combined dataset, reading the 2022 Excel export and the listings CSV and
+renaming and standardizing both every time, with ListingsHistory: the one-off Excel conversion, appending a crawl and
+loading every year. The listings CSV is appended once per simulated later year, so the history grows to --years years.
+
+    python benchmarks/bench_history.py --years 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from geo import GADM_FILE, LOCATIONS, assign_regions  # noqa: E402
+from history import LEGACY_COLUMN_MAPPING, ListingsHistory  # noqa: E402
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SAMPLE_FILE = os.path.join(ROOT_DIR, 'listings_data.csv')
+EXCEL_FILE = os.path.join(ROOT_DIR, 'data', 'data_2022.xlsx')
+
+
+def notebook_rebuild():
+    # The notebook's cells: read both sources, find and standardize the regions, rename and concatenate
+    df_main = pd.read_csv(SAMPLE_FILE)
+    df_old = pd.read_excel(EXCEL_FILE)
+    df_old['LOKACE'] = assign_regions(df_old['lng'], df_old['lat'], os.path.join(ROOT_DIR, GADM_FILE)).astype(object)
+    df_old['SCRAPED IN'] = 2022
+    df_main['SCRAPED IN'] = 2023
+
+    df_main = df_main.dropna(subset=['LOKACE'])
+    for old_name, new_name in LOCATIONS:
+        df_main.loc[df_main['LOKACE'].str.contains(old_name, case=False), 'LOKACE'] = new_name
+    df_main = df_main[df_main['LOKACE'].isin([new_name for _, new_name in LOCATIONS])]
+
+    df_old = df_old.rename(columns=LEGACY_COLUMN_MAPPING)
+    df = pd.concat([df_main, df_old], ignore_index=True)
+    df['TYP NABÍDKY'] = df['TYP NABÍDKY'].replace({'prodej': 'PRODEJ', 'pronajem': 'PRONÁJEM'})
+    return df
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--years', type=int, default=5, help="years in the history, including 2022")
+    args = parser.parse_args()
+
+    combined, seconds = timed(notebook_rebuild)
+    print(f"notebook rebuild, 2 years    {seconds * 1000:9.1f} ms  {len(combined)} rows")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        history = ListingsHistory(os.path.join(work_dir, 'history'))
+        _, seconds = timed(history.import_excel, EXCEL_FILE, 2022, os.path.join(ROOT_DIR, GADM_FILE))
+        print(f"convert the Excel export     {seconds * 1000:9.1f} ms  once")
+
+        for year in range(2023, 2022 + args.years):
+            _, seconds = timed(history.append_csv, SAMPLE_FILE, year)
+        print(f"append a crawl               {seconds * 1000:9.1f} ms  {os.path.getsize(SAMPLE_FILE) >> 10} KiB CSV")
+
+        listings, seconds = timed(history.load)
+        label = f'load the history, {len(history.years())} years'
+        print(f"{label:<28} {seconds * 1000:9.1f} ms  {len(listings)} rows")
+        listings, seconds = timed(history.load, [2022, 2023])
+        print(f"load 2022 and 2023           {seconds * 1000:9.1f} ms  {len(listings)} rows")
+
+
+if __name__ == '__main__':
+    main()
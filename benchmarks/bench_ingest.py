@@ -0,0 +1,75 @@
+"""
+Compares loading the listings CSV untyped and cleaning it in one piece with the typed, chunked ingest.
+Each loader runs in its own process, so the reported peak RSS belongs to that loader alone.
+
+    python benchmarks/bench_ingest.py --rows 1000000
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'listings_data.csv')
+
+
+def run_loader(loader, file_name, block_size):
+    # Runs inside the child process
+    sys.path.insert(0, APP_DIR)
+    import pandas as pd
+    from datahandler import DataHandler
+    from ingest import load_listings
+
+    start = time.perf_counter()
+    if loader == 'legacy':
+        cleaned = DataHandler(pd.read_csv(file_name)).clean_data(verbose=False)
+    elif block_size:
+        cleaned = load_listings(file_name, block_size)
+    else:
+        cleaned = load_listings(file_name)
+    elapsed = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{loader:<8} {elapsed:7.2f} s  peak RSS {peak_rss:7.0f} MiB  rows {len(cleaned)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, help="benchmark a synthetic file with this many rows instead of the sample")
+    parser.add_argument('--block-size', type=int, help="bytes parsed per chunk, the ingest default if omitted")
+    parser.add_argument('--loader', choices=['legacy', 'chunked'], help=argparse.SUPPRESS)
+    parser.add_argument('--file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.loader:
+        run_loader(args.loader, args.file, args.block_size)
+        return
+
+    file_name = SAMPLE_FILE
+    temp_dir = None
+    if args.rows:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        from bench_clean_data import make_listings
+
+        temp_dir = tempfile.TemporaryDirectory()
+        file_name = os.path.join(temp_dir.name, 'listings.csv')
+        make_listings(args.rows, file_name)
+
+    print(f"{file_name}: {os.path.getsize(file_name) / 2**20:.0f} MiB")
+    try:
+        for loader in ['legacy', 'chunked']:
+            command = [sys.executable, __file__, '--loader', loader, '--file', file_name]
+            if args.block_size:
+                command += ['--block-size', str(args.block_size)]
+            subprocess.run(command, check=True)
+    finally:
+        if temp_dir:
+            temp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Crawls a synthetic multi-segment site, written into a fixture store and served by the replay server with a per-page
+latency, with the CrawlPlanner for every number of worker processes. With --driver, the serial baseline walks the
+same segments one after the other with scrape_listings, clicking through the pagination in Chrome.
+
+    python benchmarks/bench_planner.py --segments 8 --pages 5 --workers 1 2 4 8 --latency 0.2
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from crawlplanner import BASE_URL, CrawlPlanner, plan_segments  # noqa: E402
+from listingparser import CENA_XPATH, LOKACE_XPATH, PARAMETERS_TABLES_XPATH, TYP_NABIDKY_XPATH  # noqa: E402
+from metrics import CrawlMetrics  # noqa: E402
+from replay import FixtureStore, start_replay_server  # noqa: E402
+from webscraper import LISTING_CARD_XPATH, WebScraper  # noqa: E402
+
+LISTING_URL = f'{BASE_URL}/nemovitosti-byty-domy/{{}}-nabidka'
+
+
+def element(root, xpath):
+    # Creates the elements of an absolute XPath such as /html/body/div[1]/main, as far as they are missing
+    node = root
+    for step in xpath.split('/')[2:]:
+        tag, position = re.fullmatch(r'(\w+)(?:\[(\d+)\])?', step).groups()
+        children = [child for child in node if child.tag == tag]
+        while len(children) < int(position or 1):
+            children.append(etree.SubElement(node, tag))
+        node = children[int(position or 1) - 1]
+    return node
+
+
+def document(root):
+    # The page XPaths start either from the root or from the Next.js container
+    element(root, '/html/body/div[1]').set('id', '__next')
+    return etree.tostring(root, encoding='unicode')
+
+
+def listing_page(number, segment):
+    root = etree.Element('html')
+    element(root, LOKACE_XPATH).text = segment.region
+    element(root, TYP_NABIDKY_XPATH.replace('//*[@id="__next"]', '/html/body/div[1]')).text = segment.offer_type
+    element(root, CENA_XPATH).text = f'{10_000 + number} Kč'
+    table = etree.SubElement(element(root, PARAMETERS_TABLES_XPATH), 'table')
+    for name, value in (('Dispozice', '2+kk'), ('Plocha', f'{40 + number % 60} m²'), ('Podlaží', '3')):
+        row = etree.SubElement(table, 'tr')
+        etree.SubElement(row, 'th').text = name
+        etree.SubElement(row, 'td').text = value
+    return document(root)
+
+
+def results_page(numbers, page, pages):
+    root = etree.Element('html')
+    section = element(root, LISTING_CARD_XPATH.replace('//*[@id="__next"]', '/html/body/div[1]').rsplit('/', 1)[0])
+    for number in numbers:
+        card = etree.SubElement(section, 'article')
+        etree.SubElement(card, 'div')
+        heading = etree.SubElement(etree.SubElement(card, 'div'), 'h2')
+        etree.SubElement(heading, 'a', href=LISTING_URL.format(number)).text = f'Listing {number}'
+
+    # The numbered pagination links and the 'next' link the serial scraper clicks
+    pagination = etree.SubElement(element(root, '/html/body/div[1]/main'), 'ul')
+    for other_page in range(1, pages + 1):
+        item = etree.SubElement(pagination, 'li', {'class': 'page-item'})
+        etree.SubElement(item, 'a', {'class': 'page-link', 'href': f'?page={other_page}'}).text = str(other_page)
+    if page < pages:
+        item = etree.SubElement(pagination, 'li', {'class': 'page-item'})
+        link = etree.SubElement(item, 'a', {'class': 'page-link', 'href': f'?page={page + 1}'})
+        etree.SubElement(link, 'span').text = 'Další'
+    return document(root)
+
+
+def build_site(store, segments, pages, cards):
+    number = 0
+    for segment in segments:
+        for page in range(1, pages + 1):
+            numbers = range(number, number + cards)
+            store.save(segment.page_url(page), results_page(numbers, page, pages))
+            for listing_number in numbers:
+                store.save(LISTING_URL.format(listing_number), listing_page(listing_number, segment))
+            number += cards
+    store.start = segments[0].page_url(1)
+
+
+def run_planner(store, segments, workers, latency):
+    server = start_replay_server(store, port=0, latency=latency)
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            planner = CrawlPlanner(segments, workers=workers, base_url=server.base_url, min_request_interval=0.0,
+                                   output_file=os.path.join(work_dir, 'listings.csv'), metrics=CrawlMetrics())
+            start = time.perf_counter()
+            planner.crawl()
+            elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        server.server_close()
+    return planner.listings_count, elapsed, server.requests
+
+
+def run_serial(store, segments, driver_path, latency):
+    server = start_replay_server(store, port=0, latency=latency)
+    listings = 0
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            start = time.perf_counter()
+            for segment in segments:
+                scraper = WebScraper(WebScraper.init_driver(driver_path), engine='http',
+                                     output_file=os.path.join(work_dir, 'listings.csv'), metrics=CrawlMetrics())
+                scraper.scrape_listings(segment.page_url(1, server.base_url), max_pages=10**6)
+                scraper.driver.quit()
+                listings += scraper.listings_count
+            elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        server.server_close()
+    return listings, elapsed, server.requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--segments', type=int, default=8, help="the number of region segments of the site")
+    parser.add_argument('--pages', type=int, default=5, help="results pages per segment")
+    parser.add_argument('--cards', type=int, default=20, help="listings per results page")
+    parser.add_argument('--workers', nargs='+', type=int, default=[1, 2, 4])
+    parser.add_argument('--latency', type=float, default=0.2, help="seconds the replay server adds to every page")
+    parser.add_argument('--driver', help="chromedriver path, adds the serial scrape_listings baseline")
+    args = parser.parse_args()
+
+    segments = plan_segments(['PRONÁJEM', 'PRODEJ'], ['BYT'])[:args.segments]
+    with tempfile.TemporaryDirectory() as site_dir:
+        store = FixtureStore(site_dir)
+        build_site(store, segments, args.pages, args.cards)
+
+        print(f"{len(segments)} segments of {args.pages} pages with {args.cards} listings, "
+              f"{args.latency * 1000:.0f} ms per page")
+        print(f"{'crawl':<18} {'listings':>8} {'seconds':>8} {'listings/s':>10} {'requests':>8}")
+        runs = [(f'planner, {workers} workers', run_planner, (workers,)) for workers in args.workers]
+        if args.driver:
+            runs.insert(0, ('serial baseline', run_serial, (args.driver,)))
+        for label, run, extra in runs:
+            listings, seconds, requests = run(store, segments, *extra, args.latency)
+            print(f"{label:<18} {listings:>8} {seconds:>8.1f} {listings / seconds:>10.2f} {requests:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Measures price prediction throughput and latency: the notebook's one-listing-at-a-time prediction, PricePipeline
+batches, and the HTTP endpoint with concurrent clients.
+
+    python benchmarks/bench_price_model.py --model xgboost --requests 2000
+"""
+import argparse
+import http.client
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from ingest import load_listings  # noqa: E402
+from pricemodel import (PricePipeline, default_price_model, training_frame, start_price_server,  # noqa: E402
+                        NUMERIC_FEATURES, DISPOZICE_ORDER, PENB_ORDER, VYBAVENO_ORDER)
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'listings_data.csv')
+
+
+def notebook_predict(pipeline, details):
+    # The per-listing prediction cells of the modeling notebook
+    new_data_raw = pd.DataFrame([details])
+    new_data_raw['Dispozice'] = new_data_raw['Dispozice'].map({c: i for i, c in enumerate(DISPOZICE_ORDER)})
+    new_data_raw['PENB'] = new_data_raw['PENB'].map({c: i for i, c in enumerate(PENB_ORDER)}).fillna(0)
+    new_data_raw['Vybaveno'] = new_data_raw['Vybaveno'].map({c: i for i, c in enumerate(VYBAVENO_ORDER)}).fillna(0)
+    new_data_raw = pd.get_dummies(new_data_raw, columns=['Kraj'])
+    for c in set(pipeline.feature_columns) - set(new_data_raw.columns):
+        new_data_raw[c] = 0
+    new_data_raw = new_data_raw[pipeline.feature_columns].astype(float)
+    new_data_raw[NUMERIC_FEATURES] = pipeline.scaler.transform(new_data_raw[NUMERIC_FEATURES].to_numpy())
+    prediction = pipeline.model.predict(new_data_raw.to_numpy()).reshape(-1, 1)
+    return pipeline.scaler_cena.inverse_transform(prediction)[0][0]
+
+
+def create_model(name):
+    if name == 'xgboost':
+        return default_price_model()
+    # A gradient boosting stand-in with the notebook's parameters for environments without xgboost
+    from sklearn.ensemble import HistGradientBoostingRegressor
+    return HistGradientBoostingRegressor(max_iter=100, max_depth=5, learning_rate=0.1, random_state=42)
+
+
+def percentiles(latencies):
+    return np.percentile(np.asarray(latencies) * 1000, [50, 99])
+
+
+def bench_http(port, listings, batch_size, requests, clients):
+    batches = [listings[i % len(listings):i % len(listings) + batch_size] for i in range(0, requests * batch_size,
+                                                                                        batch_size)]
+
+    def client(client_batches):
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        latencies = []
+        for batch in client_batches:
+            body = json.dumps(batch, ensure_ascii=False).encode('utf-8')
+            start = time.perf_counter()
+            connection.request('POST', '/predict', body, {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            latencies.append(time.perf_counter() - start)
+        connection.close()
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as executor:
+        results = list(executor.map(client, [batches[i::clients] for i in range(clients)]))
+    elapsed = time.perf_counter() - start
+    latencies = [latency for result in results for latency in result]
+    p50, p99 = percentiles(latencies)
+    print(f"http batch {batch_size:>4}, {clients} clients: {requests * batch_size / elapsed:>9.0f} predictions/s  "
+          f"p50 {p50:6.2f} ms  p99 {p99:6.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', choices=['xgboost', 'sklearn'], default='xgboost')
+    parser.add_argument('--requests', type=int, default=2000, help="HTTP requests per scenario")
+    parser.add_argument('--clients', type=int, default=8)
+    args = parser.parse_args()
+
+    df = training_frame(load_listings(SAMPLE_FILE), 2023)
+    pipeline = PricePipeline(create_model(args.model)).fit(df)
+
+    listings = df[df['Dispozice'].isin(DISPOZICE_ORDER)].drop(columns='Cena').to_dict('records')
+
+    # The notebook predicts one listing per call
+    latencies = []
+    for details in listings[:200]:
+        start = time.perf_counter()
+        notebook_predict(pipeline, details)
+        latencies.append(time.perf_counter() - start)
+    p50, p99 = percentiles(latencies)
+    print(f"notebook, one listing:     {1 / np.mean(latencies):>9.0f} predictions/s  "
+          f"p50 {p50:6.2f} ms  p99 {p99:6.2f} ms")
+
+    latencies = []
+    for details in listings[:2000]:
+        start = time.perf_counter()
+        pipeline.predict_batch([details])
+        latencies.append(time.perf_counter() - start)
+    p50, p99 = percentiles(latencies)
+    print(f"predict_batch, 1 listing:  {1 / np.mean(latencies):>9.0f} predictions/s  "
+          f"p50 {p50:6.2f} ms  p99 {p99:6.2f} ms")
+
+    for batch_size in [100, 1000]:
+        batch = (listings * (batch_size // len(listings) + 1))[:batch_size]
+        start = time.perf_counter()
+        rounds = 20
+        for _ in range(rounds):
+            pipeline.predict_batch(batch)
+        elapsed = time.perf_counter() - start
+        print(f"predict_batch, {batch_size:>4} listings: {rounds * batch_size / elapsed:>9.0f} predictions/s")
+
+    server = start_price_server(pipeline, port=0)
+    try:
+        port = server.server_address[1]
+        for batch_size in [1, 100]:
+            bench_http(port, listings, batch_size, args.requests, args.clients)
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Compares the previous row-by-row save_to_csv with the vectorized CSV and Parquet writers.
+
+    python benchmarks/bench_save_to_csv.py --sizes 100000 1000000
+"""
+import argparse
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from listingwriter import LISTING_COLUMNS, records_to_frame, write_csv, write_parquet  # noqa: E402
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'listings_data.csv')
+
+
+def legacy_save_to_csv(records, file_name):
+    # The save_to_csv implementation before the vectorized writer
+    df = pd.DataFrame(records)
+    df.insert(0, 'Index', range(1, len(df) + 1))
+    df.rename(columns={'Poplatky za energie': 'POPLATKY ZA ENERGIE', 'Poplatky za služby': 'POPLATKY ZA SLUŽBY',
+                       'Vratná kauce': 'VRATNÁ KAUCE'}, inplace=True)
+    fixed_schema_df = pd.DataFrame(columns=LISTING_COLUMNS)
+    fixed_schema_df.insert(0, 'Index', range(1, len(fixed_schema_df) + 1))
+    combined_df = pd.concat([fixed_schema_df, df], axis=0, ignore_index=True, sort=False).fillna('NaN')[LISTING_COLUMNS]
+    combined_df.reset_index(drop=True, inplace=True)
+    combined_df.insert(0, 'Index', range(1, len(combined_df) + 1))
+
+    file_exists = os.path.isfile(file_name)
+    with open(file_name, 'a', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=combined_df.columns)
+        if not file_exists:
+            writer.writeheader()
+        for _, row in combined_df.iterrows():
+            writer.writerow(row.to_dict())
+
+
+def make_records(size):
+    # Scraped records look like the rows of the sample file without their empty fields
+    sample = pd.read_csv(SAMPLE_FILE, dtype=str).drop(columns=['Index', 'POPLATKY ZA ENERGII'], errors='ignore')
+    sample = sample.sample(n=size, replace=True, random_state=42)
+    return [{key: value for key, value in row.items() if pd.notna(value)} for row in sample.to_dict('records')]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--skip-legacy', action='store_true', help="skip the slow row-by-row writer")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        for size in args.sizes:
+            records = make_records(size)
+            results = {}
+            if not args.skip_legacy:
+                results['legacy csv'] = timed(legacy_save_to_csv, records, os.path.join(work_dir, f'legacy_{size}.csv'))
+            results['vectorized csv'] = timed(lambda: write_csv(records_to_frame(records), os.path.join(work_dir, f'new_{size}.csv')))
+            results['parquet'] = timed(lambda: write_parquet(records_to_frame(records), os.path.join(work_dir, f'parquet_{size}')))
+
+            for name, seconds in results.items():
+                print(f"{size:>9} rows  {name:<15} {seconds:8.2f} s  {size / seconds:>10.0f} rows/s")
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Measures the latency of the dashboard queries while a background crawl streams listings into the live dataset.
+The crawl replays sample listings through WebScraper's batch writer with a simulated page download time, and the
+CrawlScheduler loads the written batches into the ListingsCube.
+
+    python benchmarks/bench_scheduler.py --rows 200000 --listings 2000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from bench_clean_data import make_listings  # noqa: E402
+from cache import CleanedListingsCache  # noqa: E402
+from cube import ListingsCube  # noqa: E402
+from listingwriter import LISTING_COLUMNS  # noqa: E402
+from scheduler import CrawlScheduler  # noqa: E402
+from webscraper import WebScraper  # noqa: E402
+
+
+def query_latencies(cube, seconds):
+    # The dashboard callbacks, one after another like a busy user
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        cube.by_disposition('PRONÁJEM', 'Cena', ['Praha'])
+        cube.by_region('PRODEJ', 'Cena za m²')
+        cube.new_building_shares('PRONÁJEM', 'PENB')
+        latencies.append(time.perf_counter() - start)
+        time.sleep(0.01)
+    return np.asarray(latencies) * 1000
+
+
+def report(name, latencies):
+    p50, p99, worst = np.percentile(latencies, [50, 99, 100])
+    print(f"{name:<14} {len(latencies):6d} queries  p50 {p50:6.2f} ms  p99 {p99:6.2f} ms  max {worst:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200_000, help="listings in the dataset before the crawl")
+    parser.add_argument('--listings', type=int, default=2_000, help="listings written by the crawl")
+    parser.add_argument('--page-time', type=float, default=0.005, help="simulated seconds to download a listing")
+    parser.add_argument('--refresh-interval', type=float, default=2.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        file_name = os.path.join(work_dir, 'listings.csv')
+        # Write the dataset in the scraper's own column layout, so the crawl can append to it
+        listings = make_listings(args.rows + args.listings).reindex(columns=['Index'] + LISTING_COLUMNS)
+        listings.iloc[:args.rows].to_csv(file_name, index=False)
+        records = listings.iloc[args.rows:].drop(columns='Index').to_dict('records')
+
+        cache = CleanedListingsCache(os.path.join(work_dir, 'cleaned.parquet'))
+        cube = ListingsCube(cache.load(file_name), 2023)
+
+        def refresh():
+            cube.apply_changes(cache.load_changes(file_name), 2023)
+
+        def crawl(scheduler):
+            # A driverless scraper, only its batching and CSV writing are used
+            scraper = WebScraper(None, output_file=file_name, on_flush=scheduler.report,
+                                 output_lock=scheduler.output_lock)
+            for record in records:
+                time.sleep(args.page_time)
+                scraper.handle_listing(record['URL'], record)
+            scraper.flush_pending()
+
+        report('idle', query_latencies(cube, 3))
+
+        scheduler = CrawlScheduler(crawl, on_data=refresh, refresh_interval=args.refresh_interval)
+        scheduler.start()
+        scheduler.request_crawl()
+
+        # Query until the crawl has finished and its last batch is in the cube
+        latencies = []
+        while scheduler.progress.snapshot()['state'] != 'idle' or scheduler.progress.runs == 0:
+            latencies.append(query_latencies(cube, 1))
+        time.sleep(args.refresh_interval)
+        latencies.append(query_latencies(cube, 1))
+        scheduler.stop()
+
+        report('during crawl', np.concatenate(latencies))
+        progress = scheduler.progress.snapshot()
+        print(f"crawl wrote {progress['listings']} listings in {progress['elapsed']:.1f} s "
+              f"({progress['listings_per_minute']:.0f} listings/min), cube updated {cube.version} times, "
+              f"{int(cube.cube['count'].sum())} listings in the cube")
+
+
+if __name__ == '__main__':
+    main()
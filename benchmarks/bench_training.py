@@ -0,0 +1,79 @@
+"""
+Compares the notebook's full retrain, hand preprocessing with CSV files and GridSearchCV refitting every candidate,
+with train_price_model: a grid and a successive halving search from an empty cache, and a re-run on the same data.
+
+    python benchmarks/bench_training.py --model xgboost --rows 20000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from bench_price_model import create_model, SAMPLE_FILE  # noqa: E402
+from ingest import load_listings  # noqa: E402
+from pricemodel import PricePipeline, training_frame  # noqa: E402
+from training import XGBOOST_GRID, train_price_model  # noqa: E402
+from sklearn.model_selection import GridSearchCV, train_test_split  # noqa: E402
+
+# The notebook's grid with the stand-in's parameter names
+SKLEARN_GRID = {
+    'l2_regularization': [0.0, 1.0],
+    'max_iter': [50, 100],
+    'max_depth': [2, 5, 7],
+    'learning_rate': [0.01, 0.1],
+}
+
+
+def notebook_retrain(cleaned, model, grid, work_dir):
+    # The notebook's cells: preprocess, split, write the CSV files, read them back and grid search
+    train, test = train_test_split(training_frame(cleaned, 2023), test_size=0.2, random_state=42)
+    preprocessor = PricePipeline(None)
+    X_train, y_train = preprocessor.fit_transform(train)
+    pd.DataFrame(X_train).to_csv(os.path.join(work_dir, 'X_train.csv'), index=False)
+    pd.DataFrame(y_train).to_csv(os.path.join(work_dir, 'y_train.csv'), index=False)
+    X_train = pd.read_csv(os.path.join(work_dir, 'X_train.csv')).to_numpy()
+    y_train = pd.read_csv(os.path.join(work_dir, 'y_train.csv')).to_numpy().ravel()
+
+    grid_search = GridSearchCV(model, grid, n_jobs=-1, cv=5)
+    grid_search.fit(X_train, y_train)
+    return grid_search.best_params_
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', choices=['xgboost', 'sklearn'], default='xgboost')
+    parser.add_argument('--rows', type=int, default=0, help="resample the listings to this many rows, 0 keeps them")
+    args = parser.parse_args()
+
+    cleaned = load_listings(SAMPLE_FILE)
+    if args.rows:
+        cleaned = cleaned.sample(n=args.rows, replace=True, random_state=42).reset_index(drop=True)
+    model = create_model(args.model)
+    grid = XGBOOST_GRID if args.model == 'xgboost' else SKLEARN_GRID
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        best_params, seconds = timed(notebook_retrain, cleaned, model, grid, work_dir)
+        print(f"notebook GridSearchCV        {seconds:8.1f} s   {best_params}")
+
+        for strategy in ('grid', 'halving'):
+            cache_dir = os.path.join(work_dir, f'cache_{strategy}')
+            for run in ('empty cache', 're-run'):
+                (_, report), seconds = timed(train_price_model, cleaned, 2023, model=model, grid=grid,
+                                             cache_dir=cache_dir, strategy=strategy)
+                print(f"{strategy + ', ' + run:<28} {seconds:8.1f} s   {report['best_params']}  "
+                      f"cv R² {report['cv_r2']:.3f}  test R² {report['test_r2']:.3f}  "
+                      f"{report['cache_misses']} trained, {report['cache_hits']} cached")
+
+
+if __name__ == '__main__':
+    main()